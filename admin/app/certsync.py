@@ -0,0 +1,138 @@
+"""
+Let's Encrypt certificate sync for native DoT/DoH in SmartDNS
+Следит за acme.json Traefik и выкладывает сертификат HOST_DOMAIN
+в smartdns/certs (как extract-cert.sh, но автоматически при продлении)
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CertSync:
+    """
+    Извлечение сертификата домена из acme.json с записью только при изменении
+
+    Отпечаток сертификата, с которым SmartDNS успешно перезапущен, хранится
+    в state_file: пока он не совпадает с файлами в cert_dir, применение
+    повторяется на каждой проверке (Docker недоступен, ошибка перезапуска,
+    смена лидера между записью файлов и применением).
+    """
+
+    def __init__(self, acme_file: str, domain: str, cert_dir: str, state_file: str,
+                 resolver: str = "letsencrypt", cert_name: str = "le-server"):
+        self.acme_file = acme_file
+        self.domain = domain
+        self.cert_dir = cert_dir
+        self.state_file = state_file
+        self.resolver = resolver
+        self.cert_file = os.path.join(cert_dir, f"{cert_name}.crt")
+        self.key_file = os.path.join(cert_dir, f"{cert_name}.key")
+        self._acme_mtime = None
+
+    def available(self) -> bool:
+        return os.path.isfile(self.cert_file) and os.path.isfile(self.key_file)
+
+    def fingerprint(self) -> Optional[str]:
+        """Отпечаток выложенных файлов сертификата"""
+        if not self.available():
+            return None
+        return hashlib.sha256(self._read(self.cert_file) + self._read(self.key_file)).hexdigest()
+
+    def applied(self) -> Optional[str]:
+        """Отпечаток сертификата, с которым SmartDNS последний раз успешно применен"""
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get("fingerprint")
+        except (OSError, ValueError):
+            return None
+
+    def mark_applied(self, fingerprint: str):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        self._write(self.state_file, json.dumps({"fingerprint": fingerprint}).encode("utf-8"), 0o644)
+
+    def pending(self) -> Optional[str]:
+        """Отпечаток выложенного, но еще не примененного сертификата"""
+        fingerprint = self.fingerprint()
+        if fingerprint is None or fingerprint == self.applied():
+            return None
+        return fingerprint
+
+    def extract(self) -> Optional[Tuple[bytes, bytes]]:
+        """(цепочка, ключ) из acme.json или None, если сертификата еще нет"""
+        try:
+            with open(self.acme_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot read {self.acme_file}: {e}")
+            return None
+
+        for entry in (data.get(self.resolver) or {}).get("Certificates") or []:
+            domain = entry.get("domain", {})
+            names = [domain.get("main", ""), *(domain.get("sans") or [])]
+            if self.domain in names and entry.get("certificate") and entry.get("key"):
+                return base64.b64decode(entry["certificate"]), base64.b64decode(entry["key"])
+        return None
+
+    def _read(self, path: str) -> bytes:
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return b""
+
+    def _write(self, path: str, content: bytes, mode: int):
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_file, path)
+
+    def sync(self) -> bool:
+        """True, если файлы сертификата изменились"""
+        try:
+            mtime = os.stat(self.acme_file).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._acme_mtime:
+            return False
+
+        extracted = self.extract()
+        if extracted is None:
+            logger.warning(f"No certificate for {self.domain} in {self.acme_file} yet")
+            return False
+        self._acme_mtime = mtime
+
+        cert, key = extracted
+        if cert == self._read(self.cert_file) and key == self._read(self.key_file):
+            return False
+
+        os.makedirs(self.cert_dir, exist_ok=True)
+        # Ключ первым: SmartDNS не должен увидеть новую цепочку со старым ключом после перезапуска
+        self._write(self.key_file, key, 0o600)
+        self._write(self.cert_file, cert, 0o644)
+        logger.info(f"Certificate for {self.domain} synced to {self.cert_dir}")
+        return True
+
+    async def run(self, on_change: Callable[[], Awaitable[bool]], interval: float = 60.0,
+                  enabled: Callable[[], bool] = lambda: True):
+        """
+        Периодическая проверка acme.json; on_change вызывается, пока выложенный
+        сертификат не применен, и возвращает False, если применение пропущено
+        """
+        while True:
+            if enabled():
+                try:
+                    await asyncio.to_thread(self.sync)
+                    fingerprint = await asyncio.to_thread(self.pending)
+                    if fingerprint is not None and await on_change():
+                        self.mark_applied(fingerprint)
+                except Exception as e:
+                    logger.error(f"Error applying synced certificate, will retry: {e}")
+            await asyncio.sleep(interval)
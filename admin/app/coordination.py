@@ -0,0 +1,344 @@
+"""
+Coordination primitives for running the admin with several uvicorn workers
+Межпроцессные блокировки, выбор лидера и локальный pub/sub через общий каталог
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """Межпроцессная блокировка через flock на файле в общем каталоге"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Захват блокировки; в неблокирующем режиме возвращает False если занято"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    async def __aenter__(self):
+        # Неблокирующие попытки вместо flock в потоке: при отмене ожидающей задачи
+        # (разрыв клиента, остановка) поток не захватит блокировку, которую некому отпустить
+        delay = 0.005
+        while not self.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class LeaderElection:
+    """Выбор лидера среди воркеров: лидер держит flock до завершения процесса"""
+
+    def __init__(self, path: str):
+        self._lock = FileLock(path)
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock.locked
+
+    def try_acquire(self) -> bool:
+        if self._lock.locked:
+            return True
+        if self._lock.acquire(blocking=False):
+            logger.info(f"Worker {os.getpid()} became leader")
+            return True
+        return False
+
+    async def run(self, interval: float = 5.0):
+        """Периодически пытаемся стать лидером (если прежний лидер завершился)"""
+        while not self.try_acquire():
+            await asyncio.sleep(interval)
+
+    def resign(self):
+        self._lock.release()
+
+
+class EventBus:
+    """
+    Локальный pub/sub между воркерами одного хоста
+
+    Каждый воркер слушает свой unix datagram сокет в общем каталоге,
+    публикация рассылает сообщение во все сокеты каталога, включая свой.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"events-{os.getpid()}.sock")
+        self._sock: Optional[socket.socket] = None
+        self._send_sock: Optional[socket.socket] = None
+        self._handler: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def started(self) -> bool:
+        return self._sock is not None
+
+    def start(self, handler: Callable[[Dict[str, Any]], Awaitable[None]]):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.setblocking(False)
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send_sock.setblocking(False)
+
+        self._handler = handler
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                message = json.loads(data)
+            except ValueError:
+                logger.warning("Dropping malformed event bus message")
+                continue
+            self._loop.create_task(self._handler(message))
+
+    def publish(self, message: Dict[str, Any]):
+        """Разослать сообщение всем воркерам"""
+        data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+
+        for name in names:
+            if not (name.startswith("events-") and name.endswith(".sock")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                self._send_sock.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Сокет завершившегося воркера
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                logger.warning(f"Event bus queue of {name} is full, message dropped")
+            except OSError as e:
+                logger.error(f"Error publishing event to {name}: {e}")
+
+    def close(self):
+        if self._sock is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        if self._send_sock is not None:
+            self._send_sock.close()
+            self._send_sock = None
+
+
+def process_token(pid: int) -> Optional[str]:
+    """
+    pid и время старта процесса из /proc: pid повторяются после перезапуска
+    контейнера, пара pid-starttime - нет; None если /proc недоступен
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Имя процесса в скобках может содержать пробелы; после него поля с 3-го, starttime - 22-е
+    fields = stat.rsplit(")", 1)[-1].split()
+    if len(fields) < 20:
+        return None
+    return f"{pid}-{fields[19]}"
+
+
+class SharedCounters:
+    """
+    Счетчики, суммируемые по всем воркерам
+
+    Каждый воркер ведет свои счетчики в памяти и не чаще раза в flush_interval
+    сбрасывает снимок в свой файл (ключ - pid и время старта процесса); чтение
+    суммирует снимки всех воркеров. Файлы завершившихся процессов при чтении
+    вливаются в общий файл retired и удаляются.
+    """
+
+    RETIRED = "retired"
+
+    def __init__(self, directory: str, name: str, flush_interval: float = 1.0):
+        self.directory = directory
+        self.name = name
+        self.flush_interval = flush_interval
+        self.values: Dict[str, int] = {}
+        self._last_flush = 0.0
+        self._dirty = False
+        self._pid: Optional[int] = None
+        self._token = ""
+
+    @property
+    def token(self) -> str:
+        # Объект может создаваться до fork воркеров: токен считается в текущем процессе
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._token = process_token(pid) or f"{pid}-t{time.time_ns()}"
+        return self._token
+
+    @property
+    def path(self) -> str:
+        return self._file(self.token)
+
+    def _file(self, token: str) -> str:
+        return os.path.join(self.directory, f"counters-{self.name}-{token}.json")
+
+    def increment(self, key: str, amount: int = 1):
+        self.values[key] = self.values.get(key, 0) + amount
+        self._dirty = True
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush(now)
+
+    def flush(self, now: Optional[float] = None):
+        self._last_flush = now if now is not None else time.monotonic()
+        self._dirty = False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Снимок: aggregate() вызывается из пула потоков, пока loop продолжает инкременты
+            self._write(self.path, dict(self.values))
+        except OSError as e:
+            logger.error(f"Error flushing counters {self.name}: {e}")
+
+    @staticmethod
+    def _write(path: str, values: Dict[str, int]):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(values, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, int]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def run(self):
+        """Фоновый сброс последних изменений, когда новых инкрементов нет"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def _tokens(self) -> List[str]:
+        prefix = f"counters-{self.name}-"
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [name[len(prefix):-len(".json")] for name in names
+                if name.startswith(prefix) and name.endswith(".json")]
+
+    def _is_gone(self, token: str) -> bool:
+        """Владелец файла завершился; файлы старого формата (только pid) тоже считаются осиротевшими"""
+        if token == self.RETIRED or token == self.token:
+            return False
+        pid, sep, started = token.partition("-")
+        if not sep or not pid.isdigit():
+            return True
+        if started.startswith("t"):
+            # Токен без /proc: проверить время старта нельзя, ориентируемся только на pid
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                pass
+            return False
+        return process_token(int(pid)) != token
+
+    def _retire(self, tokens: List[str]):
+        """Перенести снимки завершившихся процессов в retired и удалить их файлы"""
+        retired_path = self._file(self.RETIRED)
+        retired = self._read(retired_path) or {}
+        for token in tokens:
+            snapshot = self._read(self._file(token))
+            if snapshot is None:
+                continue
+            for key, value in snapshot.items():
+                retired[key] = retired.get(key, 0) + value
+        self._write(retired_path, retired)
+        for token in tokens:
+            try:
+                os.unlink(self._file(token))
+            except OSError:
+                pass
+        logger.info(f"Merged {len(tokens)} counters {self.name} files of exited workers")
+
+    def aggregate(self) -> Dict[str, int]:
+        """
+        Сумма по всем воркерам, включая завершившиеся (их итоги хранятся в retired)
+
+        Ждет flock и читает файлы: из async кода вызывать через asyncio.to_thread.
+        """
+        self.flush()
+        totals: Dict[str, int] = {}
+        # Под блокировкой: слияние в retired и чтение не должны пересекаться
+        with FileLock(os.path.join(self.directory, f"counters-{self.name}.lock")):
+            try:
+                gone = [token for token in self._tokens() if self._is_gone(token)]
+                if gone:
+                    self._retire(gone)
+            except OSError as e:
+                logger.error(f"Error merging counters {self.name}: {e}")
+
+            for token in self._tokens():
+                snapshot = self._read(self._file(token))
+                if snapshot is None:
+                    continue
+                for key, value in snapshot.items():
+                    totals[key] = totals.get(key, 0) + value
+        return totals
@@ -0,0 +1,148 @@
+"""
+Per-visit DNS check with nonce subdomains
+Каждое посещение получает уникальное имя <nonce>.<TEST_DOMAIN>, которое нельзя
+взять из кэша браузера или стаб-резолвера ОС
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import shutil
+import struct
+import time
+from typing import Optional, Set
+
+# Прозрачный GIF 1x1: ответ пробы отдается из памяти без шаблонов и файлов
+PROBE_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+PROBE_HEADERS = {
+    "Cache-Control": "no-cache, no-store, must-revalidate",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+
+def load_secret(path: str) -> bytes:
+    """Общий для всех воркеров ключ подписи nonce; создается первым воркером"""
+    env_secret = os.getenv("DNS_CHECK_SECRET")
+    if env_secret:
+        return env_secret.encode("utf-8")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+    except FileExistsError:
+        pass
+
+    with open(path, "rb") as f:
+        secret = f.read()
+    # Другой воркер мог еще не дописать ключ
+    while len(secret) < 32:
+        time.sleep(0.01)
+        with open(path, "rb") as f:
+            secret = f.read()
+    return secret
+
+
+class NonceIssuer:
+    """
+    Выдача и проверка nonce без общего состояния
+
+    nonce = base32(время выдачи | случайные байты | HMAC), поэтому любой воркер
+    проверяет его без обращения к хранилищу. Результат - валидная DNS-метка из 26 символов.
+    """
+
+    def __init__(self, secret: bytes, ttl: int = 120):
+        self.secret = secret
+        self.ttl = ttl
+
+    def _mac(self, payload: bytes) -> bytes:
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()[:6]
+
+    def issue(self, now: Optional[float] = None) -> str:
+        issued_at = int(now if now is not None else time.time())
+        payload = struct.pack(">I", issued_at & 0xFFFFFFFF) + secrets.token_bytes(6)
+        token = payload + self._mac(payload)
+        return base64.b32encode(token).decode("ascii").rstrip("=").lower()
+
+    def issued_at(self, nonce: str, now: Optional[float] = None) -> Optional[int]:
+        """Время выдачи действующего nonce; None для поддельного или истекшего"""
+        if len(nonce) != 26:
+            return None
+        try:
+            token = base64.b32decode(nonce.upper() + "======")
+        except (ValueError, TypeError):
+            return None
+
+        payload, mac = token[:10], token[10:]
+        if not hmac.compare_digest(mac, self._mac(payload)):
+            return None
+
+        issued_at = struct.unpack(">I", payload[:4])[0]
+        age = int(now if now is not None else time.time()) - issued_at
+        return issued_at if 0 <= age <= self.ttl else None
+
+    def verify(self, nonce: str, now: Optional[float] = None) -> bool:
+        return self.issued_at(nonce, now) is not None
+
+
+class NonceLedger:
+    """
+    Погашенные nonce, общие для всех воркеров
+
+    Успехом проверки считается только первая проба nonce: повторы в пределах ttl
+    (перезагрузка картинки, подделанные запросы) иначе раздували бы долю успешных.
+    Погашение - создание файла с O_EXCL в каталоге минуты выдачи; каталоги,
+    все nonce которых истекли, удаляются целиком.
+    """
+
+    BUCKET_SECONDS = 60
+
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+        self._buckets: Set[int] = set()
+
+    def consume(self, nonce: str, issued_at: int) -> bool:
+        """True, если этот вызов погасил nonce (первая проба)"""
+        bucket = issued_at // self.BUCKET_SECONDS
+        path = os.path.join(self.directory, str(bucket), nonce)
+        if bucket not in self._buckets:
+            # Новая минута в этом воркере: заодно убираем истекшие каталоги
+            self._buckets.add(bucket)
+            self.expire()
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+                return True
+            except FileExistsError:
+                return False
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        return False
+
+    def expire(self, now: Optional[float] = None):
+        now = now if now is not None else time.time()
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.isdigit() and (int(name) + 1) * self.BUCKET_SECONDS + self.ttl < now:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                self._buckets.discard(int(name))
+
+
+def extract_nonce(host: str, test_domain: str) -> Optional[str]:
+    """Достать nonce из Host заголовка вида <nonce>.<test_domain>[:port]"""
+    host = host.lower().split(":", 1)[0]
+    suffix = "." + test_domain
+    if not host.endswith(suffix):
+        return None
+    label = host[:-len(suffix)]
+    if not label or "." in label:
+        return None
+    return label
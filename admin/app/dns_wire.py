@@ -0,0 +1,245 @@
+"""
+Minimal DNS wire format helpers
+Сборка и разбор DNS сообщений и асинхронные запросы по UDP, TCP и TLS
+без внешних зависимостей
+"""
+
+import asyncio
+import ipaddress
+import random
+import ssl
+import struct
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+QTYPES = {"A": 1, "NS": 2, "CNAME": 5, "SOA": 6, "PTR": 12, "MX": 15, "TXT": 16, "AAAA": 28, "SVCB": 64, "HTTPS": 65}
+QTYPE_NAMES = {value: name for name, value in QTYPES.items()}
+
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_REFUSED = 5
+
+
+class Answer(NamedTuple):
+    name: str
+    qtype: int
+    ttl: int
+    data: str
+
+
+class Message(NamedTuple):
+    id: int
+    flags: int
+    rcode: int
+    truncated: bool
+    question: Optional[Tuple[str, int]]
+    answers: List[Answer]
+    authority: List[Answer]
+
+
+def qtype_code(qtype: Union[str, int]) -> int:
+    return qtype if isinstance(qtype, int) else QTYPES[qtype.upper()]
+
+
+def encode_name(name: str) -> bytes:
+    parts = []
+    for label in name.rstrip(".").split("."):
+        if label:
+            encoded = label.encode("idna") if not label.isascii() else label.encode("ascii")
+            parts.append(struct.pack("B", len(encoded)) + encoded)
+    return b"".join(parts) + b"\x00"
+
+
+def build_query(name: str, qtype: Union[str, int] = "A", qid: Optional[int] = None, recursion: bool = True) -> bytes:
+    """DNS запрос с одним вопросом класса IN"""
+    qid = random.getrandbits(16) if qid is None else qid
+    flags = 0x0100 if recursion else 0
+    header = struct.pack(">HHHHHH", qid, flags, 1, 0, 0, 0)
+    return header + encode_name(name) + struct.pack(">HH", qtype_code(qtype), 1)
+
+
+def _decode_name(data: bytes, offset: int) -> Tuple[str, int]:
+    labels = []
+    end_offset = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            pointer = struct.unpack(">H", data[offset:offset + 2])[0] & 0x3FFF
+            if end_offset is None:
+                end_offset = offset + 2
+            offset = pointer
+            jumps += 1
+            if jumps > 64:
+                raise ValueError("DNS name compression loop")
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    return ".".join(labels), end_offset if end_offset is not None else offset
+
+
+def _decode_rdata(data: bytes, offset: int, rtype: int, rdlength: int) -> str:
+    rdata = data[offset:offset + rdlength]
+    if rtype == 1 and rdlength == 4:
+        return str(ipaddress.IPv4Address(rdata))
+    if rtype == 28 and rdlength == 16:
+        return str(ipaddress.IPv6Address(rdata))
+    if rtype in (2, 5, 12):
+        return _decode_name(data, offset)[0]
+    return rdata.hex()
+
+
+def _parse_records(data: bytes, offset: int, count: int) -> Tuple[List[Answer], int]:
+    records = []
+    for _ in range(count):
+        name, offset = _decode_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack(">HHIH", data[offset:offset + 10])
+        offset += 10
+        records.append(Answer(name, rtype, ttl, _decode_rdata(data, offset, rtype, rdlength)))
+        offset += rdlength
+    return records, offset
+
+
+def parse_message(data: bytes) -> Message:
+    """Разбор заголовка, вопроса, ответов и authority секции"""
+    if len(data) < 12:
+        raise ValueError("DNS message too short")
+    qid, flags, qdcount, ancount, nscount, _ = struct.unpack(">HHHHHH", data[:12])
+    offset = 12
+    question = None
+    for _ in range(qdcount):
+        qname, offset = _decode_name(data, offset)
+        qtype, _ = struct.unpack(">HH", data[offset:offset + 4])
+        offset += 4
+        question = (qname, qtype)
+
+    truncated = bool(flags & 0x0200)
+    answers: List[Answer] = []
+    authority: List[Answer] = []
+    if not truncated:
+        answers, offset = _parse_records(data, offset, ancount)
+        authority, offset = _parse_records(data, offset, nscount)
+    return Message(qid, flags, flags & 0x000F, truncated, question, answers, authority)
+
+
+def build_response(query: bytes, answers: List[Tuple[int, int, bytes]] = (), rcode: int = RCODE_NOERROR,
+                   truncated: bool = False) -> bytes:
+    """
+    Ответ на запрос: копируем ID и вопрос, добавляем записи (qtype, ttl, rdata).
+    Имя в ответах сжато ссылкой на вопрос.
+    """
+    qid, qflags = struct.unpack(">HH", query[:4])
+    question_end = 12
+    while query[question_end] != 0:
+        question_end += query[question_end] + 1
+    question = query[12:question_end + 5]
+
+    flags = 0x8000 | (qflags & 0x0100) | 0x0080 | (rcode & 0x000F)
+    if truncated:
+        flags |= 0x0200
+        answers = []
+    header = struct.pack(">HHHHHH", qid, flags, 1, len(answers), 0, 0)
+    records = b"".join(
+        struct.pack(">HHHIH", 0xC00C, rtype, 1, ttl, len(rdata)) + rdata
+        for rtype, ttl, rdata in answers
+    )
+    return header + question + records
+
+
+def frame_tcp(message: bytes) -> bytes:
+    """Префикс длины для DNS поверх TCP/TLS"""
+    return struct.pack(">H", len(message)) + message
+
+
+async def read_tcp_message(reader: asyncio.StreamReader) -> bytes:
+    length = struct.unpack(">H", await reader.readexactly(2))[0]
+    return await reader.readexactly(length)
+
+
+class _UDPQueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+async def query_udp(host: str, port: int, message: bytes, timeout: float = 2.0,
+                    local_addr: Optional[Tuple[str, int]] = None) -> bytes:
+    """Один запрос по UDP; таймаут поднимает asyncio.TimeoutError"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _UDPQueryProtocol(future), remote_addr=(host, port), local_addr=local_addr
+    )
+    try:
+        transport.sendto(message)
+        return await asyncio.wait_for(future, timeout)
+    finally:
+        transport.close()
+
+
+def insecure_tls_context(alpn: Optional[List[str]] = None) -> ssl.SSLContext:
+    """TLS контекст без проверки сертификата: для замеров и локальных стендов"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    if alpn:
+        context.set_alpn_protocols(alpn)
+    return context
+
+
+async def open_stream(host: str, port: int, tls: Optional[ssl.SSLContext] = None, server_name: Optional[str] = None,
+                      timeout: float = 3.0) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """TCP или TLS соединение (для DoT и DoH)"""
+    return await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=tls, server_hostname=server_name if tls else None),
+        timeout
+    )
+
+
+async def query_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, message: bytes,
+                       timeout: float = 2.0) -> bytes:
+    """Запрос по уже открытому TCP/TLS соединению"""
+    writer.write(frame_tcp(message))
+    await writer.drain()
+    return await asyncio.wait_for(read_tcp_message(reader), timeout)
+
+
+async def query_doh(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str,
+                    message: bytes, timeout: float = 2.0) -> bytes:
+    """DoH POST по открытому HTTP/1.1 keep-alive соединению"""
+    request = (
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/dns-message\r\n"
+        f"Accept: application/dns-message\r\nContent-Length: {len(message)}\r\n\r\n"
+    ).encode("ascii") + message
+    writer.write(request)
+    await writer.drain()
+
+    async def read_response() -> bytes:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("DoH connection closed")
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value.strip())
+        body = await reader.readexactly(length)
+        if status != 200:
+            raise ConnectionError(f"DoH HTTP status {status}")
+        return body
+
+    return await asyncio.wait_for(read_response(), timeout)
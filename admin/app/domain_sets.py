@@ -0,0 +1,87 @@
+"""
+Block lists as SmartDNS domain-set files
+Большие списки (реклама, телеметрия) не раздувают domains.json и конфиг:
+одна строка domain-set и одно правило address на весь список
+"""
+
+import logging
+import os
+import re
+from typing import Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SET_NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+DOMAIN_PATTERN = re.compile(
+    r'^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$'
+)
+# Адреса-заглушки в hosts-файлах: "0.0.0.0 ads.example.com"
+HOSTS_ADDRESSES = {"0.0.0.0", "127.0.0.1", "::", "::1"}
+
+
+def is_valid_set_name(name: str) -> bool:
+    return bool(SET_NAME_PATTERN.match(name))
+
+
+def parse_domain_list(lines: Iterable[str]) -> Tuple[List[str], int]:
+    """
+    Имена из списка: по одному в строке, формат hosts или adblock (||name^).
+    Возвращает уникальные имена в исходном порядке и число пропущенных строк.
+    """
+    names, skipped = {}, 0
+    for raw in lines:
+        line = raw.split("#", 1)[0].strip().lower()
+        if not line or line.startswith("!"):
+            continue
+        parts = line.split()
+        if len(parts) > 1 and parts[0] in HOSTS_ADDRESSES:
+            line = parts[1]
+        elif len(parts) > 1:
+            skipped += 1
+            continue
+        line = line.removeprefix("||").removesuffix("^").removeprefix("*.").rstrip(".")
+        if len(line) <= 253 and DOMAIN_PATTERN.match(line):
+            names[line] = None
+        else:
+            skipped += 1
+    return list(names), skipped
+
+
+def block_rules(pattern: str, mode: str) -> List[str]:
+    """address правила блокировки для /name/ или /domain-set:name/"""
+    if mode == "null":
+        return [f"address {pattern}0.0.0.0", f"address {pattern}::"]
+    return [f"address {pattern}#"]
+
+
+class DomainSetStore:
+    """Файлы domain-set в каталоге, смонтированном в SmartDNS"""
+
+    def __init__(self, directory: str, smartdns_directory: str):
+        self.directory = directory
+        self.smartdns_directory = smartdns_directory
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.conf")
+
+    def write(self, name: str, names: List[str]):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_file = f"{self.path(name)}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(names))
+            f.write("\n")
+        os.replace(tmp_file, self.path(name))
+        logger.info(f"Domain set '{name}' written with {len(names)} names")
+
+    def read(self, name: str) -> List[str]:
+        with open(self.path(name), 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def remove(self, name: str):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def config_line(self, name: str) -> str:
+        return f"domain-set -name {name} -file {self.smartdns_directory}/{name}.conf"
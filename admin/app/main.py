@@ -1,24 +1,45 @@
 from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import json
 import asyncio
 import docker
+import hashlib
+import ipaddress
 import os
 import re
 import socket
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 import logging
 from app.mobileconfig_generator import generate_universal_profile, generate_dot_profile, MobileConfigGenerator
+from app.coordination import FileLock, LeaderElection, EventBus, SharedCounters
+from app.page_cache import PageCache, StaticAssets
+from app.upstreams import UpstreamManager
+from app.warmup import CacheWarmer
+from app.query_log import LogTailer, QueryStats
+from app.related_domains import CoQueryAnalyzer
+from app.stream_log import StreamStats, domain_report, render_log_directives
+from app.certsync import CertSync
+from app.nftables import load_counters, render_ruleset
+from app.quicproxy import parse_duration, render_config as render_quic_config
+from app.domain_sets import DomainSetStore, block_rules, is_valid_set_name, parse_domain_list
+from app.dns_check import NonceIssuer, NonceLedger, PROBE_GIF, PROBE_HEADERS, extract_nonce, load_secret
 
 # Читаем переменные окружения
 HOST_DOMAIN = os.getenv('HOST_DOMAIN', 'dns.uzicus.ru')
 SERVER_IP = os.getenv('SERVER_IP', '185.237.95.211')
+SERVER_IPV6 = os.getenv('SERVER_IPV6', '')
 TEST_SUBDOMAIN = os.getenv('TEST_SUBDOMAIN', 'test')
 DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'info').upper()
+DATA_DIR = os.getenv('DATA_DIR', '/data')
+DOCKER_RETRY_INTERVAL = float(os.getenv('DOCKER_RETRY_INTERVAL', '5'))
+# Общий каталог для координации воркеров (блокировки, лидер, сокеты событий)
+RUN_DIR = os.getenv('RUN_DIR', os.path.join(DATA_DIR, 'run'))
 
 # Настройка логирования
 logging.basicConfig(
@@ -32,6 +53,70 @@ logger.info(f"Ninja DNS Admin starting with HOST_DOMAIN={HOST_DOMAIN}, SERVER_IP
 
 # Формируем полное имя тестового домена
 TEST_DOMAIN = f"{TEST_SUBDOMAIN}.{HOST_DOMAIN}"
+DNS_CHECK_NONCE_TTL = int(os.getenv('DNS_CHECK_NONCE_TTL', '120'))
+# Сертификат *.TEST_DOMAIN есть только при DNS-01 challenge: без него HTTPS страница не может проверить DNS
+DNS_CHECK_WILDCARD_TLS = bool(os.getenv('ACME_DNS_PROVIDER', '').strip())
+UPSTREAM_PROBE_INTERVAL = float(os.getenv('UPSTREAM_PROBE_INTERVAL', '600'))
+UPSTREAM_AUTO_APPLY = os.getenv('UPSTREAM_AUTO_APPLY', 'false').lower() == 'true'
+# Отдельный порт SmartDNS без address-правил: через него sniproxy резолвит реальные бэкенды
+SNIPROXY_RESOLVER_PORT = int(os.getenv('SNIPROXY_RESOLVER_PORT', '5353'))
+SNIPROXY_RESOLVER = os.getenv('SNIPROXY_RESOLVER', f'smartdns:{SNIPROXY_RESOLVER_PORT}')
+# Число воркеров nginx (0 - worker_processes auto) и ожидаемые одновременные соединения на домен
+SNIPROXY_WORKER_PROCESSES = int(os.getenv('SNIPROXY_WORKER_PROCESSES', '0'))
+# CPU контейнера sniproxy для расчета worker_connections при auto (0 - неизвестно, считаем как для одного)
+SNIPROXY_CPUS = int(os.getenv('SNIPROXY_CPUS', '0'))
+SNIPROXY_CONNECTIONS_PER_DOMAIN = int(os.getenv('SNIPROXY_CONNECTIONS_PER_DOMAIN', '256'))
+# Ключи map по SNI: regex (~*name, перебор по порядку) или hostnames (.name, хэш-поиск)
+SNIPROXY_MAP_LAYOUT = os.getenv('SNIPROXY_MAP_LAYOUT', 'regex').lower()
+# Stream-лог sniproxy для нагрузки по доменам: доля записываемых соединений в процентах,
+# буфер nginx, порог ротации и через сколько дней без соединений домен считается неиспользуемым
+SNIPROXY_STREAM_LOG = os.getenv('SNIPROXY_STREAM_LOG', 'false').lower() == 'true'
+SNIPROXY_STREAM_LOG_SAMPLE = float(os.getenv('SNIPROXY_STREAM_LOG_SAMPLE', '100'))
+SNIPROXY_STREAM_LOG_BUFFER = os.getenv('SNIPROXY_STREAM_LOG_BUFFER', '64k')
+SNIPROXY_STREAM_LOG_FLUSH = os.getenv('SNIPROXY_STREAM_LOG_FLUSH', '5s')
+SNIPROXY_STREAM_LOG_MAX_MB = float(os.getenv('SNIPROXY_STREAM_LOG_MAX_MB', '16'))
+SNIPROXY_STREAM_LOG_INTERVAL = float(os.getenv('SNIPROXY_STREAM_LOG_INTERVAL', '10'))
+SNIPROXY_UNUSED_DAYS = float(os.getenv('SNIPROXY_UNUSED_DAYS', '7'))
+# QUIC (UDP 443) forwarder рядом с sniproxy; при включенном h3 попадает в наши HTTPS записи
+QUIC_PROXY_ENABLED = os.getenv('QUIC_PROXY_ENABLED', 'true').lower() == 'true'
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_NAMES = [n.strip() for n in os.getenv('WARMUP_NAMES', '').split(',') if n.strip()]
+# Сколько самых частых имен из audit-лога добавлять к прогреву (0 - не добавлять)
+WARMUP_TOP_NAMES = int(os.getenv('WARMUP_TOP_NAMES', '200'))
+WARMUP_TOP_INTERVAL = 60.0
+# Audit-лог SmartDNS (каждый запрос) и его разбор в админке; 0 в интервале отключает разбор
+QUERY_LOG_ENABLED = os.getenv('QUERY_LOG_ENABLED', 'false').lower() == 'true'
+QUERY_LOG_SIZE = os.getenv('QUERY_LOG_SIZE', '4M')
+QUERY_LOG_INTERVAL = float(os.getenv('QUERY_LOG_INTERVAL', '2'))
+QUERY_LOG_TOP_N = int(os.getenv('QUERY_LOG_TOP_N', '20'))
+# Подсказки связанных доменов из того же audit-лога: минимум совместных запросов и доля
+# запросов кандидата рядом с перехваченным доменом; пересчет раз в RELATED_INTERVAL секунд
+RELATED_DOMAINS_ENABLED = os.getenv('RELATED_DOMAINS_ENABLED', 'true').lower() == 'true'
+RELATED_MIN_COUNT = int(os.getenv('RELATED_MIN_COUNT', '3'))
+RELATED_MIN_SHARE = float(os.getenv('RELATED_MIN_SHARE', '0.3'))
+RELATED_INTERVAL = float(os.getenv('RELATED_INTERVAL', '30'))
+# traefik: DoT/DoH терминируются в Traefik (DoH через doh-proxy); native: bind-tls/bind-https в самом SmartDNS,
+# DoT идет через Traefik без расшифровки, DoH Traefik терминирует и шлет в bind-https (без doh-proxy)
+DNS_TLS_MODE = os.getenv('DNS_TLS_MODE', 'traefik').lower()
+ACME_FILE = os.getenv('ACME_FILE', '/letsencrypt/acme.json')
+CERT_SYNC_INTERVAL = float(os.getenv('CERT_SYNC_INTERVAL', '60'))
+NATIVE_DOT_PORT = int(os.getenv('NATIVE_DOT_PORT', '853'))
+NATIVE_DOH_PORT = int(os.getenv('NATIVE_DOH_PORT', '8053'))
+# Порты DNS на хосте (публикация в docker-compose) и порт SmartDNS за DoT роутером Traefik
+DNS_PORT = int(os.getenv('DNS_PORT', '53'))
+DOT_PORT = int(os.getenv('DOT_PORT', '853'))
+DOT_BACKEND_PORT = int(os.getenv('DOT_BACKEND_PORT', '53'))
+# Порты под allow-list и лимитом nftables; в native еще bind-tls/bind-https SmartDNS
+ACL_PORTS = sorted({DNS_PORT, DOT_PORT, DOT_BACKEND_PORT,
+                    *((NATIVE_DOT_PORT, NATIVE_DOH_PORT) if DNS_TLS_MODE == "native" else ())})
+# Сети без ACL и лимитов: loopback хоста и пулы адресов docker по умолчанию (Traefik, sniproxy,
+# прогрев из админки). Частные 10.0.0.0/8 и 192.168.0.0/16 сюда не входят: LAN или VPC хоста
+# обходят защиту, только если явно перечислить их в ACL_INTERNAL_NETWORKS
+ACL_INTERNAL_NETWORKS = [n.strip() for n in os.getenv(
+    'ACL_INTERNAL_NETWORKS', '127.0.0.1/32,::1/128,172.16.0.0/12'
+).split(',') if n.strip()]
+# Каталог сертификатов внутри контейнера smartdns
+SMARTDNS_CERT_DIR = '/etc/smartdns/certs'
 
 def get_client_ip(request: Request) -> str:
     """Получить реальный IP клиента"""
@@ -47,23 +132,251 @@ def get_client_ip(request: Request) -> str:
     # Fallback на прямое соединение
     return request.client.host if request.client else "unknown"
 
-app = FastAPI(title="Ninja DNS Admin", description="DNS Domain Management Interface")
+# Фоновые задачи воркера, запущенные обработчиками (прогрев кэша после применения)
+background_tasks: Dict[str, Optional[asyncio.Task]] = {"warmup": None}
+
+# Состояние готовности процесса: заполняется фоновой инициализацией в lifespan
+readiness: Dict[str, Any] = {
+    "docker": False,
+    "docker_error": None,
+    "started_at": None,
+    "ready_at": None,
+}
+
+async def initialize_docker():
+    """Фоновое подключение к Docker с повторными попытками"""
+    while not readiness["docker"]:
+        ok, error = await asyncio.to_thread(domain_manager.connect_docker)
+        readiness["docker"] = ok
+        readiness["docker_error"] = error
+        if ok:
+            readiness["ready_at"] = time.monotonic()
+            logger.info(
+                f"Docker connected in {readiness['ready_at'] - readiness['started_at']:.3f}s after startup"
+            )
+            break
+        await asyncio.sleep(DOCKER_RETRY_INTERVAL)
+
+async def upstream_probe_loop():
+    """Замер апстримов выполняет только лидер; остальные читают общий файл состояния"""
+    while True:
+        if leader_election.is_leader:
+            previous = upstream_manager.load_state().get("selected")
+            try:
+                state = await upstream_manager.probe_all()
+            except Exception as e:
+                logger.error(f"Error probing upstreams: {e}")
+                state = None
+            if UPSTREAM_AUTO_APPLY and state and state["selected"] != previous and readiness["docker"]:
+                try:
+                    async with config_lock():
+                        await apply_configs()
+                    logger.info("SmartDNS config re-applied with new upstream selection")
+                except Exception as e:
+                    logger.error(f"Error applying upstream selection: {e}")
+        await asyncio.sleep(UPSTREAM_PROBE_INTERVAL)
+
+async def query_log_loop():
+    """
+    Audit-лог читает только лидер: снимок статистики уходит в run/query-stats.json
+    для API всех воркеров и рассылается клиентам /ws
+    """
+    domains_version = None
+    related_at = time.monotonic()
+    hot_names_at = 0.0
+    while True:
+        await asyncio.sleep(QUERY_LOG_INTERVAL)
+        if not leader_election.is_leader:
+            continue
+        try:
+            version = config_version()
+            if version != domains_version:
+                domains_version = version
+                domains = domain_manager.load_domains()
+                query_stats.set_domains(d["name"] for d in domains.get("domains", []) if d.get("enabled", True))
+                query_stats.hijack_ips = {ip for ip in (domains.get("server_ip", SERVER_IP), SERVER_IPV6) if ip}
+            # Разбор строк в потоке: при высоком QPS опрос не блокирует event loop
+            await asyncio.to_thread(query_stats.poll)
+            snapshot = query_stats.snapshot(QUERY_LOG_TOP_N)
+            if related_domains is not None and time.monotonic() - related_at >= RELATED_INTERVAL:
+                related_at = time.monotonic()
+                suggestions = await asyncio.to_thread(
+                    related_domains.suggestions, RELATED_MIN_COUNT, RELATED_MIN_SHARE, 200
+                )
+                save_run_state("related-domains.json", {"updated": time.time(), "suggestions": suggestions})
+            if WARMUP_ENABLED and WARMUP_TOP_NAMES > 0 and time.monotonic() - hot_names_at >= WARMUP_TOP_INTERVAL:
+                # Популярные имена для прогрева: читать их нужно любому воркеру, применяющему конфиг
+                hot_names_at = time.monotonic()
+                top = query_stats.top("other", WARMUP_TOP_NAMES) + query_stats.top("hijacked", WARMUP_TOP_NAMES)
+                top.sort(key=lambda entry: -entry["count"])
+                save_run_state("warmup-top-names.json", {
+                    "updated": time.time(), "names": [entry["name"] for entry in top[:WARMUP_TOP_NAMES]]
+                })
+        except Exception as e:
+            logger.error(f"Error reading query log: {e}")
+            continue
+        save_run_state("query-stats.json", snapshot)
+        await manager.broadcast({"type": "query_stats", "stats": snapshot})
+
+def load_stream_stats() -> Dict[str, Any]:
+    try:
+        with open(SNIPROXY_STREAM_STATS, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_stream_stats(state: Dict[str, Any]):
+    """Счетчики sniproxy в смонтированном каталоге: переживают пересоздание контейнера"""
+    tmp_file = f"{SNIPROXY_STREAM_STATS}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, SNIPROXY_STREAM_STATS)
+
+def stream_summary(state: Dict[str, Any], top_n: int = 10) -> Dict[str, Any]:
+    """Короткая сводка для /ws; полный список по доменам - GET /api/sniproxy/stats"""
+    report = domain_report(state, SNIPROXY_UNUSED_DAYS * 86400)
+    return {
+        "updated": state.get("updated"),
+        "sample_percent": state.get("sample_percent"),
+        "connections": sum(d["connections"] for d in report),
+        "bytes": sum(d["bytes_in"] + d["bytes_out"] for d in report),
+        "unused": sum(1 for d in report if d["unused"]),
+        "top": report[:top_n],
+    }
+
+async def stream_log_loop():
+    """
+    Stream-лог sniproxy читает только лидер: счетчики по доменам сохраняются
+    в sniproxy/stream-stats.json, сводка рассылается клиентам /ws
+    """
+    domains_version = None
+    restored = False
+    while True:
+        await asyncio.sleep(SNIPROXY_STREAM_LOG_INTERVAL)
+        if not leader_election.is_leader:
+            restored = False
+            continue
+        try:
+            version = config_version()
+            if version != domains_version or not restored:
+                domains_version = version
+                domains, _, _ = domain_manager.proxied_domains(domain_manager.load_domains())
+                stream_stats.set_domains(d["name"] for d in domains)
+            if not restored:
+                # Новый лидер продолжает счетчики предыдущего
+                stream_stats.restore(load_stream_stats())
+                restored = True
+            await asyncio.to_thread(stream_stats.poll)
+
+            # nginx сам не ротирует: переименовываем и просим переоткрыть лог, хвост дочитает tailer
+            try:
+                size = os.path.getsize(SNIPROXY_STREAM_LOG_FILE)
+            except OSError:
+                size = 0
+            if size > SNIPROXY_STREAM_LOG_MAX_MB * 1024 * 1024 and readiness["docker"]:
+                os.replace(SNIPROXY_STREAM_LOG_FILE, f"{SNIPROXY_STREAM_LOG_FILE}.1")
+                await asyncio.to_thread(domain_manager.reopen_sniproxy_logs)
+
+            state = stream_stats.state()
+            await asyncio.to_thread(save_stream_stats, state)
+        except Exception as e:
+            logger.error(f"Error reading sniproxy stream log: {e}")
+            continue
+        await manager.broadcast({"type": "stream_stats", "summary": stream_summary(state)})
+
+async def apply_certificate() -> bool:
+    """
+    Новый сертификат (или первый): полное применение конфигурации с перезапуском SmartDNS;
+    False, пока Docker недоступен - cert_sync повторит на следующей проверке
+    """
+    if not readiness["docker"]:
+        return False
+    async with config_lock():
+        await apply_configs()
+    logger.info("SmartDNS restarted with synced certificate")
+    return True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Создание ресурсов после старта сервера, чтобы /healthz отвечал сразу"""
+    readiness["started_at"] = time.monotonic()
+    docker_task = asyncio.create_task(initialize_docker())
+    leader_task = asyncio.create_task(leader_election.run())
+    counters_task = asyncio.create_task(dns_check_counters.run())
+    upstream_task = asyncio.create_task(upstream_probe_loop()) if UPSTREAM_PROBE_INTERVAL > 0 else None
+    query_log_task = asyncio.create_task(query_log_loop()) if QUERY_LOG_ENABLED and QUERY_LOG_INTERVAL > 0 else None
+    stream_log_task = asyncio.create_task(stream_log_loop()) if SNIPROXY_STREAM_LOG else None
+    cert_task = asyncio.create_task(
+        cert_sync.run(apply_certificate, CERT_SYNC_INTERVAL, enabled=lambda: leader_election.is_leader)
+    ) if DNS_TLS_MODE == "native" else None
+    try:
+        event_bus.start(manager.broadcast_local)
+    except OSError as e:
+        logger.error(f"Event bus unavailable, broadcasts stay local to worker {os.getpid()}: {e}")
+    try:
+        yield
+    finally:
+        docker_task.cancel()
+        leader_task.cancel()
+        counters_task.cancel()
+        if upstream_task:
+            upstream_task.cancel()
+        if query_log_task:
+            query_log_task.cancel()
+        if stream_log_task:
+            stream_log_task.cancel()
+        if cert_task:
+            cert_task.cancel()
+        for task in background_tasks.values():
+            if task is not None:
+                task.cancel()
+        dns_check_counters.flush()
+        event_bus.close()
+        leader_election.resign()
+        query_stats.close()
+        stream_stats.close()
+        domain_manager.close()
+
+app = FastAPI(title="Ninja DNS Admin", description="DNS Domain Management Interface", lifespan=lifespan)
 
 # Добавляем CORS middleware с ограничениями
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[f"https://{HOST_DOMAIN}"],  # Только наш домен
     allow_credentials=True,
-    allow_methods=["GET", "POST", "DELETE"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
 
 templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+static_assets = StaticAssets("static")
 
-DOMAINS_FILE = "/data/domains.json"
-SMARTDNS_CONFIG = "/data/smartdns/smartdns.conf"
-SNIPROXY_CONFIG = "/data/sniproxy/nginx.conf"
+DOMAINS_FILE = os.path.join(DATA_DIR, "domains.json")
+SMARTDNS_CONFIG = os.path.join(DATA_DIR, "smartdns", "smartdns.conf")
+SNIPROXY_CONFIG = os.path.join(DATA_DIR, "sniproxy", "nginx.conf")
+UPSTREAMS_STATE = os.path.join(DATA_DIR, "smartdns", "upstreams.json")
+WARMUP_NAMES_FILE = os.path.join(DATA_DIR, "smartdns", "warmup-names.txt")
+# Каталог логов SmartDNS: ./smartdns/log смонтирован в /var/log/smartdns контейнера smartdns
+QUERY_LOG_FILE = os.path.join(DATA_DIR, "smartdns", "log", "smartdns-audit.log")
+RELATED_DISMISSED_FILE = os.path.join(DATA_DIR, "smartdns", "related-dismissed.json")
+SMARTDNS_AUDIT_FILE = '/var/log/smartdns/smartdns-audit.log'
+SMARTDNS_CERTS = os.path.join(DATA_DIR, "smartdns", "certs")
+# Отпечаток примененного сертификата рядом с самими файлами: RUN_DIR может быть tmpfs
+CERT_SYNC_STATE = os.path.join(DATA_DIR, "smartdns", "certificate.json")
+DOMAIN_SETS_DIR = os.path.join(DATA_DIR, "smartdns", "domain-sets")
+# Общие правила для групп клиентов: ./smartdns/conf.d смонтирован в /etc/smartdns/conf.d
+SMARTDNS_SHARED_RULES = os.path.join(DATA_DIR, "smartdns", "conf.d", "shared-rules.conf")
+SMARTDNS_SHARED_RULES_FILE = '/etc/smartdns/conf.d/shared-rules.conf'
+NFT_RULESET = os.path.join(DATA_DIR, "smartdns", "ninja-dns.nft")
+NFT_COUNTERS = os.path.join(DATA_DIR, "smartdns", "nft-counters.json")
+QUIC_CONFIG = os.path.join(DATA_DIR, "sniproxy", "quicproxy.json")
+QUIC_STATS = os.path.join(DATA_DIR, "sniproxy", "quicproxy-stats.json")
+# ./sniproxy/log смонтирован в /var/log/sniproxy контейнера sniproxy
+SNIPROXY_STREAM_LOG_FILE = os.path.join(DATA_DIR, "sniproxy", "log", "stream.log")
+SNIPROXY_STREAM_STATS = os.path.join(DATA_DIR, "sniproxy", "stream-stats.json")
+SNIPROXY_LOG_DIRECTIVES = render_log_directives(
+    '/var/log/sniproxy/stream.log', SNIPROXY_STREAM_LOG_SAMPLE, SNIPROXY_STREAM_LOG_BUFFER, SNIPROXY_STREAM_LOG_FLUSH
+)
 
 class DomainValidator:
     """Класс для валидации доменов"""
@@ -179,9 +492,156 @@ class DomainValidator:
         result["valid"] = True
         return result
 
+# Настройки домена, которые можно задать у домена или унаследовать от категории
+DOMAIN_SETTINGS = {
+    # redirect - на server_ip через sniproxy; block - ответ без апстрима; passthrough - реальный ответ
+    "action": {"choices": ("redirect", "block", "passthrough"), "default": "redirect"},
+    # Ответ при блокировке: SOA (пустой ответ) или 0.0.0.0/::
+    "block_mode": {"choices": ("soa", "null"), "default": "soa"},
+    # AAAA для перехваченных доменов: SOA (нет IPv6), наш AAAA или реальный ответ
+    "ipv6_policy": {"choices": ("soa", "own", "passthrough"), "default": "soa"},
+    # HTTPS/SVCB (type 65): SOA, наша запись (h3 только с QUIC forwarder) или реальный ответ
+    "https_policy": {"choices": ("soa", "own", "passthrough"), "default": "soa"},
+    # TTL наших ответов в секундах; None - глобальные rr-ttl/rr-ttl-min
+    "ttl": {"range": (60, 604800), "default": None},
+}
+
+def domain_setting(domain: Dict[str, Any], domains_data: Dict[str, Any], key: str):
+    """Значение настройки: домен, затем его категория, затем значение по умолчанию"""
+    if key in domain:
+        return domain[key]
+    category = domains_data.get("categories", {}).get(domain.get("category", "misc"), {})
+    return category.get(key, DOMAIN_SETTINGS[key]["default"])
+
+def domain_in_group(domain: Dict[str, Any], group_name: Optional[str]) -> bool:
+    """Домен без "groups" действует для всех клиентов, с "groups" - только для перечисленных групп"""
+    groups = domain.get("groups")
+    return not groups or (group_name is not None and group_name in groups)
+
+# Профиль sniproxy по умолчанию (прежние глобальные значения); limit_conn 0 - без ограничения
+DEFAULT_PROXY_PROFILE = {
+    "proxy_timeout": "10s",
+    "proxy_connect_timeout": "5s",
+    "proxy_buffer_size": "16k",
+    "limit_conn": 0,
+}
+# Встроенные профили категорий: долгие соединения чатов/websocket и потоковое видео
+CATEGORY_PROXY_PROFILES = {
+    "ai": {"proxy_timeout": "1h"},
+    "social": {"proxy_timeout": "1h"},
+    "streaming": {"proxy_timeout": "10m", "proxy_buffer_size": "64k"},
+    "video": {"proxy_timeout": "10m", "proxy_buffer_size": "64k"},
+}
+PROXY_DURATION_PATTERN = re.compile(r'^[1-9][0-9]*(ms|s|m|h)$')
+PROXY_SIZE_PATTERN = re.compile(r'^[1-9][0-9]*[km]?$')
+
+def proxy_size_bytes(value: str) -> int:
+    """Размер в формате nginx (16k, 1m) в байтах"""
+    units = {"k": 1024, "m": 1024 * 1024}
+    return int(value[:-1]) * units[value[-1]] if value[-1] in units else int(value)
+
+def proxy_profile(domains_data: Dict[str, Any], category: str) -> Dict[str, Any]:
+    """Профиль категории: значения по умолчанию, встроенный профиль, затем "proxy" из настроек категории"""
+    configured = domains_data.get("categories", {}).get(category, {}).get("proxy", {})
+    return {**DEFAULT_PROXY_PROFILE, **CATEGORY_PROXY_PROFILES.get(category, {}), **configured}
+
+def merge_proxy_profiles(profiles: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Один профиль на все: самые долгие таймауты и самый большой буфер, чтобы не обрезать
+    то, что разрешает любой из профилей. limit_conn не сливается - берется у первого
+    """
+    return {
+        "proxy_timeout": max((profile["proxy_timeout"] for profile in profiles), key=parse_duration),
+        "proxy_connect_timeout": max((profile["proxy_connect_timeout"] for profile in profiles), key=parse_duration),
+        "proxy_buffer_size": max((profile["proxy_buffer_size"] for profile in profiles), key=proxy_size_bytes),
+        "limit_conn": profiles[0]["limit_conn"],
+    }
+
+def validate_proxy_profile(data: Any) -> Dict[str, Any]:
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Field 'proxy' must be an object")
+    profile = {}
+    for key, value in data.items():
+        if key in ("proxy_timeout", "proxy_connect_timeout"):
+            valid = isinstance(value, str) and PROXY_DURATION_PATTERN.match(value)
+        elif key == "proxy_buffer_size":
+            valid = isinstance(value, str) and PROXY_SIZE_PATTERN.match(value.lower())
+        elif key == "limit_conn":
+            valid = isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 100000
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown proxy setting '{key}'")
+        if not valid:
+            raise HTTPException(status_code=400, detail=f"Invalid proxy setting {key}='{value}'")
+        profile[key] = value.lower() if key == "proxy_buffer_size" else value
+    return profile
+
+# Запросов в секунду с одного адреса; всплеск - в пакетах
+ACL_DEFAULT_RATE_LIMIT = {"qps": 50, "burst": 100}
+
+GROUP_NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+
+def validate_domain_groups(data: Dict[str, Any], domains_data: Dict[str, Any]) -> Optional[List[str]]:
+    """Список групп домена из тела запроса; группы должны существовать"""
+    groups = data.get("groups")
+    if groups is None:
+        return None
+    if not isinstance(groups, list) or not all(isinstance(g, str) for g in groups):
+        raise HTTPException(status_code=400, detail="Field 'groups' must be a list of group names")
+    unknown = [g for g in groups if g not in domains_data.get("groups", {})]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown groups: {', '.join(unknown)}")
+    return list(dict.fromkeys(groups))
+
+def validate_domain_settings(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверка и выборка настроек из тела запроса"""
+    settings = {}
+    for key, spec in DOMAIN_SETTINGS.items():
+        if key not in data or data[key] is None:
+            continue
+        value = data[key]
+        if "choices" in spec and value not in spec["choices"]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid {key} '{value}', expected one of: {', '.join(spec['choices'])}"
+            )
+        if "range" in spec:
+            low, high = spec["range"]
+            if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid {key} '{value}', expected an integer from {low} to {high}"
+                )
+        settings[key] = value
+    return settings
+
 class DomainManager:
     def __init__(self):
-        self.docker_client = docker.from_env()
+        # Docker клиент создается лениво: медленный или отсутствующий сокет не блокирует старт
+        self._docker_client = None
+
+    @property
+    def docker_client(self):
+        if self._docker_client is None:
+            self._docker_client = docker.from_env()
+        return self._docker_client
+
+    def connect_docker(self) -> tuple[bool, str]:
+        """Проверка доступности Docker API"""
+        try:
+            self.docker_client.ping()
+            return True, None
+        except Exception as e:
+            logger.warning(f"Docker is not available yet: {e}")
+            self.close()
+            return False, str(e)
+
+    def close(self):
+        if self._docker_client is not None:
+            try:
+                self._docker_client.close()
+            except Exception:
+                pass
+            self._docker_client = None
         
     def load_domains(self) -> Dict[str, Any]:
         try:
@@ -195,29 +655,51 @@ class DomainManager:
     
     def save_domains(self, data: Dict[str, Any]):
         try:
-            with open(DOMAINS_FILE, 'w', encoding='utf-8') as f:
+            # Атомарная запись: другие воркеры никогда не читают наполовину записанный файл.
+            # domains.json смонтирован как отдельный файл, поэтому пишем содержимое на место,
+            # если rename через границу тома невозможен
+            tmp_file = f"{DOMAINS_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
+            try:
+                os.replace(tmp_file, DOMAINS_FILE)
+            except OSError:
+                with open(tmp_file, 'r', encoding='utf-8') as src, open(DOMAINS_FILE, 'w', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                os.unlink(tmp_file)
             logger.info("Domains saved successfully")
         except Exception as e:
             logger.error(f"Error saving domains: {e}")
             raise HTTPException(status_code=500, detail=f"Error saving domains: {e}")
     
-    def generate_smartdns_config(self, domains_data: Dict[str, Any]):
+    def generate_smartdns_config(self, domains_data: Dict[str, Any], shared_rules_file: str = SMARTDNS_SHARED_RULES_FILE):
         config_lines = []
         
         # Basic SmartDNS configuration
-        basic_config = """bind :53
+        config_lines.append("""bind :53
 bind-tcp :53
-
-server-tls 8.8.8.8:853 -group upstream
-server-tls 1.1.1.1:853 -group upstream
-server-https https://dns.google/dns-query -group upstream
-server-https https://cloudflare-dns.com/dns-query -group upstream
-
-server 8.8.8.8:53 -group fallback
-server 1.1.1.1:53 -group fallback
-
-speed-check-mode ping,tcp:80,tcp:443
+""")
+        
+        # Non-hijacking view for sniproxy backend lookups: no address/SOA overrides,
+        # otherwise SmartDNS would answer with our own server_ip and loop
+        config_lines.append(f"bind :{SNIPROXY_RESOLVER_PORT} -no-rule-addr -no-rule-soa\n")
+        
+        # Native DoT/DoH: DoT TLS is passed through Traefik; DoH is still terminated by Traefik
+        # (it shares HOST_DOMAIN with the admin) and re-encrypted to bind-https, minus doh-proxy/UDP
+        if DNS_TLS_MODE == "native":
+            if cert_sync.available():
+                config_lines.append(f"""bind-tls :{NATIVE_DOT_PORT}
+bind-https :{NATIVE_DOH_PORT}
+bind-cert-file {SMARTDNS_CERT_DIR}/le-server.crt
+bind-cert-key-file {SMARTDNS_CERT_DIR}/le-server.key
+""")
+            else:
+                logger.warning("DNS_TLS_MODE=native but no synced certificate yet, skipping bind-tls/bind-https")
+        
+        # Upstreams: best N by latency probes (defaults until the first probe)
+        config_lines.append("\n".join(upstream_manager.server_lines()) + "\n")
+        
+        basic_config = """speed-check-mode ping,tcp:80,tcp:443
 response-mode fastest-ip
 cache-size 4096
 cache-persist yes
@@ -230,7 +712,7 @@ rr-ttl 600
 log-level info
 log-size 128K
 log-num 2
-log-file /var/log/smartdns.log
+log-file /var/log/smartdns/smartdns.log
 
 prefetch-domain yes
 serve-expired yes
@@ -238,77 +720,313 @@ serve-expired-ttl 86400
 
 """
         config_lines.append(basic_config)
+
+        # Audit-лог в общем с админкой каталоге: из него считается статистика запросов
+        if QUERY_LOG_ENABLED:
+            config_lines.append(f"""audit-enable yes
+audit-SOA yes
+audit-size {QUERY_LOG_SIZE}
+audit-num 2
+audit-file {SMARTDNS_AUDIT_FILE}
+""")
         
-        # Add domain redirections
-        for domain in domains_data.get("domains", []):
-            if domain.get("enabled", True):
-                config_lines.append(f"address /{domain['name']}/{domains_data['server_ip']}")
+        # Allow-list: clients outside it are refused (groups' client-rules are allowed too)
+        acl = domains_data.get("acl", {})
+        if acl.get("enabled"):
+            config_lines.append("acl-enable yes")
+            config_lines.extend(f"client-rules {network}" for network in [*ACL_INTERNAL_NETWORKS, *acl.get("clients", [])])
+        
+        # Domain-set definitions are global, like the rules using them
+        for name, block_list in domains_data.get("block_lists", {}).items():
+            if block_list.get("enabled", True):
+                config_lines.append(domain_set_store.config_line(name))
+        
+        # Common rules for clients outside any group
+        config_lines.extend(self.rule_set(domains_data, None))
+        
+        # Client groups: a group has its own rule set and does not see the rules above, so the
+        # common rules come in from one shared file (generate_shared_rules) instead of being
+        # repeated per group; the config stays groups x own domains
+        for group_name, group in domains_data.get("groups", {}).items():
+            if not group.get("clients"):
+                continue
+            config_lines.append(f"\ngroup-begin {group_name}")
+            config_lines.extend(f"client-rules {client}" for client in group["clients"])
+            config_lines.append(f"conf-file {shared_rules_file}")
+            config_lines.extend(self.rule_set(domains_data, group_name))
+            config_lines.append("group-end")
         
         return "\n".join(config_lines)
     
-    def generate_sniproxy_config(self, domains_data: Dict[str, Any]):
+    def generate_shared_rules(self, domains_data: Dict[str, Any]) -> str:
+        """Общие правила, которые каждая группа клиентов подключает через conf-file"""
+        return "\n".join(self.rule_set(domains_data, None)) + "\n"
+    
+    def rule_set(self, domains_data: Dict[str, Any], group_name: Optional[str]) -> List[str]:
+        """
+        address/https-record/domain-rules: None - общие правила (домены без "groups"),
+        имя группы - только домены, перечисленные для этой группы
+        """
+        server_ipv6 = domains_data.get("server_ipv6") or SERVER_IPV6
+        if group_name is not None:
+            rules = []
+            for domain in domains_data.get("domains", []):
+                if domain.get("enabled", True) and domain.get("groups") and domain_in_group(domain, group_name):
+                    rules.extend(self.domain_rules(domain, domains_data, server_ipv6))
+            return rules
+        
+        # Wildcard for per-visit DNS check names: <nonce>.<TEST_DOMAIN>
+        rules = [f"address /*.{TEST_DOMAIN}/{domains_data['server_ip']}"]
+        
+        # Block lists before per-domain entries so an explicit entry in domains.json wins
+        for name, block_list in domains_data.get("block_lists", {}).items():
+            if block_list.get("enabled", True):
+                rules.extend(block_rules(f"/domain-set:{name}/", block_list.get("block_mode", "soa")))
+        
+        for domain in domains_data.get("domains", []):
+            if domain.get("enabled", True) and domain_in_group(domain, None):
+                rules.extend(self.domain_rules(domain, domains_data, server_ipv6))
+        return rules
+    
+    def domain_rules(self, domain: Dict[str, Any], domains_data: Dict[str, Any], server_ipv6: str) -> List[str]:
+        """Правила SmartDNS для одного домена по его action"""
+        name = domain["name"]
+        action = domain_setting(domain, domains_data, "action")
+        if action == "passthrough":
+            # Явное исключение: перекрывает правило родительского домена
+            return [f"address /{name}/-"]
+        
+        if action == "block":
+            rules = block_rules(f"/{name}/", domain_setting(domain, domains_data, "block_mode"))
+        else:
+            rules = [f"address /{name}/{domains_data['server_ip']}"]
+            rules.extend(self.record_policy_rules(domain, domains_data, server_ipv6))
+        
+        # Our answers only change when the list is edited: a long TTL saves client re-queries
+        ttl = domain_setting(domain, domains_data, "ttl")
+        if ttl:
+            rules.append(f"domain-rules /{name}/ -rr-ttl {ttl} -rr-ttl-min {ttl} -rr-ttl-max {ttl}")
+        return rules
+    
+    def record_policy_rules(self, domain: Dict[str, Any], domains_data: Dict[str, Any], server_ipv6: str) -> List[str]:
+        """AAAA и HTTPS/SVCB правила: без них dual-stack клиенты обходят прокси, а h3 в HTTPS RR дает таймаут QUIC"""
+        rules = []
+        name = domain["name"]
+        
+        ipv6_policy = domain_setting(domain, domains_data, "ipv6_policy")
+        if ipv6_policy == "own" and not server_ipv6:
+            logger.warning(f"ipv6_policy 'own' for {name} without SERVER_IPV6, using 'soa'")
+            ipv6_policy = "soa"
+        if ipv6_policy == "soa":
+            rules.append(f"address /{name}/#6")
+        elif ipv6_policy == "own":
+            rules.append(f"address /{name}/{server_ipv6}")
+        
+        https_policy = domain_setting(domain, domains_data, "https_policy")
+        if https_policy == "soa":
+            rules.append(f"https-record /{name}/#")
+        elif https_policy == "own":
+            hints = f"ipv4hint={domains_data['server_ip']}"
+            if ipv6_policy == "own":
+                hints += f",ipv6hint={server_ipv6}"
+            # h3 only when the QUIC forwarder serves UDP 443 on server_ip
+            alpn = "h3,h2" if QUIC_PROXY_ENABLED else "h2"
+            # SmartDNS splits SvcParams on commas outside quotes: an unquoted "h2" would be a separate key
+            if "," in alpn:
+                alpn = f'"{alpn}"'
+            rules.append(f"https-record /{name}/alpn={alpn},{hints}")
+        
+        return rules
+    
+    def generate_nftables_ruleset(self, domains_data: Dict[str, Any]) -> str:
+        """Allow-list и лимит запросов на адрес для портов DNS на хосте"""
+        acl = domains_data.get("acl", {})
+        rate_limit = {**ACL_DEFAULT_RATE_LIMIT, **acl.get("rate_limit", {})}
+        group_clients = [c for group in domains_data.get("groups", {}).values() for c in group.get("clients", [])]
+        return render_ruleset(
+            [*acl.get("clients", []), *group_clients], ACL_INTERNAL_NETWORKS, bool(acl.get("enabled")),
+            rate_limit["qps"], rate_limit["burst"], ACL_PORTS
+        )
+    
+    def sniproxy_workers(self, domain_count: int, fds_per_connection: int) -> tuple[int, int]:
+        """
+        worker_processes и worker_connections из ожидаемой нагрузки по доменам
+
+        Процессов 0 - worker_processes auto: CPU видит сам nginx в контейнере sniproxy,
+        админка их не знает (у нее свой cpuset). Соединения делятся на SNIPROXY_CPUS,
+        а без него рассчитаны на один воркер - с запасом при любом числе CPU.
+        """
+        processes = SNIPROXY_WORKER_PROCESSES
+        expected = (domain_count + 1) * SNIPROXY_CONNECTIONS_PER_DOMAIN * fds_per_connection
+        connections = 1024
+        while connections < expected / (processes or SNIPROXY_CPUS or 1) and connections < 65536:
+            connections *= 2
+        return processes, connections
+    
+    def proxied_domains(self, domains_data: Dict[str, Any]):
+        """Домены с action redirect, различные профили и индекс профиля каждого домена"""
+        domains = [
+            d for d in domains_data.get("domains", [])
+            if d.get("enabled", True) and domain_setting(d, domains_data, "action") == "redirect"
+        ]
+        
+        # Distinct profiles get their own server; categories with equal settings share one
+        profiles: List[Dict[str, Any]] = [dict(DEFAULT_PROXY_PROFILE)]
+        domain_profile: Dict[str, int] = {}
+        for domain in domains:
+            profile = proxy_profile(domains_data, domain.get("category", "misc"))
+            if profile not in profiles:
+                profiles.append(profile)
+            domain_profile[domain["name"]] = profiles.index(profile)
+        return domains, profiles, domain_profile
+    
+    def sniproxy_map_key(self, name: str, map_layout: str) -> str:
+        """Ключ map для домена и его поддоменов; regex привязан к границе метки и концу имени"""
+        if map_layout == "hostnames":
+            return f".{name}"
+        return "~*(^|\\.)" + name.replace(".", "\\.") + "$"
+    
+    def generate_sniproxy_config(self, domains_data: Dict[str, Any], map_layout: str = SNIPROXY_MAP_LAYOUT):
+        domains, profiles, domain_profile = self.proxied_domains(domains_data)
+        # limit_conn считается до ssl_preread, поэтому лимиты по категориям требуют отдельного server
+        # на профиль за диспетчером; таймауты и буфер сливаются в один server без лишнего хопа
+        dispatch = len(profiles) > 1 and any(profile["limit_conn"] for profile in profiles)
+        
+        # A dispatched connection holds four descriptors: client, unix socket pair, backend
+        processes, connections = self.sniproxy_workers(len(domains), 4 if dispatch else 2)
         config_lines = []
+        stream_log = f"{SNIPROXY_LOG_DIRECTIVES['stream']}\n    \n" if SNIPROXY_STREAM_LOG else ""
         
         # Basic nginx configuration header with resolver
-        config_lines.append("""error_log /var/log/nginx/error.log warn;
+        config_lines.append(f"""error_log /var/log/nginx/error.log warn;
 pid /var/run/nginx.pid;
 
-events {
-    worker_connections 1024;
-}
+worker_processes {processes or "auto"};
+worker_rlimit_nofile {connections * 2};
 
-stream {
-    # DNS resolver configuration - using public DNS servers
-    resolver 8.8.8.8 1.1.1.1 valid=300s ipv6=off;
+events {{
+    worker_connections {connections};
+}}
+
+stream {{
+    # DNS resolver - local SmartDNS view without address overrides (warm shared cache)
+    resolver {SNIPROXY_RESOLVER} valid=300s ipv6=off;
     resolver_timeout 5s;
     
-    # Special upstream for admin panel
-    upstream dnsuzicus {
+{stream_log}    # Special upstream for admin panel
+    upstream dnsuzicus {{
         server traefik:8443;
-    }
+    }}
     
     # Map configuration for dynamic proxy pass
-    map $ssl_preread_server_name $backend_name {""")
+    map $ssl_preread_server_name $backend_name {{""")
+        if map_layout == "hostnames":
+            config_lines.append("        hostnames;")
         
         # Generate map entries for domains
-        for domain in domains_data.get("domains", []):
-            if domain.get("enabled", True):
-                domain_name = domain["name"]
-                # Map domain to itself with port 443 for direct proxy
-                config_lines.append(f"        ~*{domain_name} {domain_name}:443;")
+        for domain in domains:
+            # Map domain to itself with port 443 for direct proxy
+            config_lines.append(f"        {self.sniproxy_map_key(domain['name'], map_layout)} {domain['name']}:443;")
         
         # Special handling for admin panel
-        config_lines.append(f"        ~*{HOST_DOMAIN} dnsuzicus;")
+        config_lines.append(f"        {self.sniproxy_map_key(HOST_DOMAIN, map_layout)} dnsuzicus;")
         config_lines.append("        default $ssl_preread_server_name:443;")
         config_lines.append("    }")
         
-        # Server block with dynamic proxy
+        if not dispatch:
+            config_lines.append(self.sniproxy_server(
+                "listen 443;", merge_proxy_profiles(profiles), "$binary_remote_addr", "default"
+            ))
+            config_lines.append("}")
+            return "\n".join(config_lines)
+        
+        # Dispatcher: SNI -> profile server over a unix socket; PROXY protocol keeps the client address
         config_lines.append("""
-    server {
+    map $ssl_preread_server_name $profile_socket {""")
+        if map_layout == "hostnames":
+            config_lines.append("        hostnames;")
+        for domain in domains:
+            if domain_profile[domain["name"]]:
+                config_lines.append(f"        {self.sniproxy_map_key(domain['name'], map_layout)} "
+                                    f"unix:/var/run/sniproxy-profile-{domain_profile[domain['name']]}.sock;")
+        config_lines.append("        default unix:/var/run/sniproxy-profile-0.sock;")
+        config_lines.append("    }")
+        # The first hop must not cut what a profile allows: longest timeout and largest buffer of all profiles
+        dispatcher = merge_proxy_profiles(profiles)
+        config_lines.append(f"""
+    server {{
         listen 443;
         ssl_preread on;
-        proxy_pass $backend_name;
-        proxy_timeout 10s;
-        proxy_connect_timeout 5s;
-        proxy_buffer_size 16k;
+        proxy_pass $profile_socket;
+        proxy_protocol on;
+        proxy_timeout {dispatcher['proxy_timeout']};
+        proxy_buffer_size {dispatcher['proxy_buffer_size']};
+        access_log off;
+    }}""")
+        
+        for index, profile in enumerate(profiles):
+            config_lines.append(self.sniproxy_server(
+                f"listen unix:/var/run/sniproxy-profile-{index}.sock proxy_protocol;",
+                profile, "$proxy_protocol_addr", str(index)
+            ))
         
+        config_lines.append("}")
+        return "\n".join(config_lines)
+    
+    def generate_quic_config(self, domains_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Домены и лимиты для QUIC forwarder: те же профили и limit_conn, что у sniproxy"""
+        domains, profiles, domain_profile = self.proxied_domains(domains_data)
+        processes, connections = self.sniproxy_workers(len(domains), 2)
+        return render_quic_config(
+            {d["name"].lower(): domain_profile[d["name"]] for d in domains}, profiles,
+            (processes or SNIPROXY_CPUS or 1) * connections // 2
+        )
+    
+    def sniproxy_server(self, listen: str, profile: Dict[str, Any], client_key: str, name: str) -> str:
+        """server блок профиля: таймауты, буфер и limit_conn по адресу клиента"""
+        limit = ""
+        if profile["limit_conn"]:
+            limit = f"""
+    limit_conn_zone {client_key} zone=sniproxy_{name}:10m;"""
+        lines = [f"""{limit}
+    server {{
+        {listen}
+        ssl_preread on;
+        proxy_pass $backend_name;
+        proxy_timeout {profile['proxy_timeout']};
+        proxy_connect_timeout {profile['proxy_connect_timeout']};
+        proxy_buffer_size {profile['proxy_buffer_size']};"""]
+        if profile["limit_conn"]:
+            lines.append(f"        limit_conn sniproxy_{name} {profile['limit_conn']};")
+        lines.append("""        
         # Enable TCP keepalive for better connection handling
         proxy_socket_keepalive on;
         
         # Log errors for debugging
-        error_log /var/log/nginx/sniproxy.log;
-        
+        error_log /var/log/nginx/sniproxy.log;""")
+        if SNIPROXY_STREAM_LOG:
+            lines.append(f"""        
+        # Buffered (optionally sampled) stream log for per-domain accounting
+        {SNIPROXY_LOG_DIRECTIVES['server']}
+    }}""")
+        else:
+            lines.append("""        
         # Access log disabled for performance
         access_log off;
-    }
-}""")
-        
-        return "\n".join(config_lines)
+    }""")
+        return "\n".join(lines)
     
     def update_configs(self):
         try:
             domains_data = self.load_domains()
             
+            # Shared rules first: groups in the new smartdns.conf include this file
+            os.makedirs(os.path.dirname(SMARTDNS_SHARED_RULES), exist_ok=True)
+            tmp_file = f"{SMARTDNS_SHARED_RULES}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(self.generate_shared_rules(domains_data))
+            os.replace(tmp_file, SMARTDNS_SHARED_RULES)
+            
             # Generate and save SmartDNS config
             smartdns_config = self.generate_smartdns_config(domains_data)
             with open(SMARTDNS_CONFIG, 'w', encoding='utf-8') as f:
@@ -319,36 +1037,56 @@ stream {
             with open(SNIPROXY_CONFIG, 'w', encoding='utf-8') as f:
                 f.write(sniproxy_config)
             
+            # QUIC forwarder picks the file up by mtime, no restart needed; when disabled an empty
+            # domain list makes a still-running forwarder refuse new flows
+            quic_config = self.generate_quic_config(domains_data) if QUIC_PROXY_ENABLED \
+                else render_quic_config({}, [DEFAULT_PROXY_PROFILE], 0)
+            tmp_file = f"{QUIC_CONFIG}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(quic_config, f, indent=2)
+            os.replace(tmp_file, QUIC_CONFIG)
+            
+            # nftables ruleset for the host (scripts/apply-nftables.sh)
+            with open(NFT_RULESET, 'w', encoding='utf-8') as f:
+                f.write(self.generate_nftables_ruleset(domains_data))
+            
             logger.info("Configs updated successfully")
         except Exception as e:
             logger.error(f"Error updating configs: {e}")
             raise HTTPException(status_code=500, detail=f"Error updating configs: {e}")
     
-    def restart_services(self):
+    def restart_smartdns(self):
+        smartdns_container = self.docker_client.containers.get("smartdns")
+        smartdns_container.restart()
+    
+    def reopen_sniproxy_logs(self):
+        """USR1: nginx переоткрывает логи после переименования stream-лога"""
+        self.docker_client.containers.get("sniproxy").kill(signal="USR1")
+    
+    def reload_sniproxy(self):
+        # Graceful reload nginx config without full restart
         try:
-            # Restart SmartDNS
-            smartdns_container = self.docker_client.containers.get("smartdns")
-            smartdns_container.restart()
-            
-            # Graceful reload nginx config without full restart
-            try:
-                sniproxy_container = self.docker_client.containers.get("sniproxy")
-                # Test nginx config first
-                test_result = sniproxy_container.exec_run("nginx -t")
-                if test_result.exit_code == 0:
-                    # Config is valid, reload gracefully
-                    reload_result = sniproxy_container.exec_run("nginx -s reload")
-                    if reload_result.exit_code != 0:
-                        logger.warning("Graceful reload failed, doing full restart")
-                        sniproxy_container.restart()
-                else:
-                    logger.warning("Nginx config test failed, doing full restart")
+            sniproxy_container = self.docker_client.containers.get("sniproxy")
+            # Test nginx config first
+            test_result = sniproxy_container.exec_run("nginx -t")
+            if test_result.exit_code == 0:
+                # Config is valid, reload gracefully
+                reload_result = sniproxy_container.exec_run("nginx -s reload")
+                if reload_result.exit_code != 0:
+                    logger.warning("Graceful reload failed, doing full restart")
                     sniproxy_container.restart()
-            except Exception as e:
-                logger.error(f"Error with graceful reload, doing full restart: {e}")
-                sniproxy_container = self.docker_client.containers.get("sniproxy")
+            else:
+                logger.warning("Nginx config test failed, doing full restart")
                 sniproxy_container.restart()
-            
+        except Exception as e:
+            logger.error(f"Error with graceful reload, doing full restart: {e}")
+            sniproxy_container = self.docker_client.containers.get("sniproxy")
+            sniproxy_container.restart()
+    
+    def restart_services(self):
+        try:
+            self.restart_smartdns()
+            self.reload_sniproxy()
             logger.info("Services restarted successfully")
         except Exception as e:
             logger.error(f"Error restarting services: {e}")
@@ -357,7 +1095,7 @@ stream {
     def get_service_status(self) -> Dict[str, str]:
         status = {}
         try:
-            for service in ["smartdns", "sniproxy", "traefik"]:
+            for service in ["smartdns", "sniproxy", "traefik"] + (["quicproxy"] if QUIC_PROXY_ENABLED else []):
                 container = self.docker_client.containers.get(service)
                 status[service] = container.status
         except Exception as e:
@@ -366,6 +1104,140 @@ stream {
         return status
 
 domain_manager = DomainManager()
+upstream_manager = UpstreamManager.from_env(UPSTREAMS_STATE)
+cert_sync = CertSync(ACME_FILE, HOST_DOMAIN, SMARTDNS_CERTS, CERT_SYNC_STATE)
+domain_set_store = DomainSetStore(DOMAIN_SETS_DIR, '/etc/smartdns/domain-sets')
+
+def hot_names() -> List[str]:
+    """
+    Горячие имена для прогрева: WARMUP_NAMES, smartdns/warmup-names.txt и до WARMUP_TOP_NAMES
+    самых частых имен audit-лога (снимок лидера в run/warmup-top-names.json)
+    """
+    names = list(WARMUP_NAMES)
+    try:
+        with open(WARMUP_NAMES_FILE, 'r', encoding='utf-8') as f:
+            names.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    except OSError:
+        pass
+    if WARMUP_TOP_NAMES > 0:
+        names.extend(load_run_state("warmup-top-names.json").get("names", [])[:WARMUP_TOP_NAMES])
+    return names
+
+cache_warmer = CacheWarmer.from_env(hot_names)
+related_domains = CoQueryAnalyzer.from_env() if RELATED_DOMAINS_ENABLED else None
+query_stats = QueryStats.from_env(QUERY_LOG_FILE, [SERVER_IP, SERVER_IPV6], related=related_domains)
+stream_stats = StreamStats(LogTailer(SNIPROXY_STREAM_LOG_FILE), SNIPROXY_STREAM_LOG_SAMPLE)
+
+async def apply_configs(new_names: List[str] = ()) -> Dict[str, Any]:
+    """
+    Применение под config_lock() с записью результата в run/apply.json:
+    хэш примененного domains.json виден всем воркерам и /api/config/state
+    """
+    target = config_hash()
+    try:
+        result = await run_apply_pipeline(new_names)
+    except Exception as e:
+        state = load_run_state("apply.json")
+        state.update({"status": "failed", "failed_hash": target, "error": str(getattr(e, "detail", e))})
+        save_run_state("apply.json", state)
+        raise
+    save_run_state("apply.json", {"status": "applied", "config_hash": target, "applied_at": time.time()})
+    result["config_hash"] = target
+    return result
+
+async def run_apply_pipeline(new_names: List[str]) -> Dict[str, Any]:
+    """
+    Конвейер применения: конфиги, перезапуск SmartDNS, reload sniproxy,
+    затем прогрев кэша в фоне (результат - GET /api/warmup)
+    """
+    domain_manager.update_configs()
+    try:
+        domain_manager.restart_smartdns()
+    except Exception as e:
+        logger.error(f"Error restarting services: {e}")
+        raise HTTPException(status_code=500, detail=f"Error restarting services: {e}")
+
+    try:
+        domain_manager.reload_sniproxy()
+    except Exception as e:
+        logger.error(f"Error restarting services: {e}")
+        raise HTTPException(status_code=500, detail=f"Error restarting services: {e}")
+    logger.info("Services restarted successfully")
+
+    warmup = None
+    if WARMUP_ENABLED:
+        schedule_warmup(list(new_names))
+        warmup = {"status": "scheduled", "new_names": len(new_names)}
+    return {"warmup": warmup}
+
+def schedule_warmup(new_names: List[str]):
+    """
+    Прогрев в фоне: ожидание готовности SmartDNS и два прохода не держат запрос
+    и config_lock. Новое применение снова перезапускает SmartDNS, поэтому
+    незаконченный прогрев предыдущего отменяется.
+    """
+    previous = background_tasks.get("warmup")
+    if previous is not None and not previous.done():
+        previous.cancel()
+    background_tasks["warmup"] = asyncio.create_task(run_warmup(new_names))
+
+async def run_warmup(new_names: List[str]):
+    try:
+        # Клиентский порт и порт бэкенд-резолвинга sniproxy прогреваем параллельно
+        client, backend = await asyncio.gather(
+            cache_warmer.warm(new_names),
+            cache_warmer.warm(new_names, port=SNIPROXY_RESOLVER_PORT)
+        )
+    except Exception as e:
+        logger.error(f"Cache warm-up failed: {e}")
+        return
+    save_run_state("warmup.json", {"client": client, "sniproxy": backend, "finished_at": time.time()})
+
+def save_run_state(name: str, state: Dict[str, Any]):
+    """Небольшое состояние, видимое всем воркерам"""
+    try:
+        os.makedirs(RUN_DIR, exist_ok=True)
+        tmp_file = os.path.join(RUN_DIR, f"{name}.{os.getpid()}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, os.path.join(RUN_DIR, name))
+    except OSError as e:
+        logger.error(f"Error saving {name}: {e}")
+
+def load_run_state(name: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(RUN_DIR, name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def config_version():
+    """Версия конфигурации для кэша страниц: меняется при записи domains.json любым воркером"""
+    try:
+        return os.stat(DOMAINS_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+def config_hash() -> Optional[str]:
+    """Хэш содержимого domains.json: сравнивается с хэшем последнего применения"""
+    try:
+        with open(DOMAINS_FILE, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except OSError:
+        return None
+
+page_cache = PageCache(templates, config_version)
+
+def config_lock() -> FileLock:
+    """Блокировка изменений domains.json и применения конфигов между воркерами"""
+    return FileLock(os.path.join(RUN_DIR, "config.lock"))
+
+nonce_issuer = NonceIssuer(load_secret(os.path.join(RUN_DIR, "dns-check.key")), ttl=DNS_CHECK_NONCE_TTL)
+nonce_ledger = NonceLedger(os.path.join(RUN_DIR, "dns-check-nonces"), ttl=DNS_CHECK_NONCE_TTL)
+dns_check_counters = SharedCounters(RUN_DIR, "dnscheck")
+
+leader_election = LeaderElection(os.path.join(RUN_DIR, "leader.lock"))
+event_bus = EventBus(RUN_DIR)
 
 # WebSocket connections for real-time updates
 class ConnectionManager:
@@ -377,10 +1249,18 @@ class ConnectionManager:
         self.active_connections.append(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
+        """Рассылка клиентам всех воркеров через локальную шину событий"""
+        if event_bus.started:
+            event_bus.publish(message)
+        else:
+            await self.broadcast_local(message)
+
+    async def broadcast_local(self, message: dict):
+        for connection in list(self.active_connections):
             try:
                 await connection.send_json(message)
             except:
@@ -388,9 +1268,95 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: процесс жив и обслуживает event loop"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: Docker доступен и каталог данных смонтирован"""
+    checks = {
+        "docker": readiness["docker"],
+        "data_dir": os.path.isdir(DATA_DIR),
+    }
+    ready = all(checks.values())
+    body = {
+        "status": "ready" if ready else "starting",
+        "checks": checks,
+        "worker": os.getpid(),
+        "leader": leader_election.is_leader,
+    }
+    if readiness["docker_error"] and not readiness["docker"]:
+        body["docker_error"] = readiness["docker_error"]
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
-    return templates.TemplateResponse("dns_check.html", {"request": request})
+    page = page_cache.get("dns_check.html", lambda: {
+        "test_domain": TEST_DOMAIN,
+        "server_ip": SERVER_IP
+    })
+    return page.response(request, "public, no-cache")
+
+@app.get("/static/{path:path}")
+async def static_files(path: str, request: Request):
+    """Статика из памяти с ревалидацией по ETag"""
+    response = static_assets.response(request, path)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return response
+
+@app.get("/dns-check/nonce")
+async def dns_check_nonce(request: Request):
+    """Выдать уникальное имя для проверки DNS этим посещением"""
+    scheme = request.headers.get("x-forwarded-proto", request.url.scheme).split(",", 1)[0].strip()
+    if scheme == "https" and not DNS_CHECK_WILDCARD_TLS:
+        # Без wildcard сертификата HTTPS проба на <nonce>.TEST_DOMAIN упадет на TLS, а фиксированное
+        # имя отвечается из кэшей браузера и ОС: честный результат - "не проверяемо"
+        dns_check_counters.increment("unverifiable")
+        return JSONResponse(
+            {"verifiable": False, "nonce": None, "probe_host": None, "probe_url": None,
+             "reason": "no wildcard certificate for probe names (ACME_DNS_PROVIDER is not set)"},
+            headers=PROBE_HEADERS
+        )
+    nonce = nonce_issuer.issue()
+    dns_check_counters.increment("issued")
+    probe_host = f"{nonce}.{TEST_DOMAIN}"
+    return JSONResponse(
+        {"verifiable": True, "nonce": nonce, "probe_host": probe_host,
+         "probe_url": f"{scheme}://{probe_host}/dns-probe.gif", "ttl": DNS_CHECK_NONCE_TTL},
+        headers=PROBE_HEADERS
+    )
+
+@app.get("/dns-probe.gif")
+async def dns_check_probe(request: Request):
+    """Проба с <nonce>.<TEST_DOMAIN>: дойти сюда можно только через наш DNS"""
+    nonce = extract_nonce(request.headers.get("host", ""), TEST_DOMAIN)
+    if nonce is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    issued_at = nonce_issuer.issued_at(nonce)
+    if issued_at is None:
+        dns_check_counters.increment("invalid")
+        raise HTTPException(status_code=404, detail="Not found")
+    # Успех считается один раз на nonce; повтор получает ту же картинку, но в статистику не идет
+    dns_check_counters.increment("succeeded" if nonce_ledger.consume(nonce, issued_at) else "replayed")
+    return Response(content=PROBE_GIF, media_type="image/gif", headers=PROBE_HEADERS)
+
+@app.get("/api/dns-check/stats")
+async def dns_check_stats():
+    """Объем проверок и доля успешных по всем воркерам"""
+    totals = await asyncio.to_thread(dns_check_counters.aggregate)
+    issued = totals.get("issued", 0)
+    succeeded = totals.get("succeeded", 0)
+    return {
+        "issued": issued,
+        "succeeded": succeeded,
+        "invalid": totals.get("invalid", 0),
+        "replayed": totals.get("replayed", 0),
+        "unverifiable": totals.get("unverifiable", 0),
+        "success_rate": round(min(1.0, succeeded / issued), 4) if issued else None,
+    }
 
 @app.get("/pixel.png")
 async def pixel_image(request: Request):
@@ -401,7 +1367,7 @@ async def pixel_image(request: Request):
     if host == TEST_DOMAIN or host.startswith(f"{TEST_DOMAIN}:"):
         # Отдаем картинку
         return FileResponse(
-            path="/app/static/pixel.png",
+            path=os.path.join("static", "pixel.png"),
             media_type="image/png",
             headers={
                 "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -440,11 +1406,14 @@ async def dns_check_websocket(websocket: WebSocket):
 
 @app.get("/admin", response_class=HTMLResponse)
 async def admin(request: Request):
-    return templates.TemplateResponse("admin.html", {"request": request})
+    page = page_cache.get("admin.html", lambda: {})
+    return page.response(request, "private, no-cache")
 
 @app.get("/api/domains")
-async def get_domains():
-    return domain_manager.load_domains()
+async def get_domains(request: Request):
+    # Разбор и сериализация domains.json на тысячах доменов - десятки мс: один раз на версию и вне event loop
+    body = await asyncio.to_thread(page_cache.get_json, "domains", domain_manager.load_domains)
+    return body.response(request, "private, no-cache")
 
 @app.post("/api/domains/validate")
 async def validate_domain(domain_data: dict):
@@ -469,6 +1438,8 @@ async def add_domain(domain_data: dict, request: Request):
         if not domain_name:
             raise HTTPException(status_code=400, detail="Domain name is required")
         
+        settings = validate_domain_settings(domain_data)
+        
         # Валидируем домен перед добавлением
         validation_result = DomainValidator.validate_domain(domain_name)
         
@@ -476,24 +1447,28 @@ async def add_domain(domain_data: dict, request: Request):
             error_message = "; ".join(validation_result["errors"])
             raise HTTPException(status_code=400, detail=f"Domain validation failed: {error_message}")
         
-        domains_data = domain_manager.load_domains()
-        
-        # Check if domain already exists
-        for existing_domain in domains_data["domains"]:
-            if existing_domain["name"] == domain_name:
-                raise HTTPException(status_code=400, detail="Domain already exists")
-        
-        # Add new domain
-        new_domain = {
-            "name": domain_name,
-            "category": domain_data.get("category", "misc"),
-            "enabled": domain_data.get("enabled", True)
-        }
-        
-        domains_data["domains"].append(new_domain)
-        domain_manager.save_domains(domains_data)
-        domain_manager.update_configs()
-        domain_manager.restart_services()
+        async with config_lock():
+            domains_data = domain_manager.load_domains()
+            
+            # Check if domain already exists
+            for existing_domain in domains_data["domains"]:
+                if existing_domain["name"] == domain_name:
+                    raise HTTPException(status_code=400, detail="Domain already exists")
+            
+            # Add new domain
+            new_domain = {
+                "name": domain_name,
+                "category": domain_data.get("category", "misc"),
+                "enabled": domain_data.get("enabled", True)
+            }
+            new_domain.update(settings)
+            groups = validate_domain_groups(domain_data, domains_data)
+            if groups:
+                new_domain["groups"] = groups
+            
+            domains_data["domains"].append(new_domain)
+            domain_manager.save_domains(domains_data)
+            applied = await apply_configs([domain_name])
         
         # Broadcast update to WebSocket clients
         await manager.broadcast({"type": "domain_added", "domain": new_domain})
@@ -502,7 +1477,9 @@ async def add_domain(domain_data: dict, request: Request):
         return {
             "success": True, 
             "message": "Domain added successfully",
-            "validation": validation_result
+            "validation": validation_result,
+            "warmup": applied["warmup"],
+            "config_hash": applied["config_hash"]
         }
     except HTTPException:
         raise
@@ -515,18 +1492,18 @@ async def remove_domain(domain_name: str, request: Request):
     client_ip = get_client_ip(request)
     logger.info(f"Attempt to remove domain '{domain_name}' from IP: {client_ip}")
     try:
-        domains_data = domain_manager.load_domains()
-        
-        # Find and remove domain
-        original_count = len(domains_data["domains"])
-        domains_data["domains"] = [d for d in domains_data["domains"] if d["name"] != domain_name]
-        
-        if len(domains_data["domains"]) == original_count:
-            raise HTTPException(status_code=404, detail="Domain not found")
-        
-        domain_manager.save_domains(domains_data)
-        domain_manager.update_configs()
-        domain_manager.restart_services()
+        async with config_lock():
+            domains_data = domain_manager.load_domains()
+            
+            # Find and remove domain
+            original_count = len(domains_data["domains"])
+            domains_data["domains"] = [d for d in domains_data["domains"] if d["name"] != domain_name]
+            
+            if len(domains_data["domains"]) == original_count:
+                raise HTTPException(status_code=404, detail="Domain not found")
+            
+            domain_manager.save_domains(domains_data)
+            await apply_configs()
         
         # Broadcast update to WebSocket clients
         await manager.broadcast({"type": "domain_removed", "domain": domain_name})
@@ -539,9 +1516,415 @@ async def remove_domain(domain_name: str, request: Request):
         logger.error(f"Error removing domain '{domain_name}' from IP {client_ip}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/domains/bulk")
+async def bulk_domains(bulk_data: dict, request: Request):
+    """
+    Пакетное добавление/обновление доменов: одна запись domains.json и одно применение конфигов.
+    Проверяется только формат имен (без DNS/HTTPS проверок одиночного добавления).
+    """
+    client_ip = get_client_ip(request)
+    entries = bulk_data.get("domains") or []
+    if not isinstance(entries, list) or not entries:
+        raise HTTPException(status_code=400, detail="Field 'domains' must be a non-empty list")
+    
+    defaults = validate_domain_settings(bulk_data.get("defaults") or {})
+    default_category = (bulk_data.get("defaults") or {}).get("category", "misc")
+    
+    prepared, invalid = {}, []
+    for entry in entries:
+        entry = {"name": entry} if isinstance(entry, str) else entry
+        if not isinstance(entry, dict):
+            invalid.append(str(entry))
+            continue
+        name = str(entry.get("name", "")).strip().lower()
+        if not DomainValidator.is_valid_domain_format(name):
+            invalid.append(name)
+            continue
+        domain = {"name": name, "category": entry.get("category", default_category), "enabled": entry.get("enabled", True)}
+        domain.update(defaults)
+        domain.update(validate_domain_settings(entry))
+        groups = entry.get("groups", (bulk_data.get("defaults") or {}).get("groups"))
+        if groups is not None:
+            domain["groups"] = groups
+        prepared[name] = domain
+    
+    logger.info(f"Bulk update of {len(prepared)} domains ({len(invalid)} invalid) from IP: {client_ip}")
+    added, updated = [], []
+    if prepared:
+        async with config_lock():
+            domains_data = domain_manager.load_domains()
+            for domain in prepared.values():
+                if "groups" in domain:
+                    domain["groups"] = validate_domain_groups(domain, domains_data)
+            for existing in domains_data["domains"]:
+                if existing["name"] in prepared:
+                    existing.update(prepared.pop(existing["name"]))
+                    updated.append(existing["name"])
+            domains_data["domains"].extend(prepared.values())
+            added = list(prepared)
+            domain_manager.save_domains(domains_data)
+            await apply_configs(added)
+        
+        await manager.broadcast({"type": "domains_bulk", "added": len(added), "updated": len(updated)})
+    
+    return {"success": True, "added": added, "updated": updated, "invalid": invalid}
+
+def load_dismissed_related() -> List[str]:
+    try:
+        with open(RELATED_DISMISSED_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def covered_by(name: str, names: set) -> bool:
+    """Имя или один из его родительских доменов есть в наборе"""
+    while name:
+        if name in names:
+            return True
+        _, _, name = name.partition(".")
+    return False
+
+@app.get("/api/domains/related")
+async def get_related_domains(limit: int = 50):
+    """
+    Подсказки: имена, которые клиенты запрашивают в пределах RELATED_WINDOW секунд
+    от перехваченных доменов (CDN, API сайта). Уже добавленные и отклоненные скрыты.
+    """
+    if related_domains is None:
+        return {"available": False, "suggestions": []}
+    state = load_run_state("related-domains.json")
+    existing = {d["name"].lower() for d in domain_manager.load_domains().get("domains", [])}
+    hidden = existing | set(load_dismissed_related()) | {HOST_DOMAIN}
+    suggestions = [s for s in state.get("suggestions", []) if not covered_by(s["name"], hidden)]
+    return {
+        "available": True,
+        "updated": state.get("updated"),
+        "window_seconds": related_domains.window,
+        "suggestions": suggestions[:limit],
+    }
+
+@app.post("/api/domains/related/accept")
+async def accept_related_domains(accept_data: dict, request: Request):
+    """
+    Принять подсказки одним пакетом через /api/domains/bulk: одно применение конфигов.
+    Категория - как у перехваченного домена, рядом с которым имя запрашивается чаще всего.
+    """
+    names = accept_data.get("names") or []
+    if not isinstance(names, list) or not names:
+        raise HTTPException(status_code=400, detail="Field 'names' must be a non-empty list")
+    
+    suggestions = {s["name"]: s for s in load_run_state("related-domains.json").get("suggestions", [])}
+    categories = {d["name"]: d.get("category", "misc") for d in domain_manager.load_domains().get("domains", [])}
+    entries = []
+    for name in names:
+        name = str(name).strip().lower()
+        entry = {"name": name}
+        suggestion = suggestions.get(name)
+        if suggestion and suggestion["anchors"]:
+            entry["category"] = categories.get(suggestion["anchors"][0]["domain"], "misc")
+        entries.append(entry)
+    return await bulk_domains({"domains": entries, "defaults": accept_data.get("defaults") or {}}, request)
+
+@app.post("/api/domains/related/dismiss")
+async def dismiss_related_domains(dismiss_data: dict):
+    """Больше не предлагать эти имена (и их поддомены)"""
+    names = dismiss_data.get("names") or []
+    if not isinstance(names, list) or not names:
+        raise HTTPException(status_code=400, detail="Field 'names' must be a non-empty list")
+    
+    async with config_lock():
+        dismissed = load_dismissed_related()
+        dismissed.extend(n for n in (str(n).strip().lower() for n in names) if n and n not in dismissed)
+        tmp_file = f"{RELATED_DISMISSED_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(dismissed, f, indent=2)
+        os.replace(tmp_file, RELATED_DISMISSED_FILE)
+    return {"success": True, "dismissed": len(dismissed)}
+
+@app.get("/api/block-lists")
+async def get_block_lists():
+    """Списки блокировки (domain-set файлы SmartDNS)"""
+    return {"block_lists": domain_manager.load_domains().get("block_lists", {})}
+
+@app.put("/api/block-lists/{list_name}")
+async def put_block_list(list_name: str, list_data: dict, request: Request):
+    """
+    Загрузить или заменить список блокировки: "domains" (список имен) или "text"
+    (по имени в строке, формат hosts и ||name^ допускается)
+    """
+    client_ip = get_client_ip(request)
+    if not is_valid_set_name(list_name):
+        raise HTTPException(status_code=400, detail="Block list name must match [a-z0-9][a-z0-9_-]{0,31}")
+    block_mode = list_data.get("block_mode", DOMAIN_SETTINGS["block_mode"]["default"])
+    if block_mode not in DOMAIN_SETTINGS["block_mode"]["choices"]:
+        raise HTTPException(status_code=400, detail=f"Invalid block_mode '{block_mode}'")
+    
+    lines = list_data.get("domains") or str(list_data.get("text", "")).splitlines()
+    names, skipped = parse_domain_list(lines)
+    if not names:
+        raise HTTPException(status_code=400, detail="Block list contains no valid domains")
+    
+    block_list = {
+        "block_mode": block_mode,
+        "enabled": list_data.get("enabled", True),
+        "count": len(names),
+        "updated_at": int(time.time()),
+    }
+    logger.info(f"Loading block list '{list_name}' with {len(names)} names ({skipped} skipped) from IP: {client_ip}")
+    
+    async with config_lock():
+        domain_set_store.write(list_name, names)
+        domains_data = domain_manager.load_domains()
+        domains_data.setdefault("block_lists", {})[list_name] = block_list
+        domain_manager.save_domains(domains_data)
+        await apply_configs()
+    
+    await manager.broadcast({"type": "block_list_updated", "name": list_name, "block_list": block_list})
+    return {"success": True, "name": list_name, "skipped": skipped, **block_list}
+
+@app.delete("/api/block-lists/{list_name}")
+async def delete_block_list(list_name: str, request: Request):
+    client_ip = get_client_ip(request)
+    logger.info(f"Removing block list '{list_name}' from IP: {client_ip}")
+    
+    async with config_lock():
+        domains_data = domain_manager.load_domains()
+        if list_name not in domains_data.get("block_lists", {}):
+            raise HTTPException(status_code=404, detail="Block list not found")
+        del domains_data["block_lists"][list_name]
+        domain_manager.save_domains(domains_data)
+        await apply_configs()
+        domain_set_store.remove(list_name)
+    
+    await manager.broadcast({"type": "block_list_removed", "name": list_name})
+    return {"success": True}
+
+@app.get("/api/groups")
+async def get_groups():
+    """Группы клиентов и число доменов, назначенных каждой"""
+    domains_data = domain_manager.load_domains()
+    groups = domains_data.get("groups", {})
+    counts = {name: 0 for name in groups}
+    for domain in domains_data.get("domains", []):
+        for name in domain.get("groups") or []:
+            if name in counts:
+                counts[name] += 1
+    return {"groups": {name: {**group, "domains": counts[name]} for name, group in groups.items()}}
+
+@app.put("/api/groups/{group_name}")
+async def put_group(group_name: str, group_data: dict, request: Request):
+    """
+    Создать или изменить группу клиентов: "clients" - список IP/CIDR.
+    SmartDNS различает клиентов только по адресу источника.
+    """
+    client_ip = get_client_ip(request)
+    if not GROUP_NAME_PATTERN.match(group_name):
+        raise HTTPException(status_code=400, detail="Group name must match [a-z0-9][a-z0-9_-]{0,31}")
+    clients = group_data.get("clients")
+    if not isinstance(clients, list) or not clients:
+        raise HTTPException(status_code=400, detail="Field 'clients' must be a non-empty list of IP/CIDR")
+    try:
+        networks = [str(ipaddress.ip_network(str(client).strip(), strict=False)) for client in clients]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid client network: {e}")
+    
+    group = {"clients": list(dict.fromkeys(networks)), "description": str(group_data.get("description", ""))}
+    logger.info(f"Updating group '{group_name}' with {len(group['clients'])} networks from IP: {client_ip}")
+    
+    async with config_lock():
+        domains_data = domain_manager.load_domains()
+        domains_data.setdefault("groups", {})[group_name] = group
+        domain_manager.save_domains(domains_data)
+        await apply_configs()
+    
+    await manager.broadcast({"type": "group_updated", "group": group_name})
+    return {"success": True, "group": group_name, **group}
+
+@app.delete("/api/groups/{group_name}")
+async def delete_group(group_name: str, request: Request):
+    """Удаление группы; домены группы сначала нужно переназначить, иначе они станут общими"""
+    client_ip = get_client_ip(request)
+    logger.info(f"Removing group '{group_name}' from IP: {client_ip}")
+    
+    async with config_lock():
+        domains_data = domain_manager.load_domains()
+        if group_name not in domains_data.get("groups", {}):
+            raise HTTPException(status_code=404, detail="Group not found")
+        assigned = [d["name"] for d in domains_data.get("domains", []) if group_name in (d.get("groups") or [])]
+        if assigned:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Group has {len(assigned)} assigned domains, e.g. {', '.join(assigned[:5])}"
+            )
+        del domains_data["groups"][group_name]
+        domain_manager.save_domains(domains_data)
+        await apply_configs()
+    
+    await manager.broadcast({"type": "group_removed", "group": group_name})
+    return {"success": True}
+
+@app.get("/api/acl")
+async def get_acl():
+    """Allow-list клиентов и лимит запросов"""
+    acl = domain_manager.load_domains().get("acl", {})
+    return {
+        "enabled": acl.get("enabled", False),
+        "clients": acl.get("clients", []),
+        "rate_limit": {**ACL_DEFAULT_RATE_LIMIT, **acl.get("rate_limit", {})},
+        "internal_networks": ACL_INTERNAL_NETWORKS,
+        "ports": ACL_PORTS,
+    }
+
+@app.put("/api/acl")
+async def put_acl(acl_data: dict, request: Request):
+    """
+    Включить allow-list и задать лимит: SmartDNS получает acl-enable/client-rules,
+    хост - smartdns/ninja-dns.nft (применяется scripts/apply-nftables.sh)
+    """
+    client_ip = get_client_ip(request)
+    try:
+        clients = [str(ipaddress.ip_network(str(c).strip(), strict=False)) for c in acl_data.get("clients", [])]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid client network: {e}")
+    
+    rate_limit = {**ACL_DEFAULT_RATE_LIMIT, **(acl_data.get("rate_limit") or {})}
+    for key in ("qps", "burst"):
+        value = rate_limit[key]
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= 100000:
+            raise HTTPException(status_code=400, detail=f"Invalid rate_limit.{key} '{value}', expected 1..100000")
+    
+    enabled = bool(acl_data.get("enabled", False))
+    if enabled and not clients:
+        raise HTTPException(status_code=400, detail="Enabling the allow-list requires at least one client network")
+    
+    acl = {"enabled": enabled, "clients": list(dict.fromkeys(clients)), "rate_limit": rate_limit}
+    logger.info(f"Updating ACL: enabled={enabled}, {len(clients)} networks, {rate_limit} from IP: {client_ip}")
+    
+    async with config_lock():
+        domains_data = domain_manager.load_domains()
+        domains_data["acl"] = acl
+        domain_manager.save_domains(domains_data)
+        await apply_configs()
+    
+    await manager.broadcast({"type": "acl_updated"})
+    return {"success": True, **acl}
+
+@app.get("/api/acl/stats")
+async def get_acl_stats():
+    """Счетчики nftables: отклоненные (refused), срезанные лимитом (rate_limited), принятые"""
+    return load_counters(NFT_COUNTERS)
+
+@app.get("/api/quic/stats")
+async def get_quic_stats():
+    """Счетчики QUIC forwarder: потоки, отклоненные SNI, срезанные лимитом"""
+    if not QUIC_PROXY_ENABLED:
+        return {"available": False}
+    try:
+        with open(QUIC_STATS, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return {"available": False}
+    return {"available": True, "age_seconds": round(time.time() - stats["updated"], 1), **stats}
+
+@app.get("/api/sniproxy/stats")
+async def get_sniproxy_stats(unused_only: bool = False):
+    """
+    Нагрузка sniproxy по доменам (оценка с поправкой на выборку) и флаг unused:
+    ни одного соединения за SNIPROXY_UNUSED_DAYS
+    """
+    if not SNIPROXY_STREAM_LOG:
+        return {"available": False}
+    state = load_stream_stats()
+    if not state:
+        return {"available": False}
+    report = domain_report(state, SNIPROXY_UNUSED_DAYS * 86400)
+    return {
+        "available": True,
+        "age_seconds": round(time.time() - state["updated"], 1),
+        "sample_percent": state.get("sample_percent"),
+        "tracking_since": state.get("tracking_since"),
+        "unused_days": SNIPROXY_UNUSED_DAYS,
+        "unused": sum(1 for d in report if d["unused"]),
+        "domains": [d for d in report if d["unused"]] if unused_only else report,
+        "other": state.get("other", []),
+    }
+
+@app.get("/api/categories")
+async def get_categories():
+    """Настройки категорий и значения по умолчанию"""
+    domains_data = domain_manager.load_domains()
+    return {
+        "categories": domains_data.get("categories", {}),
+        "defaults": {key: spec["default"] for key, spec in DOMAIN_SETTINGS.items()},
+        "proxy_profiles": {
+            category: proxy_profile(domains_data, category)
+            for category in {*CATEGORY_PROXY_PROFILES, *domains_data.get("categories", {}), "misc"}
+        },
+    }
+
+@app.put("/api/categories/{category_name}")
+async def update_category(category_name: str, category_data: dict, request: Request):
+    """Задать настройки категории; домены без собственных значений наследуют их"""
+    client_ip = get_client_ip(request)
+    settings = validate_domain_settings(category_data)
+    if category_data.get("proxy") is not None:
+        settings["proxy"] = validate_proxy_profile(category_data["proxy"])
+    logger.info(f"Updating category '{category_name}' with {settings} from IP: {client_ip}")
+    
+    async with config_lock():
+        domains_data = domain_manager.load_domains()
+        domains_data.setdefault("categories", {})[category_name] = settings
+        domain_manager.save_domains(domains_data)
+        await apply_configs()
+    
+    await manager.broadcast({"type": "category_updated", "category": category_name, "settings": settings})
+    return {"success": True, "category": category_name, "settings": settings}
+
+@app.get("/api/upstreams")
+async def get_upstreams():
+    """Замеры апстримов и строки, которые попадут в конфиг SmartDNS"""
+    state = upstream_manager.load_state()
+    state["candidates"] = [c["url"] for c in upstream_manager.candidates]
+    state["config_lines"] = upstream_manager.server_lines()
+    return state
+
+@app.post("/api/upstreams/probe")
+async def probe_upstreams():
+    """Внеочередной замер апстримов (применяется при следующем обновлении конфигов)"""
+    return await upstream_manager.probe_all()
+
+@app.get("/api/warmup")
+async def get_warmup():
+    """Результат последнего прогрева кэша: длительность и доля попаданий"""
+    return load_run_state("warmup.json")
+
+@app.get("/api/query-stats")
+async def get_query_stats():
+    """Статистика audit-лога SmartDNS: QPS, доля попаданий в кэш, задержка апстрима, top-N имен"""
+    snapshot = load_run_state("query-stats.json")
+    if not snapshot:
+        return {"enabled": QUERY_LOG_ENABLED, "windows": {}, "top_hijacked": [], "top_other": []}
+    snapshot["enabled"] = QUERY_LOG_ENABLED
+    return snapshot
+
 @app.get("/api/status")
 async def get_status():
-    return domain_manager.get_service_status()
+    # Вызовы Docker API синхронные: в пуле потоков, чтобы не блокировать остальные запросы
+    return await asyncio.to_thread(domain_manager.get_service_status)
+
+@app.get("/api/config/state")
+async def get_config_state():
+    """Применен ли текущий domains.json: клиенты ждут in_sync вместо фиксированных пауз"""
+    state = load_run_state("apply.json")
+    current = config_hash()
+    return {
+        "config_hash": current,
+        "applied_hash": state.get("config_hash"),
+        "in_sync": current is not None and current == state.get("config_hash"),
+        "status": state.get("status"),
+        "applied_at": state.get("applied_at"),
+        "error": state.get("error"),
+    }
 
 
 
@@ -551,8 +1934,12 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         while True:
             # Send periodic status updates
-            status = domain_manager.get_service_status()
+            status = await asyncio.to_thread(domain_manager.get_service_status)
             await websocket.send_json({"type": "status_update", "status": status})
+            # Свежие снимки query_stats приходят рассылкой лидера; здесь последний для новых клиентов
+            stats = load_run_state("query-stats.json")
+            if stats:
+                await websocket.send_json({"type": "query_stats", "stats": stats})
             await asyncio.sleep(30)  # Update every 30 seconds
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -563,16 +1950,12 @@ async def download_page(request: Request):
     client_ip = get_client_ip(request)
     logger.info(f"Download page accessed from IP: {client_ip}")
     
-    # Получаем информацию о профиле для отображения
-    generator = MobileConfigGenerator(HOST_DOMAIN, SERVER_IP)
-    profile_info = generator.get_profile_info()
-    
-    return templates.TemplateResponse("download.html", {
-        "request": request,
-        "profile_info": profile_info,
+    page = page_cache.get("download.html", lambda: {
+        "profile_info": MobileConfigGenerator(HOST_DOMAIN, SERVER_IP).get_profile_info(),
         "host_domain": HOST_DOMAIN,
         "server_ip": SERVER_IP
     })
+    return page.response(request, "public, no-cache")
 
 @app.get("/api/profile-info")
 async def get_profile_info():
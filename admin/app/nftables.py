@@ -0,0 +1,118 @@
+"""
+nftables ruleset against open-resolver abuse
+Allow-list и ограничение запросов с одного адреса на портах DNS до SmartDNS:
+флуд отбрасывается в ядре и не тратит CPU резолвера.
+Файл применяется на хосте скриптом scripts/apply-nftables.sh.
+"""
+
+import ipaddress
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List
+
+TABLE = "ninja_dns"
+
+
+def split_networks(networks: Iterable[str]) -> Dict[int, List[str]]:
+    result = {4: [], 6: []}
+    for network in networks:
+        parsed = ipaddress.ip_network(network, strict=False)
+        result[parsed.version].append(str(parsed))
+    return result
+
+
+def _set(name: str, family: str, elements: List[str]) -> List[str]:
+    lines = [f"    set {name} {{", f"        type {family}_addr", "        flags interval"]
+    if elements:
+        lines.append(f"        elements = {{ {', '.join(elements)} }}")
+    lines.append("    }")
+    return lines
+
+
+def render_ruleset(allowed: Iterable[str], internal: Iterable[str], acl_enabled: bool,
+                   qps: int, burst: int, ports: Iterable[int]) -> str:
+    """
+    Таблица inet ninja_dns на портах ports: внутренние сети без ограничений, разрешенные
+    клиенты через лимит qps/burst на адрес, остальные (при включенном ACL) отбрасываются
+    со счетчиком refused
+    """
+    allowed, internal = split_networks(allowed), split_networks(internal)
+    port_list = ", ".join(str(p) for p in ports)
+
+    lines = [
+        "# Generated by Ninja DNS admin, apply with scripts/apply-nftables.sh",
+        f"table inet {TABLE} {{}}",
+        f"delete table inet {TABLE}",
+        f"table inet {TABLE} {{",
+        "    counter refused {}",
+        "    counter rate_limited {}",
+        "    counter accepted {}",
+    ]
+    for version, family in ((4, "ipv4"), (6, "ipv6")):
+        lines += _set(f"internal_v{version}", family, internal[version])
+        lines += _set(f"allowed_v{version}", family, allowed[version])
+        lines += [
+            f"    set rate_v{version} {{",
+            f"        type {family}_addr",
+            "        size 65535",
+            "        flags dynamic,timeout",
+            "        timeout 1m",
+            "    }",
+        ]
+
+    lines += [
+        # Published ports are DNATed by Docker: filter before dstnat (-100)
+        "    chain prerouting {",
+        "        type filter hook prerouting priority -150; policy accept;",
+        f"        meta l4proto {{ udp, tcp }} th dport {{ {port_list} }} jump dns",
+        "    }",
+        # Queries from the host itself (loopback) never pass prerouting
+        "    chain output {",
+        "        type filter hook output priority -150; policy accept;",
+        f"        oifname \"lo\" meta l4proto {{ udp, tcp }} th dport {{ {port_list} }} jump dns",
+        "    }",
+        "    chain dns {",
+        "        ip saddr @internal_v4 accept",
+        "        ip6 saddr @internal_v6 accept",
+    ]
+    if acl_enabled:
+        lines += [
+            "        ip saddr @allowed_v4 jump rate",
+            "        ip6 saddr @allowed_v6 jump rate",
+            "        counter name refused drop",
+        ]
+    else:
+        lines.append("        jump rate")
+    lines += [
+        "    }",
+        "    chain rate {",
+        f"        update @rate_v4 {{ ip saddr limit rate over {qps}/second burst {burst} packets }} "
+        "counter name rate_limited drop",
+        f"        update @rate_v6 {{ ip6 saddr limit rate over {qps}/second burst {burst} packets }} "
+        "counter name rate_limited drop",
+        "        counter name accepted",
+        "    }",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def load_counters(path: str) -> Dict[str, Any]:
+    """
+    Счетчики из выгрузки `apply-nftables.sh --stats` (nft -j list counters).
+    Возвращает packets/bytes по имени и возраст выгрузки.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        age = time.time() - os.path.getmtime(path)
+    except (OSError, ValueError):
+        return {"available": False}
+
+    counters = {}
+    for item in data.get("nftables", []):
+        counter = item.get("counter")
+        if counter and counter.get("table") == TABLE:
+            counters[counter["name"]] = {"packets": counter.get("packets", 0), "bytes": counter.get("bytes", 0)}
+    return {"available": True, "age_seconds": round(age, 1), "counters": counters}
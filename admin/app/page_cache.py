@@ -0,0 +1,144 @@
+"""
+Pre-rendered pages and static assets for the admin
+Страницы рендерятся один раз на версию конфигурации и хранятся в памяти
+вместе со сжатыми вариантами (gzip/brotli) и ETag на каждый вариант
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него отдаем gzip
+    brotli = None
+
+# Типы, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "image/svg+xml", "application/xml"
+)
+MIN_COMPRESS_SIZE = 256
+
+
+class CachedBody:
+    """
+    Тело ответа с готовыми вариантами кодирования
+
+    У каждого варианта свой ETag (суффикс -gz/-br): байты разные, и кэш
+    не должен отдать сжатый вариант клиенту, который запросил identity.
+    """
+
+    SUFFIXES = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+    def __init__(self, body: bytes, media_type: str):
+        self.media_type = media_type
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.variants: Dict[str, bytes] = {"identity": body}
+
+        if media_type.startswith(COMPRESSIBLE_TYPES) and len(body) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=11)
+        self.etags = {encoding: f'"{digest}{self.SUFFIXES[encoding]}"' for encoding in self.variants}
+
+    def choose_encoding(self, accept_encoding: str) -> str:
+        """Выбор лучшего варианта по Accept-Encoding (без разбора q-значений)"""
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return "identity"
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        encoding = self.choose_encoding(request.headers.get("accept-encoding", ""))
+        etag = self.etags[encoding]
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
+
+
+class PageCache:
+    """Кэш отрендеренных Jinja шаблонов и JSON ответов, сбрасываемый при смене версии конфигурации"""
+
+    def __init__(self, templates, version: Callable[[], Hashable]):
+        self.templates = templates
+        self.version = version
+        self._pages: Dict[str, tuple[Hashable, CachedBody]] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key: str, build: Callable[[], CachedBody]) -> CachedBody:
+        version = self.version()
+        cached = self._pages.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            page = build()
+            self._pages[key] = (version, page)
+            return page
+
+    def get(self, template_name: str, context: Callable[[], Dict[str, Any]]) -> CachedBody:
+        return self._cached(template_name, lambda: CachedBody(
+            self.templates.get_template(template_name).render(**context()).encode("utf-8"),
+            "text/html; charset=utf-8",
+        ))
+
+    def get_json(self, key: str, data: Callable[[], Any]) -> CachedBody:
+        """JSON ответ API; сериализация как у JSONResponse, чтобы клиенты не заметили разницы"""
+        return self._cached(f"json:{key}", lambda: CachedBody(
+            json.dumps(data(), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8"),
+            "application/json",
+        ))
+
+    def invalidate(self):
+        with self._lock:
+            self._pages.clear()
+
+
+class StaticAssets:
+    """Статические файлы из памяти со сжатыми вариантами и ревалидацией по ETag"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._assets: Optional[Dict[str, CachedBody]] = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        assets: Dict[str, CachedBody] = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    body = f.read()
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                assets[rel_path] = CachedBody(body, media_type)
+        self._assets = assets
+
+    def _ensure_loaded(self):
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self._load()
+
+    def response(self, request: Request, path: str) -> Optional[Response]:
+        self._ensure_loaded()
+        if path in self._assets:
+            return self._assets[path].response(request, "public, no-cache")
+        return None
@@ -0,0 +1,405 @@
+"""
+SmartDNS query-log analytics
+Инкрементально читает audit-лог SmartDNS (inode + смещение, переживает ротацию)
+и сводит запросы в скользящие окна фиксированного размера и top-N имен
+"""
+
+import heapq
+import logging
+import os
+import re
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# [2024-01-01 12:00:00,123] 1.2.3.4 query example.com, type 1, time 12ms, speed: 3.1ms, group default, result 5.6.7.8
+AUDIT_LINE = re.compile(
+    r"^\[([^\]]*)\]\s+(\S+)\s+query\s+([^,\s]+),\s*type\s+(\d+),\s*time\s+(\d+)ms(?:.*?,\s*result\s*(.*))?$"
+)
+
+# Верхние границы корзин гистограммы задержки апстрима, мс; последняя - все, что дольше
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 2000, 5000)
+
+# Поля строки окна: запросы, перехваченные, попадания в кэш, промахи, сумма задержки промахов
+FIELDS = ("queries", "hijacked", "hits", "misses", "upstream_ms")
+_QUERIES, _HIJACKED, _HITS, _MISSES, _UPSTREAM_MS = range(len(FIELDS))
+
+
+class LogTailer:
+    """
+    tail -F для одного файла: держит дескриптор открытым и помнит inode и смещение
+
+    После ротации (переименование или удаление и новый файл) дочитывает старый
+    дескриптор до конца и переходит к новому файлу с начала; усечение на месте
+    (copytruncate) начинает чтение с нуля. За один вызов читается не больше
+    max_read байт, а отставание больше max_backlog пропускается.
+    """
+
+    def __init__(self, path: str, max_read: int = 4 << 20, max_backlog: int = 64 << 20,
+                 max_line: int = 64 << 10, start_at_end: bool = True):
+        self.path = path
+        self.max_read = max_read
+        self.max_backlog = max_backlog
+        self.max_line = max_line
+        self.start_at_end = start_at_end
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.stats = {"lines": 0, "rotations": 0, "truncations": 0, "skipped_bytes": 0}
+        self._file = None
+        self._partial = b""
+
+    def _open(self, st: os.stat_result, at_end: bool):
+        self.close()
+        try:
+            self._file = open(self.path, "rb")
+        except OSError as e:
+            logger.warning(f"Cannot open query log {self.path}: {e}")
+            return
+        self.inode = os.fstat(self._file.fileno()).st_ino
+        self.offset = st.st_size if at_end else 0
+        self._file.seek(self.offset)
+        self._partial = b""
+
+    def _read(self, limit: int) -> bytes:
+        data = self._file.read(limit)
+        self.offset += len(data)
+        return data
+
+    def _split(self, data: bytes) -> List[str]:
+        complete, newline, self._partial = (self._partial + data).rpartition(b"\n")
+        if len(self._partial) > self.max_line:
+            # Строка без перевода строки длиннее разумной: не копим ее в памяти
+            self.stats["skipped_bytes"] += len(self._partial)
+            self._partial = b""
+        if not newline:
+            return []
+        # Граница полных строк не режет многобайтовые символы: декодируем блок целиком
+        lines = complete.decode("utf-8", "replace").split("\n")
+        self.stats["lines"] += len(lines)
+        return lines
+
+    def read_lines(self) -> List[str]:
+        """Новые полные строки с прошлого вызова"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+
+        lines: List[str] = []
+        if self._file is None:
+            if st is None:
+                return lines
+            self._open(st, self.start_at_end)
+            if self._file is None:
+                return lines
+        elif st is not None and st.st_ino != self.inode:
+            # Ротация: хвост старого файла еще доступен через открытый дескриптор
+            lines.extend(self._split(self._read(self.max_read)))
+            self.stats["rotations"] += 1
+            self._open(st, False)
+            if self._file is None:
+                return lines
+        elif st is not None and st.st_size < self.offset:
+            self.stats["truncations"] += 1
+            self._file.seek(0)
+            self.offset = 0
+            self._partial = b""
+
+        size = os.fstat(self._file.fileno()).st_size
+        if size - self.offset > self.max_backlog:
+            skip_to = size - self.max_read
+            self.stats["skipped_bytes"] += skip_to - self.offset
+            self._file.seek(skip_to)
+            self.offset = skip_to
+            # Первая строка после прыжка почти наверняка неполная
+            self._partial = b""
+            self._file.readline()
+            self.offset = self._file.tell()
+
+        lines.extend(self._split(self._read(self.max_read)))
+        return lines
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RollingWindow:
+    """
+    Скользящее окно из slots ячеек по slot_seconds в плоских массивах
+
+    Память не зависит от числа запросов: строка FIELDS и гистограмма задержки
+    на ячейку. Ячейка переиспользуется по кругу, устаревшая обнуляется при записи.
+    """
+
+    def __init__(self, slots: int, slot_seconds: float):
+        self.slots = slots
+        self.slot_seconds = slot_seconds
+        self.values = array("d", bytes(8 * slots * len(FIELDS)))
+        self.histogram = array("I", bytes(4 * slots * (len(LATENCY_BUCKETS_MS) + 1)))
+        self.slot_ids = array("q", [-1] * slots)
+
+    def _row(self, now: float) -> int:
+        slot_id = int(now // self.slot_seconds)
+        index = slot_id % self.slots
+        if self.slot_ids[index] != slot_id:
+            self.slot_ids[index] = slot_id
+            width = len(FIELDS)
+            self.values[index * width:(index + 1) * width] = array("d", bytes(8 * width))
+            buckets = len(LATENCY_BUCKETS_MS) + 1
+            self.histogram[index * buckets:(index + 1) * buckets] = array("I", bytes(4 * buckets))
+        return index
+
+    def add(self, now: float, counts: List[float], histogram: List[int]):
+        """Добавить накопленные за опрос счетчики (порядок FIELDS) в ячейку now"""
+        index = self._row(now)
+        base = index * len(FIELDS)
+        for i, value in enumerate(counts):
+            self.values[base + i] += value
+        base = index * len(histogram)
+        for i, value in enumerate(histogram):
+            if value:
+                self.histogram[base + i] += value
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        current = int(now // self.slot_seconds)
+        totals = [0.0] * len(FIELDS)
+        buckets = len(LATENCY_BUCKETS_MS) + 1
+        histogram = [0] * buckets
+        for index, slot_id in enumerate(self.slot_ids):
+            if slot_id < 0 or not current - self.slots < slot_id <= current:
+                continue
+            for i in range(len(FIELDS)):
+                totals[i] += self.values[index * len(FIELDS) + i]
+            for i in range(buckets):
+                histogram[i] += self.histogram[index * buckets + i]
+
+        seconds = self.slots * self.slot_seconds
+        queries, hijacked, hits, misses, upstream_ms = totals
+        lookups = hits + misses
+        return {
+            "seconds": seconds,
+            "queries": int(queries),
+            "qps": round(queries / seconds, 2),
+            "hijacked": int(hijacked),
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "upstream_ms": {
+                "avg": round(upstream_ms / misses, 1) if misses else None,
+                "p50": _percentile(histogram, 0.50),
+                "p95": _percentile(histogram, 0.95),
+                "p99": _percentile(histogram, 0.99),
+            },
+        }
+
+
+def _percentile(histogram: List[int], q: float) -> Optional[float]:
+    """Верхняя граница корзины, в которую попадает квантиль; None без данных"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+
+def _bucket(latency_ms: int) -> int:
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+class SpaceSaving:
+    """
+    Приближенный top-N (Space-Saving): не больше capacity счетчиков
+
+    Новое имя при заполненной таблице вытесняет минимальное и наследует его
+    счет как ошибку; реальный счет имени лежит в [count - error, count].
+    Минимум ищется через кучу с ленивым удалением устаревших записей.
+    """
+
+    def __init__(self, capacity: int, on_evict: Optional[Callable[[str], None]] = None):
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._heap: List[tuple] = []
+
+    def add(self, name: str, amount: int = 1):
+        if name in self.counts:
+            self.counts[name] += amount
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[name] = amount
+            self.errors[name] = 0
+            heapq.heappush(self._heap, (amount, name))
+            return
+        # У каждого имени одна запись в куче, счет в ней не больше текущего
+        while True:
+            count, victim = heapq.heappop(self._heap)
+            if self.counts[victim] == count:
+                break
+            heapq.heappush(self._heap, (self.counts[victim], victim))
+        del self.counts[victim]
+        del self.errors[victim]
+        if self.on_evict is not None:
+            self.on_evict(victim)
+        self.counts[name] = count + amount
+        self.errors[name] = count
+        heapq.heappush(self._heap, (count + amount, name))
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        names = heapq.nlargest(n, self.counts, key=self.counts.__getitem__)
+        return [{"name": name, "count": self.counts[name], "error": self.errors[name]} for name in names]
+
+
+class QueryStats:
+    """
+    Сводка audit-лога SmartDNS: QPS, доля попаданий в кэш, задержка апстрима, top-N
+
+    Перехваченный запрос - имя из domains.json (или поддомен) либо ответ с
+    адресом сервера. Для остальных признака попадания в audit-логе нет:
+    время обработки не больше hit_threshold_ms считаем кэшем, иначе промахом
+    с задержкой апстрима. Окна считаются по времени чтения лога, расхождение
+    не больше интервала опроса.
+    """
+
+    def __init__(self, tailer: LogTailer, hijack_ips: Iterable[str] = (), hit_threshold_ms: int = 1,
+                 top_capacity: int = 500, top_window: float = 900.0, related=None):
+        self.tailer = tailer
+        # CoQueryAnalyzer (app.related_domains): получает каждый разобранный запрос со временем из лога
+        self.related = related
+        self._stamp = ("", 0.0)
+        self.hijack_ips = {ip for ip in hijack_ips if ip}
+        self.hit_threshold_ms = hit_threshold_ms
+        self.top_capacity = top_capacity
+        self.top_window = top_window
+        self.domains: frozenset = frozenset()
+        self.windows = {"1m": RollingWindow(60, 1.0), "1h": RollingWindow(60, 60.0)}
+        # Текущий и предыдущий интервалы top-N: отчет по последним top_window..2*top_window секундам
+        self._top = {kind: [SpaceSaving(top_capacity), SpaceSaving(top_capacity)] for kind in ("hijacked", "other")}
+        self._top_started = time.monotonic()
+        self.unparsed = 0
+
+    @classmethod
+    def from_env(cls, path: str, hijack_ips: Iterable[str] = (), related=None) -> "QueryStats":
+        return cls(
+            LogTailer(path, max_read=int(os.getenv("QUERY_LOG_MAX_READ", str(4 << 20)))),
+            hijack_ips,
+            hit_threshold_ms=int(os.getenv("QUERY_LOG_HIT_THRESHOLD_MS", "1")),
+            top_capacity=int(os.getenv("QUERY_LOG_TOP_CAPACITY", "500")),
+            top_window=float(os.getenv("QUERY_LOG_TOP_WINDOW", "900")),
+            related=related,
+        )
+
+    def set_domains(self, names: Iterable[str]):
+        self.domains = frozenset(name.rstrip(".").lower() for name in names)
+
+    def hijacked_domain(self, name: str, result: Optional[str]) -> Optional[str]:
+        """Домен из domains.json, под который попадает имя; само имя, если перехвачено только по адресу"""
+        domains = self.domains
+        suffix = name
+        while suffix:
+            if suffix in domains:
+                return suffix
+            _, _, suffix = suffix.partition(".")
+        if result and self.hijack_ips and any(ip.strip() in self.hijack_ips for ip in result.split(",")):
+            return name
+        return None
+
+    def is_hijacked(self, name: str, result: Optional[str]) -> bool:
+        return self.hijacked_domain(name, result) is not None
+
+    def log_time(self, stamp: str) -> float:
+        """Время строки лога "2024-01-01 12:00:00,123"; секунды разбираются раз на новую секунду"""
+        seconds, _, fraction = stamp.partition(",")
+        if seconds != self._stamp[0]:
+            try:
+                self._stamp = (seconds, time.mktime(time.strptime(seconds, "%Y-%m-%d %H:%M:%S")))
+            except ValueError:
+                return time.time()
+        return self._stamp[1] + (int(fraction) / 10 ** len(fraction) if fraction.isdigit() else 0.0)
+
+    def _rotate_top(self):
+        if time.monotonic() - self._top_started < self.top_window:
+            return
+        self._top_started = time.monotonic()
+        for pair in self._top.values():
+            pair[1] = pair[0]
+            pair[0] = SpaceSaving(self.top_capacity)
+
+    def poll(self, now: Optional[float] = None) -> int:
+        """Прочитать новые строки лога и добавить их в окна; возвращает число запросов"""
+        now = time.time() if now is None else now
+        self._rotate_top()
+        counts = [0.0] * len(FIELDS)
+        histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        # Сначала сворачиваем имена опроса в словари: в Space-Saving идет по одному add на имя
+        names: Dict[bool, Dict[str, int]] = {True: {}, False: {}}
+        related = self.related
+        for line in self.tailer.read_lines():
+            match = AUDIT_LINE.match(line)
+            if not match:
+                self.unparsed += 1
+                continue
+            stamp, client, name, qtype, elapsed, result = match.groups()
+            name = name.rstrip(".").lower()
+            elapsed_ms = int(elapsed)
+            counts[_QUERIES] += 1
+            anchor = self.hijacked_domain(name, result)
+            hijacked = anchor is not None
+            if related is not None:
+                related.observe(self.log_time(stamp), client, name, int(qtype), anchor)
+            if hijacked:
+                counts[_HIJACKED] += 1
+            elif elapsed_ms <= self.hit_threshold_ms:
+                counts[_HITS] += 1
+            else:
+                counts[_MISSES] += 1
+                counts[_UPSTREAM_MS] += elapsed_ms
+                histogram[_bucket(elapsed_ms)] += 1
+            bucket = names[hijacked]
+            bucket[name] = bucket.get(name, 0) + 1
+
+        if counts[_QUERIES]:
+            for window in self.windows.values():
+                window.add(now, counts, histogram)
+            for hijacked, kind in ((True, "hijacked"), (False, "other")):
+                current = self._top[kind][0]
+                for name, amount in names[hijacked].items():
+                    current.add(name, amount)
+        return int(counts[_QUERIES])
+
+    def top(self, kind: str, n: int) -> List[Dict[str, Any]]:
+        current, previous = self._top[kind]
+        merged: Dict[str, List[int]] = {}
+        for table in (previous, current):
+            for name, count in table.counts.items():
+                entry = merged.setdefault(name, [0, 0])
+                entry[0] += count
+                entry[1] += table.errors[name]
+        names = heapq.nlargest(n, merged, key=lambda name: merged[name][0])
+        return [{"name": name, "count": merged[name][0], "error": merged[name][1]} for name in names]
+
+    def snapshot(self, top_n: int = 20, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        return {
+            "updated_at": now,
+            "windows": {label: window.summary(now) for label, window in self.windows.items()},
+            "top_hijacked": self.top("hijacked", top_n),
+            "top_other": self.top("other", top_n),
+            "tailer": dict(self.tailer.stats, path=self.tailer.path, offset=self.tailer.offset,
+                           unparsed=self.unparsed),
+        }
+
+    def close(self):
+        self.tailer.close()
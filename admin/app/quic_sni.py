@@ -0,0 +1,283 @@
+"""
+QUIC Initial packet parsing: SNI from the client's ClientHello
+Ключи Initial выводятся из DCID (RFC 9001, 5.2), поэтому ClientHello можно
+расшифровать без участия в рукопожатии - как ssl_preread для TCP.
+Поддерживаются QUIC v1 и v2; ClientHello может занимать несколько пакетов.
+"""
+
+import hashlib
+import hmac
+import struct
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+QUIC_V1 = 0x00000001
+QUIC_V2 = 0x6B3343CF
+
+# Соль, метки HKDF и тип Initial пакета для каждой версии
+VERSIONS = {
+    QUIC_V1: {
+        "salt": bytes.fromhex("38762cf7f55934b34d179ae6a4c80cadccbb7f0a"),
+        "labels": ("quic key", "quic iv", "quic hp"),
+        "initial_type": 0,
+    },
+    QUIC_V2: {
+        "salt": bytes.fromhex("0dede3def700a6db819381be6e269dcbf9bd2ed9"),
+        "labels": ("quicv2 key", "quicv2 iv", "quicv2 hp"),
+        "initial_type": 1,
+    },
+}
+
+FRAME_PADDING = 0x00
+FRAME_PING = 0x01
+FRAME_ACK = 0x02
+FRAME_ACK_ECN = 0x03
+FRAME_CRYPTO = 0x06
+
+# Предел буфера ClientHello: с постквантовыми ключами он занимает 2-3 пакета
+MAX_CRYPTO_BYTES = 16384
+
+
+class InitialPacket(NamedTuple):
+    version: int
+    dcid: bytes
+    scid: bytes
+    token: bytes
+    packet_number: int
+    payload: bytes
+
+
+class InitialKeys(NamedTuple):
+    key: bytes
+    iv: bytes
+    hp: bytes
+
+
+def read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    """QUIC variable-length integer: (значение, новое смещение)"""
+    first = data[offset]
+    length = 1 << (first >> 6)
+    value = first & 0x3F
+    for byte in data[offset + 1:offset + length]:
+        value = (value << 8) | byte
+    if offset + length > len(data):
+        raise ValueError("Truncated varint")
+    return value, offset + length
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0x40:
+        return struct.pack(">B", value)
+    if value < 0x4000:
+        return struct.pack(">H", value | 0x4000)
+    if value < 0x40000000:
+        return struct.pack(">I", value | 0x80000000)
+    return struct.pack(">Q", value | 0xC000000000000000)
+
+
+def _hkdf_expand_label(secret: bytes, label: str, length: int) -> bytes:
+    full_label = b"tls13 " + label.encode("ascii")
+    info = struct.pack(">HB", length, len(full_label)) + full_label + b"\x00"
+    output, block, counter = b"", b"", 1
+    while len(output) < length:
+        block = hmac.new(secret, block + info + bytes([counter]), hashlib.sha256).digest()
+        output += block
+        counter += 1
+    return output[:length]
+
+
+def initial_keys(dcid: bytes, version: int = QUIC_V1, server: bool = False) -> InitialKeys:
+    params = VERSIONS[version]
+    initial_secret = hmac.new(params["salt"], dcid, hashlib.sha256).digest()
+    secret = _hkdf_expand_label(initial_secret, "server in" if server else "client in", 32)
+    key_label, iv_label, hp_label = params["labels"]
+    return InitialKeys(
+        _hkdf_expand_label(secret, key_label, 16),
+        _hkdf_expand_label(secret, iv_label, 12),
+        _hkdf_expand_label(secret, hp_label, 16),
+    )
+
+
+def _header_mask(hp_key: bytes, sample: bytes) -> bytes:
+    encryptor = Cipher(algorithms.AES(hp_key), modes.ECB()).encryptor()
+    return encryptor.update(sample) + encryptor.finalize()
+
+
+def _nonce(iv: bytes, packet_number: int) -> bytes:
+    return bytes(a ^ b for a, b in zip(iv, packet_number.to_bytes(12, "big")))
+
+
+def is_initial(datagram: bytes) -> bool:
+    """Длинный заголовок известной версии с типом Initial"""
+    if len(datagram) < 7 or not datagram[0] & 0x80:
+        return False
+    version = struct.unpack(">I", datagram[1:5])[0]
+    params = VERSIONS.get(version)
+    return params is not None and (datagram[0] >> 4) & 0x03 == params["initial_type"]
+
+
+def parse_initial(datagram: bytes) -> InitialPacket:
+    """Расшифровка первого Initial пакета датаграммы (ValueError, если это не Initial)"""
+    if not is_initial(datagram):
+        raise ValueError("Not a QUIC Initial packet")
+    version = struct.unpack(">I", datagram[1:5])[0]
+    offset = 5
+    dcid = datagram[offset + 1:offset + 1 + datagram[offset]]
+    offset += 1 + datagram[offset]
+    scid = datagram[offset + 1:offset + 1 + datagram[offset]]
+    offset += 1 + datagram[offset]
+    token_length, offset = read_varint(datagram, offset)
+    token = datagram[offset:offset + token_length]
+    offset += token_length
+    length, pn_offset = read_varint(datagram, offset)
+    if pn_offset + length > len(datagram) or length < 20:
+        raise ValueError("Truncated Initial packet")
+
+    keys = initial_keys(dcid, version)
+    mask = _header_mask(keys.hp, datagram[pn_offset + 4:pn_offset + 20])
+    first = datagram[0] ^ (mask[0] & 0x0F)
+    pn_length = (first & 0x03) + 1
+    pn_bytes = bytes(b ^ m for b, m in zip(datagram[pn_offset:pn_offset + pn_length], mask[1:]))
+    packet_number = int.from_bytes(pn_bytes, "big")
+
+    header = bytes([first]) + datagram[1:pn_offset] + pn_bytes
+    ciphertext = datagram[pn_offset + pn_length:pn_offset + length]
+    try:
+        payload = AESGCM(keys.key).decrypt(_nonce(keys.iv, packet_number), ciphertext, header)
+    except Exception as e:
+        raise ValueError(f"Initial packet decryption failed: {e}")
+    return InitialPacket(version, dcid, scid, token, packet_number, payload)
+
+
+def build_initial(dcid: bytes, scid: bytes, payload: bytes, packet_number: int = 0,
+                  version: int = QUIC_V1, server: bool = False) -> bytes:
+    """Initial пакет с защитой заголовка (для стендов и тестов), дополненный до 1200 байт"""
+    keys = initial_keys(dcid, version, server)
+    pn_length = 4
+    # Клиентские Initial датаграммы должны быть не короче 1200 байт
+    overhead = 1 + 4 + 1 + len(dcid) + 1 + len(scid) + 1 + 2 + pn_length + 16
+    if not server and overhead + len(payload) < 1200:
+        payload += bytes(1200 - overhead - len(payload))
+    first = 0xC0 | (VERSIONS[version]["initial_type"] << 4) | (pn_length - 1)
+    length = pn_length + len(payload) + 16
+    header = (
+        bytes([first]) + struct.pack(">I", version)
+        + bytes([len(dcid)]) + dcid + bytes([len(scid)]) + scid
+        + encode_varint(0) + struct.pack(">H", length | 0x4000)
+    )
+    pn_bytes = packet_number.to_bytes(pn_length, "big")
+    ciphertext = AESGCM(keys.key).encrypt(_nonce(keys.iv, packet_number), payload, header + pn_bytes)
+    mask = _header_mask(keys.hp, ciphertext[4 - pn_length:20 - pn_length])
+    protected_first = bytes([first ^ (mask[0] & 0x0F)])
+    protected_pn = bytes(b ^ m for b, m in zip(pn_bytes, mask[1:]))
+    return protected_first + header[1:] + protected_pn + ciphertext
+
+
+def crypto_frames(payload: bytes) -> List[Tuple[int, bytes]]:
+    """CRYPTO фреймы (смещение, данные) из расшифрованного Initial"""
+    frames, offset = [], 0
+    while offset < len(payload):
+        frame_type = payload[offset]
+        offset += 1
+        if frame_type in (FRAME_PADDING, FRAME_PING):
+            continue
+        if frame_type in (FRAME_ACK, FRAME_ACK_ECN):
+            _, offset = read_varint(payload, offset)  # largest acknowledged
+            _, offset = read_varint(payload, offset)  # ack delay
+            ranges, offset = read_varint(payload, offset)
+            _, offset = read_varint(payload, offset)  # first range
+            for _ in range(ranges * 2):
+                _, offset = read_varint(payload, offset)
+            if frame_type == FRAME_ACK_ECN:
+                for _ in range(3):
+                    _, offset = read_varint(payload, offset)
+            continue
+        if frame_type == FRAME_CRYPTO:
+            crypto_offset, offset = read_varint(payload, offset)
+            length, offset = read_varint(payload, offset)
+            frames.append((crypto_offset, payload[offset:offset + length]))
+            offset += length
+            continue
+        # Остальные фреймы в клиентском Initial не несут ClientHello
+        break
+    return frames
+
+
+def _field(data: bytes, offset: int, size: int, end: int) -> int:
+    """Целое big-endian в пределах end; длины из пакета не должны выводить за сообщение"""
+    if offset + size > end:
+        raise ValueError("Truncated ClientHello")
+    return int.from_bytes(data[offset:offset + size], "big")
+
+
+def sni_from_client_hello(data: bytes) -> Optional[str]:
+    """
+    SNI из TLS ClientHello (handshake сообщение без record-заголовка).
+    None - сообщение еще не собрано; ValueError - это не ClientHello, оно повреждено или SNI нет.
+    """
+    if len(data) < 4:
+        return None
+    if data[0] != 1:
+        raise ValueError("Not a ClientHello")
+    length = int.from_bytes(data[1:4], "big")
+    if len(data) < 4 + length:
+        return None
+
+    end = 4 + length
+    offset = 4 + 2 + 32
+    offset += 1 + _field(data, offset, 1, end)  # session id
+    offset += 2 + _field(data, offset, 2, end)  # cipher suites
+    offset += 1 + _field(data, offset, 1, end)  # compression methods
+    extensions_end = offset + 2 + _field(data, offset, 2, end)
+    if extensions_end > end:
+        raise ValueError("Truncated ClientHello extensions")
+    offset += 2
+    while offset + 4 <= extensions_end:
+        ext_type, ext_length = _field(data, offset, 2, end), _field(data, offset + 2, 2, end)
+        offset += 4
+        if offset + ext_length > extensions_end:
+            raise ValueError("Truncated ClientHello extension")
+        if ext_type == 0:
+            names_end = offset + 2 + _field(data, offset, 2, end)
+            if names_end > offset + ext_length:
+                raise ValueError("Truncated server_name extension")
+            position = offset + 2
+            while position + 3 <= names_end:
+                name_type, name_length = _field(data, position, 1, end), _field(data, position + 1, 2, end)
+                position += 3
+                if position + name_length > names_end:
+                    raise ValueError("Truncated server name")
+                if name_type == 0:
+                    return data[position:position + name_length].decode("ascii").lower().rstrip(".")
+                position += name_length
+        offset += ext_length
+    raise ValueError("ClientHello without SNI")
+
+
+class ClientHelloAssembler:
+    """Сборка ClientHello из CRYPTO фреймов нескольких Initial пакетов одного соединения"""
+
+    def __init__(self):
+        self.chunks: Dict[int, bytes] = {}
+        self.dcid: Optional[bytes] = None
+
+    def add(self, datagram: bytes) -> Optional[str]:
+        """SNI, как только ClientHello собран; None - нужны еще пакеты; ValueError - не QUIC/без SNI"""
+        packet = parse_initial(datagram)
+        if self.dcid is None:
+            self.dcid = packet.dcid
+        elif packet.dcid != self.dcid:
+            raise ValueError("Initial packet for a different connection")
+
+        for offset, data in crypto_frames(packet.payload):
+            if offset + len(data) > MAX_CRYPTO_BYTES:
+                raise ValueError("ClientHello too large")
+            self.chunks[offset] = data
+
+        assembled, position = b"", 0
+        while position in self.chunks:
+            assembled += self.chunks[position]
+            position += len(self.chunks[position])
+        return sni_from_client_hello(assembled)
@@ -0,0 +1,324 @@
+"""
+QUIC (HTTP/3) SNI forwarder on UDP 443
+Пара к sniproxy для UDP: SNI берется из Initial пакетов клиента, поток
+(адрес:порт клиента) ретранслируется на реальный сервер. Без него HTTP/3
+клиенты перехваченных доменов ждут таймаут QUIC перед откатом на TCP.
+
+Список доменов и лимиты пишет админка в sniproxy/quicproxy.json,
+сервис перечитывает файл при изменении. Запуск: python -m app.quicproxy
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import re
+import struct
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app import dns_wire
+from app.quic_sni import ClientHelloAssembler, is_initial
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]
+
+# Соединения QUIC живут за счет PING раз в ~15-30 с: короче держать поток нельзя
+MIN_IDLE_TIMEOUT = 30.0
+# Сколько ждать остаток ClientHello и сколько помнить отклоненный адрес
+PENDING_TIMEOUT = 5.0
+REJECT_TIMEOUT = 10.0
+MAX_PENDING_PACKETS = 8
+DURATION_PATTERN = re.compile(r'^([0-9]+)(ms|s|m|h)$')
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """Длительность в формате nginx (10s, 5m, 1h) в секундах"""
+    match = DURATION_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"Invalid duration '{value}'")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def render_config(domains: Dict[str, int], profiles: list, max_flows: int) -> Dict[str, Any]:
+    """
+    quicproxy.json: домен -> индекс профиля, профили с limit_conn и idle_timeout
+    (proxy_timeout профиля sniproxy, не меньше MIN_IDLE_TIMEOUT) и общий предел потоков
+    """
+    return {
+        "domains": domains,
+        "profiles": [
+            {
+                "limit_conn": profile["limit_conn"],
+                "idle_timeout": max(MIN_IDLE_TIMEOUT, parse_duration(profile["proxy_timeout"])),
+            }
+            for profile in profiles
+        ],
+        "max_flows": max_flows,
+    }
+
+
+def match_domain(server_name: str, domains: Dict[str, int]) -> Optional[str]:
+    """Домен списка для SNI: сам домен или его поддомен"""
+    name = server_name
+    while True:
+        if name in domains:
+            return name
+        if "." not in name:
+            return None
+        name = name.split(".", 1)[1]
+
+
+class Flow:
+    """Поток клиента: подключенный UDP сокет к серверу и отметка активности"""
+
+    def __init__(self, client: Address, domain: str, profile: int, idle_timeout: float, queued: list):
+        self.client = client
+        self.domain = domain
+        self.profile = profile
+        self.idle_timeout = idle_timeout
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        # Пакеты клиента до открытия сокета к серверу (резолв имени)
+        self.queued = queued
+        self.last_seen = time.monotonic()
+
+
+class _OriginProtocol(asyncio.DatagramProtocol):
+    def __init__(self, forwarder: "QuicForwarder", flow: Flow):
+        self.forwarder = forwarder
+        self.flow = flow
+
+    def datagram_received(self, data: bytes, addr):
+        self.flow.last_seen = time.monotonic()
+        self.forwarder.stats["bytes_out"] += len(data)
+        self.forwarder.transport.sendto(data, self.flow.client)
+
+    def error_received(self, exc):
+        logger.debug(f"Origin error for {self.flow.domain}: {exc}")
+
+
+class QuicForwarder(asyncio.DatagramProtocol):
+    """UDP сервер: разбор Initial, проверка домена и лимитов, ретрансляция потоков"""
+
+    def __init__(self, config_file: str, resolver: Address, origin_port: int = 443,
+                 stats_file: Optional[str] = None):
+        self.config_file = config_file
+        self.resolver = resolver
+        self.origin_port = origin_port
+        self.stats_file = stats_file
+        self.config: Dict[str, Any] = {"domains": {}, "profiles": [], "max_flows": 0}
+        self.config_mtime = 0.0
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.flows: Dict[Address, Flow] = {}
+        self.pending: Dict[Address, Tuple[ClientHelloAssembler, list, float]] = {}
+        self.rejected: Dict[Address, float] = {}
+        self.client_flows: Dict[Tuple[str, int], int] = {}
+        self.resolve_cache: Dict[str, Tuple[str, float]] = {}
+        self.stats = {
+            "flows_total": 0, "rejected_sni": 0, "limited": 0, "invalid": 0,
+            "resolve_failed": 0, "bytes_in": 0, "bytes_out": 0,
+        }
+
+    def load_config(self) -> bool:
+        """Перечитать quicproxy.json, если он изменился"""
+        try:
+            mtime = os.path.getmtime(self.config_file)
+            if mtime == self.config_mtime:
+                return False
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                self.config = json.load(f)
+            self.config_mtime = mtime
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot load QUIC forwarder config {self.config_file}: {e}")
+            return False
+        logger.info(f"QUIC forwarder config loaded: {len(self.config['domains'])} domains")
+        return True
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        client = addr[:2]
+        self.stats["bytes_in"] += len(data)
+        flow = self.flows.get(client)
+        if flow:
+            flow.last_seen = time.monotonic()
+            if flow.transport:
+                flow.transport.sendto(data)
+            elif len(flow.queued) < MAX_PENDING_PACKETS:
+                flow.queued.append(data)
+            return
+        if client in self.rejected:
+            return
+        self.handle_initial(client, data)
+
+    def handle_initial(self, client: Address, data: bytes):
+        """Новый поток начинается только с Initial пакета; остальное до установки потока отбрасывается"""
+        if not is_initial(data):
+            return
+        assembler, packets, started = self.pending.get(client) or (ClientHelloAssembler(), [], time.monotonic())
+        try:
+            server_name = assembler.add(data)
+        except (ValueError, IndexError, struct.error):
+            # Любой разбор чужого пакета: ошибка - отказ клиенту, а не исключение в datagram_received
+            self.stats["invalid"] += 1
+            self.reject(client)
+            return
+        packets.append(data)
+        if server_name is None:
+            if len(packets) >= MAX_PENDING_PACKETS:
+                self.stats["invalid"] += 1
+                self.reject(client)
+            else:
+                self.pending[client] = (assembler, packets, started)
+            return
+        self.pending.pop(client, None)
+
+        domain = match_domain(server_name, self.config["domains"])
+        if domain is None:
+            logger.debug(f"QUIC SNI {server_name} from {client[0]} is not in the list")
+            self.stats["rejected_sni"] += 1
+            self.reject(client)
+            return
+
+        profile = self.config["domains"][domain]
+        limit = self.config["profiles"][profile]["limit_conn"]
+        if self.config["max_flows"] and len(self.flows) >= self.config["max_flows"] or \
+                limit and self.client_flows.get((client[0], profile), 0) >= limit:
+            self.stats["limited"] += 1
+            self.reject(client)
+            return
+
+        flow = Flow(client, server_name, profile, self.config["profiles"][profile]["idle_timeout"], packets)
+        self.flows[client] = flow
+        self.client_flows[(client[0], profile)] = self.client_flows.get((client[0], profile), 0) + 1
+        self.stats["flows_total"] += 1
+        asyncio.ensure_future(self.connect_flow(flow))
+
+    def reject(self, client: Address):
+        self.pending.pop(client, None)
+        self.rejected[client] = time.monotonic()
+
+    async def resolve(self, name: str) -> Optional[str]:
+        """A запись через вид SmartDNS без подмен (как resolver в nginx sniproxy)"""
+        cached = self.resolve_cache.get(name)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        try:
+            response = await dns_wire.query_udp(self.resolver[0], self.resolver[1], dns_wire.build_query(name))
+        except (asyncio.TimeoutError, OSError):
+            return None
+        answers = [a for a in dns_wire.parse_message(response).answers if a.qtype == dns_wire.QTYPES["A"]]
+        if not answers:
+            return None
+        self.resolve_cache[name] = (answers[0].data, time.monotonic() + min(answers[0].ttl, 300))
+        return answers[0].data
+
+    async def connect_flow(self, flow: Flow):
+        origin = await self.resolve(flow.domain)
+        if self.flows.get(flow.client) is not flow:
+            return
+        if origin is None or ipaddress.ip_address(origin).is_unspecified:
+            logger.warning(f"Cannot resolve {flow.domain} for QUIC flow from {flow.client[0]}")
+            self.stats["resolve_failed"] += 1
+            self.close_flow(flow)
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            flow.transport, _ = await loop.create_datagram_endpoint(
+                lambda: _OriginProtocol(self, flow), remote_addr=(origin, self.origin_port)
+            )
+        except OSError as e:
+            logger.warning(f"Cannot open QUIC flow to {flow.domain} ({origin}): {e}")
+            self.close_flow(flow)
+            return
+        if self.flows.get(flow.client) is not flow:
+            flow.transport.close()
+            return
+        for packet in flow.queued:
+            flow.transport.sendto(packet)
+        flow.queued = []
+
+    def close_flow(self, flow: Flow):
+        if self.flows.get(flow.client) is flow:
+            del self.flows[flow.client]
+            key = (flow.client[0], flow.profile)
+            self.client_flows[key] -= 1
+            if not self.client_flows[key]:
+                del self.client_flows[key]
+        if flow.transport:
+            flow.transport.close()
+
+    def expire(self):
+        now = time.monotonic()
+        for flow in [f for f in self.flows.values() if now - f.last_seen > f.idle_timeout]:
+            self.close_flow(flow)
+        for client in [c for c, (_, _, started) in self.pending.items() if now - started > PENDING_TIMEOUT]:
+            del self.pending[client]
+        for client in [c for c, rejected in self.rejected.items() if now - rejected > REJECT_TIMEOUT]:
+            del self.rejected[client]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "flows_active": len(self.flows),
+            "domains": len(self.config["domains"]),
+            "updated": time.time(),
+        }
+
+    def write_stats(self):
+        if not self.stats_file:
+            return
+        tmp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_file, self.stats_file)
+        except OSError as e:
+            logger.warning(f"Cannot write QUIC forwarder stats: {e}")
+
+    async def housekeeping(self, interval: float = 2.0, stats_every: int = 5):
+        tick = 0
+        while True:
+            await asyncio.sleep(interval)
+            self.load_config()
+            self.expire()
+            tick += 1
+            if tick % stats_every == 0:
+                self.write_stats()
+
+    async def serve(self, host: str, port: int) -> asyncio.DatagramTransport:
+        self.load_config()
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        return transport
+
+
+def resolver_address(value: str) -> Address:
+    host, _, port = value.rpartition(":")
+    return host, int(port)
+
+
+async def run():
+    data_dir = os.getenv("DATA_DIR", "/data")
+    forwarder = QuicForwarder(
+        os.getenv("QUIC_CONFIG", os.path.join(data_dir, "sniproxy", "quicproxy.json")),
+        resolver_address(os.getenv("SNIPROXY_RESOLVER", "smartdns:5353")),
+        origin_port=int(os.getenv("QUIC_ORIGIN_PORT", "443")),
+        stats_file=os.getenv("QUIC_STATS_FILE", os.path.join(data_dir, "sniproxy", "quicproxy-stats.json")),
+    )
+    port = int(os.getenv("QUIC_LISTEN_PORT", "443"))
+    await forwarder.serve(os.getenv("QUIC_LISTEN_HOST", "0.0.0.0"), port)
+    logger.info(f"QUIC forwarder listening on UDP {port}")
+    await forwarder.housekeeping()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "info").upper(), logging.INFO),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(run())
@@ -0,0 +1,162 @@
+"""
+Related-domain discovery from co-queried names
+Имена, которые тот же клиент запрашивает в пределах нескольких секунд от
+перехваченного домена (CDN, API, статика сайта), ранжируются как кандидаты
+на добавление в domains.json
+"""
+
+import os
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.query_log import SpaceSaving
+
+# Типы запросов, которые браузер делает при загрузке страницы: A, AAAA, HTTPS
+PAGE_QTYPES = {1, 28, 65}
+
+# Общие CDN и облака: перехват всего суффикса задел бы чужие сайты, предлагаем конкретные имена
+SHARED_SUFFIXES = {
+    "akamai.net", "akamaiedge.net", "akamaihd.net", "akamaized.net", "amazonaws.com", "azureedge.net",
+    "azurefd.net", "cdn77.org", "cloudflare.net", "cloudfront.net", "edgekey.net", "edgesuite.net",
+    "fastly.net", "fastlylb.net", "googleusercontent.com", "gstatic.com", "googleapis.com", "jsdelivr.net",
+    "llnwd.net", "unpkg.com",
+}
+# Второй уровень национальных зон: example.co.uk -> последние три метки
+SECOND_LEVEL_LABELS = {"co", "com", "net", "org", "gov", "edu", "ac"}
+
+
+def base_domain(name: str) -> str:
+    """Имя для предложения: регистрируемый домен, для общих CDN - само имя"""
+    labels = name.split(".")
+    keep = 3 if len(labels) >= 3 and labels[-2] in SECOND_LEVEL_LABELS and len(labels[-1]) == 2 else 2
+    base = ".".join(labels[-keep:])
+    return name if base in SHARED_SUFFIXES else base
+
+
+class _Client:
+    __slots__ = ("anchor", "anchor_ts", "recent")
+
+    def __init__(self, recent: int):
+        self.anchor: Optional[str] = None
+        self.anchor_ts = 0.0
+        # (время, кандидат, полное имя, с каким перехваченным доменом уже связан)
+        self.recent: deque = deque(maxlen=recent)
+
+
+class CoQueryAnalyzer:
+    """
+    Совместные запросы клиента: перехваченный домен (якорь) и остальные имена
+
+    Имя связывается с якорем, если клиент запросил его не дальше window секунд
+    до или после якоря; повторные A/AAAA/HTTPS одного визита считаются один раз.
+    Память ограничена: max_clients клиентов (LRU) по recent имен, Space-Saving
+    для пар якорь-кандидат и для общего числа запросов кандидата.
+    """
+
+    def __init__(self, window: float = 5.0, max_clients: int = 4096, recent: int = 16,
+                 pair_capacity: int = 20000, name_capacity: int = 20000, clients_per_pair: int = 8):
+        self.window = window
+        self.max_clients = max_clients
+        self.recent = recent
+        self.clients_per_pair = clients_per_pair
+        self.clients: "OrderedDict[str, _Client]" = OrderedDict()
+        self.pairs = SpaceSaving(pair_capacity, on_evict=self._drop_pair)
+        self.totals = SpaceSaving(name_capacity)
+        self.pair_clients: Dict[str, Set[str]] = {}
+        self.pair_examples: Dict[str, Set[str]] = {}
+
+    @classmethod
+    def from_env(cls) -> "CoQueryAnalyzer":
+        capacity = int(os.getenv("RELATED_CAPACITY", "20000"))
+        return cls(
+            window=float(os.getenv("RELATED_WINDOW", "5")),
+            max_clients=int(os.getenv("RELATED_MAX_CLIENTS", "4096")),
+            pair_capacity=capacity,
+            name_capacity=capacity,
+        )
+
+    def _drop_pair(self, key: str):
+        self.pair_clients.pop(key, None)
+        self.pair_examples.pop(key, None)
+
+    def _client(self, client: str) -> _Client:
+        state = self.clients.get(client)
+        if state is None:
+            state = self.clients[client] = _Client(self.recent)
+            if len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)
+        else:
+            self.clients.move_to_end(client)
+        return state
+
+    def _pair(self, anchor: str, candidate: str, name: str, client: str):
+        key = f"{anchor}\t{candidate}"
+        self.pairs.add(key)
+        clients = self.pair_clients.setdefault(key, set())
+        if len(clients) < self.clients_per_pair:
+            clients.add(client)
+        examples = self.pair_examples.setdefault(key, set())
+        if len(examples) < 3:
+            examples.add(name)
+
+    def observe(self, ts: float, client: str, name: str, qtype: int, anchor: Optional[str]):
+        """Один запрос из лога; anchor - перехваченный домен, которому принадлежит имя, иначе None"""
+        if qtype not in PAGE_QTYPES or "." not in name or name.endswith(".arpa"):
+            return
+        state = self._client(client)
+        if anchor is not None:
+            # Имена, запрошенные незадолго до якоря (параллельная загрузка страницы)
+            for i, (seen, candidate, full, paired) in enumerate(state.recent):
+                if paired != anchor and ts - seen <= self.window:
+                    self._pair(anchor, candidate, full, client)
+                    state.recent[i] = (seen, candidate, full, anchor)
+            state.anchor, state.anchor_ts = anchor, ts
+            return
+
+        candidate = base_domain(name)
+        for seen, previous, _, _ in state.recent:
+            if previous == candidate and ts - seen <= self.window:
+                # Тот же визит: AAAA/HTTPS после A или соседний хост того же домена
+                return
+        self.totals.add(candidate)
+        paired = None
+        if state.anchor is not None and ts - state.anchor_ts <= self.window:
+            paired = state.anchor
+            self._pair(paired, candidate, name, client)
+        state.recent.append((ts, candidate, name, paired))
+
+    def suggestions(self, min_count: int = 3, min_share: float = 0.3, limit: int = 50,
+                    exclude: Callable[[str], bool] = lambda name: False) -> List[Dict[str, Any]]:
+        """
+        Кандидаты по убыванию score = count * share, где share - доля запросов
+        кандидата рядом с якорем: имена, которые запрашиваются и без перехваченных
+        сайтов (счетчики, общие библиотеки), получают низкий share
+        """
+        best: Dict[str, Dict[str, Any]] = {}
+        for key, count in self.pairs.counts.items():
+            if count < min_count:
+                continue
+            anchor, candidate = key.split("\t", 1)
+            if exclude(candidate):
+                continue
+            total = max(self.totals.counts.get(candidate, 0), count)
+            share = count / total
+            if share < min_share:
+                continue
+            entry = best.get(candidate)
+            score = count * share
+            if entry is None:
+                entry = best[candidate] = {"name": candidate, "score": 0.0, "count": 0, "anchors": [],
+                                           "clients": 0, "examples": set()}
+            entry["anchors"].append({"domain": anchor, "count": count, "share": round(share, 3)})
+            entry["count"] += count
+            entry["score"] = max(entry["score"], score)
+            entry["clients"] = max(entry["clients"], len(self.pair_clients.get(key, ())))
+            entry["examples"].update(self.pair_examples.get(key, ()))
+
+        ranked = sorted(best.values(), key=lambda e: e["score"], reverse=True)[:limit]
+        for entry in ranked:
+            entry["score"] = round(entry["score"], 2)
+            entry["anchors"].sort(key=lambda a: a["count"], reverse=True)
+            entry["examples"] = sorted(entry["examples"])
+        return ranked
@@ -0,0 +1,189 @@
+"""
+Per-domain traffic accounting for sniproxy
+Компактный stream-лог nginx (SNI, байты, время сессии и соединения с апстримом),
+буферизованный и опционально выборочный, сводится в счетчики по доменам
+"""
+
+import logging
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.query_log import LogTailer, SpaceSaving
+
+logger = logging.getLogger(__name__)
+
+# $upstream_connect_time последним: при повторных попытках это список через ", "
+LOG_FORMAT = "$ssl_preread_server_name $status $bytes_received $bytes_sent $session_time $upstream_connect_time"
+
+# Поля домена в плоском массиве; last_seen и since - unix time
+FIELDS = ("connections", "errors", "bytes_in", "bytes_out", "session_s", "connect_s", "connect_count",
+          "last_seen", "since")
+_CONNECTIONS, _ERRORS, _BYTES_IN, _BYTES_OUT, _SESSION_S, _CONNECT_S, _CONNECT_COUNT, _LAST_SEEN, _SINCE = \
+    range(len(FIELDS))
+
+
+def render_log_directives(path: str, sample_percent: float, buffer: str, flush: str) -> Dict[str, str]:
+    """
+    Директивы nginx: log_format и split_clients для блока stream
+    и access_log для server блоков sniproxy
+    """
+    stream = [f"    log_format ninja_stream '{LOG_FORMAT}';"]
+    condition = ""
+    if sample_percent < 100:
+        # $connection уникален в пределах воркера, $msec разводит воркеры
+        stream.append(f"""    split_clients "$connection$msec" $stream_log_sampled {{
+        {sample_percent:g}% 1;
+        * 0;
+    }}""")
+        condition = " if=$stream_log_sampled"
+    return {
+        "stream": "\n".join(stream),
+        "server": f"access_log {path} ninja_stream buffer={buffer} flush={flush}{condition};",
+    }
+
+
+class StreamStats:
+    """
+    Счетчики sniproxy по доменам из domains.json
+
+    Память ограничена числом доменов (одна строка FIELDS на домен в array)
+    и емкостью Space-Saving для SNI вне списка. Счетчики по выборке
+    домножаются на 100 / sample_percent при выдаче.
+    """
+
+    def __init__(self, tailer: LogTailer, sample_percent: float = 100.0, other_capacity: int = 200):
+        self.tailer = tailer
+        self.sample_percent = sample_percent
+        self.index: Dict[str, int] = {}
+        self.values = array("d")
+        self.other = SpaceSaving(other_capacity)
+        self.tracking_since = time.time()
+        self.unparsed = 0
+
+    def set_domains(self, names: Iterable[str], now: Optional[float] = None):
+        """Новый список доменов: счетчики оставшихся сохраняются, удаленных - отбрасываются"""
+        now = time.time() if now is None else now
+        width = len(FIELDS)
+        index: Dict[str, int] = {}
+        values = array("d")
+        for name in names:
+            name = name.rstrip(".").lower()
+            if name in index:
+                continue
+            index[name] = len(index)
+            old = self.index.get(name)
+            if old is not None:
+                values.extend(self.values[old * width:(old + 1) * width])
+            else:
+                row = [0.0] * width
+                row[_SINCE] = now
+                values.extend(row)
+        self.index = index
+        self.values = values
+
+    def match(self, server_name: str) -> Optional[int]:
+        """Строка домена для SNI: сам домен или его поддомен"""
+        name = server_name
+        while name:
+            row = self.index.get(name)
+            if row is not None:
+                return row
+            _, _, name = name.partition(".")
+        return None
+
+    def poll(self, now: Optional[float] = None) -> int:
+        """Прочитать новые строки лога; возвращает число учтенных соединений"""
+        now = time.time() if now is None else now
+        width = len(FIELDS)
+        values = self.values
+        counted = 0
+        for line in self.tailer.read_lines():
+            parts = line.split(" ", 5)
+            if len(parts) != 6:
+                self.unparsed += 1
+                continue
+            server_name, status, bytes_in, bytes_out, session, connect = parts
+            try:
+                bytes_in, bytes_out, session = int(bytes_in), int(bytes_out), float(session)
+            except ValueError:
+                self.unparsed += 1
+                continue
+            server_name = server_name.rstrip(".").lower()
+            row = self.match(server_name) if server_name != "-" else None
+            counted += 1
+            if row is None:
+                self.other.add(server_name or "-")
+                continue
+            base = row * width
+            values[base + _CONNECTIONS] += 1
+            if status != "200":
+                values[base + _ERRORS] += 1
+            values[base + _BYTES_IN] += bytes_in
+            values[base + _BYTES_OUT] += bytes_out
+            values[base + _SESSION_S] += session
+            # "-" без соединения с апстримом; при повторах берем последнюю попытку
+            attempt = connect.rsplit(", ", 1)[-1]
+            if attempt != "-":
+                try:
+                    values[base + _CONNECT_S] += float(attempt)
+                    values[base + _CONNECT_COUNT] += 1
+                except ValueError:
+                    pass
+            values[base + _LAST_SEEN] = now
+        return counted
+
+    def state(self) -> Dict[str, Any]:
+        """Сырые счетчики для файла состояния: переживают перезапуск админки и смену лидера"""
+        width = len(FIELDS)
+        return {
+            "updated": time.time(),
+            "sample_percent": self.sample_percent,
+            "tracking_since": self.tracking_since,
+            "fields": list(FIELDS),
+            "domains": {name: list(self.values[row * width:(row + 1) * width]) for name, row in self.index.items()},
+            "other": self.other.top(20),
+            "tailer": dict(self.tailer.stats, offset=self.tailer.offset, unparsed=self.unparsed),
+        }
+
+    def restore(self, state: Dict[str, Any]):
+        """Счетчики из файла состояния для доменов, уже заданных через set_domains"""
+        if state.get("fields") != list(FIELDS):
+            return
+        width = len(FIELDS)
+        self.tracking_since = min(self.tracking_since, state.get("tracking_since", self.tracking_since))
+        for name, row_values in state.get("domains", {}).items():
+            row = self.index.get(name)
+            if row is not None and len(row_values) == width:
+                self.values[row * width:(row + 1) * width] = array("d", row_values)
+
+    def close(self):
+        self.tailer.close()
+
+
+def domain_report(state: Dict[str, Any], unused_after: float, now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Нагрузка по доменам из файла состояния с поправкой на выборку; unused - ни одного
+    соединения за unused_after секунд (с момента добавления домена или последнего соединения)
+    """
+    now = time.time() if now is None else now
+    if state.get("fields") != list(FIELDS):
+        return []
+    scale = 100.0 / (state.get("sample_percent") or 100.0)
+    report = []
+    for name, row in state.get("domains", {}).items():
+        connections = row[_CONNECTIONS]
+        idle_since = row[_LAST_SEEN] or row[_SINCE]
+        report.append({
+            "name": name,
+            "connections": round(connections * scale),
+            "errors": round(row[_ERRORS] * scale),
+            "bytes_in": round(row[_BYTES_IN] * scale),
+            "bytes_out": round(row[_BYTES_OUT] * scale),
+            "avg_session_s": round(row[_SESSION_S] / connections, 3) if connections else None,
+            "avg_connect_ms": round(row[_CONNECT_S] * 1000 / row[_CONNECT_COUNT], 1) if row[_CONNECT_COUNT] else None,
+            "last_seen": row[_LAST_SEEN] or None,
+            "unused": now - idle_since >= unused_after,
+        })
+    report.sort(key=lambda d: d["bytes_in"] + d["bytes_out"], reverse=True)
+    return report
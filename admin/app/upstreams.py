@@ -0,0 +1,200 @@
+"""
+Latency-aware upstream selection for SmartDNS
+Периодически замеряет кандидатов (handshake, время запроса, потери)
+и отдает в конфиг только лучшие N
+"""
+
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from app import dns_wire
+
+logger = logging.getLogger(__name__)
+
+# Текущий набор из конфига SmartDNS: используется, пока нет замеров
+DEFAULT_CANDIDATES = [
+    "tls://8.8.8.8:853",
+    "tls://1.1.1.1:853",
+    "https://dns.google/dns-query",
+    "https://cloudflare-dns.com/dns-query",
+    "udp://8.8.8.8:53",
+    "udp://1.1.1.1:53",
+]
+DEFAULT_PROBE_NAMES = ["google.com", "cloudflare.com", "wikipedia.org"]
+DEFAULT_PORTS = {"tls": 853, "https": 443, "udp": 53}
+
+# Штраф за потерю запроса при ранжировании, мс
+LOSS_PENALTY_MS = 1000.0
+# Вес handshake: соединения к апстримам переиспользуются, он важен меньше времени запроса
+HANDSHAKE_WEIGHT = 0.2
+
+
+def parse_candidate(url: str) -> Dict[str, Any]:
+    """tls://host:port, https://host/path, udp://host:port"""
+    parts = urlsplit(url if "://" in url else f"udp://{url}")
+    protocol = parts.scheme.lower()
+    if protocol not in DEFAULT_PORTS:
+        raise ValueError(f"Unsupported upstream protocol: {url}")
+    return {
+        "url": url,
+        "protocol": protocol,
+        "host": parts.hostname,
+        "port": parts.port or DEFAULT_PORTS[protocol],
+        "path": parts.path or "/dns-query",
+    }
+
+
+def smartdns_server_line(candidate: Dict[str, Any], group: str) -> str:
+    """Строка server* для конфига SmartDNS"""
+    if candidate["protocol"] == "tls":
+        return f"server-tls {candidate['host']}:{candidate['port']} -group {group}"
+    if candidate["protocol"] == "https":
+        port = "" if candidate["port"] == 443 else f":{candidate['port']}"
+        return f"server-https https://{candidate['host']}{port}{candidate['path']} -group {group}"
+    return f"server {candidate['host']}:{candidate['port']} -group {group}"
+
+
+class UpstreamManager:
+    """Замер и выбор апстримов; состояние хранится в файле, общем для всех воркеров"""
+
+    def __init__(self, state_file: str, candidates: Optional[List[str]] = None, best_n: int = 2,
+                 best_n_fallback: int = 2, probe_names: Optional[List[str]] = None, queries: int = 5,
+                 timeout: float = 2.0):
+        self.state_file = state_file
+        self.candidates = [parse_candidate(url) for url in (candidates or DEFAULT_CANDIDATES)]
+        self.best_n = best_n
+        self.best_n_fallback = best_n_fallback
+        self.probe_names = probe_names or DEFAULT_PROBE_NAMES
+        self.queries = queries
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, state_file: str) -> "UpstreamManager":
+        candidates = [c.strip() for c in os.getenv("UPSTREAM_CANDIDATES", "").split(",") if c.strip()]
+        probe_names = [n.strip() for n in os.getenv("UPSTREAM_PROBE_NAMES", "").split(",") if n.strip()]
+        return cls(
+            state_file,
+            candidates=candidates or None,
+            best_n=int(os.getenv("UPSTREAM_BEST_N", "2")),
+            best_n_fallback=int(os.getenv("UPSTREAM_BEST_N_FALLBACK", "2")),
+            probe_names=probe_names or None,
+        )
+
+    async def _probe_stream(self, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        """DoT/DoH: handshake и последовательные запросы по одному соединению"""
+        alpn = ["http/1.1"] if candidate["protocol"] == "https" else None
+        started = time.monotonic()
+        reader, writer = await dns_wire.open_stream(
+            candidate["host"], candidate["port"], tls=dns_wire.insecure_tls_context(alpn),
+            server_name=candidate["host"], timeout=self.timeout
+        )
+        handshake = time.monotonic() - started
+        latencies, failures = [], 0
+        try:
+            for i in range(self.queries):
+                message = dns_wire.build_query(self.probe_names[i % len(self.probe_names)])
+                sent = time.monotonic()
+                try:
+                    if candidate["protocol"] == "https":
+                        await dns_wire.query_doh(reader, writer, candidate["host"], candidate["path"], message,
+                                                 timeout=self.timeout)
+                    else:
+                        await dns_wire.query_stream(reader, writer, message, timeout=self.timeout)
+                    latencies.append(time.monotonic() - sent)
+                except (asyncio.TimeoutError, OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    failures += 1
+                    break
+        finally:
+            writer.close()
+        # Оборванное соединение: оставшиеся запросы тоже считаем потерянными
+        failures = self.queries - len(latencies) if failures else 0
+        return {"handshake": handshake, "latencies": latencies, "failures": failures}
+
+    async def _probe_udp(self, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        latencies, failures = [], 0
+        for i in range(self.queries):
+            message = dns_wire.build_query(self.probe_names[i % len(self.probe_names)])
+            sent = time.monotonic()
+            try:
+                await dns_wire.query_udp(candidate["host"], candidate["port"], message, timeout=self.timeout)
+                latencies.append(time.monotonic() - sent)
+            except (asyncio.TimeoutError, OSError):
+                failures += 1
+        return {"handshake": 0.0, "latencies": latencies, "failures": failures}
+
+    async def probe_candidate(self, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            if candidate["protocol"] == "udp":
+                raw = await self._probe_udp(candidate)
+            else:
+                raw = await self._probe_stream(candidate)
+        except (asyncio.TimeoutError, OSError, ConnectionError) as e:
+            return {"url": candidate["url"], "protocol": candidate["protocol"], "error": str(e) or type(e).__name__,
+                    "loss": 1.0, "score_ms": None}
+
+        loss = raw["failures"] / self.queries
+        query_ms = statistics.median(raw["latencies"]) * 1000 if raw["latencies"] else None
+        handshake_ms = raw["handshake"] * 1000
+        score = None
+        if query_ms is not None:
+            score = query_ms + handshake_ms * HANDSHAKE_WEIGHT + loss * LOSS_PENALTY_MS
+        return {
+            "url": candidate["url"],
+            "protocol": candidate["protocol"],
+            "handshake_ms": round(handshake_ms, 2),
+            "query_ms": round(query_ms, 2) if query_ms is not None else None,
+            "loss": round(loss, 3),
+            "score_ms": round(score, 2) if score is not None else None,
+        }
+
+    def rank(self, measurements: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Лучшие N шифрованных апстримов и лучшие N UDP для fallback группы"""
+        usable = sorted(
+            (m for m in measurements if m.get("score_ms") is not None and m["loss"] < 1.0),
+            key=lambda m: m["score_ms"]
+        )
+        encrypted = [m["url"] for m in usable if m["protocol"] in ("tls", "https")][:self.best_n]
+        fallback = [m["url"] for m in usable if m["protocol"] == "udp"][:self.best_n_fallback]
+        return {"upstream": encrypted, "fallback": fallback}
+
+    async def probe_all(self) -> Dict[str, Any]:
+        measurements = await asyncio.gather(*(self.probe_candidate(c) for c in self.candidates))
+        state = {
+            "probed_at": time.time(),
+            "measurements": list(measurements),
+            "selected": self.rank(list(measurements)),
+        }
+        self.save_state(state)
+        logger.info(f"Upstreams probed, selected: {state['selected']}")
+        return state
+
+    def load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"probed_at": None, "measurements": [], "selected": {}}
+
+    def save_state(self, state: Dict[str, Any]):
+        tmp_file = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def server_lines(self) -> List[str]:
+        """Строки server* для конфига: выбранные по замерам или набор по умолчанию"""
+        selected = self.load_state().get("selected") or {}
+        by_url = {c["url"]: c for c in self.candidates}
+        lines = []
+        for group, defaults in (("upstream", ("tls", "https")), ("fallback", ("udp",))):
+            urls = [url for url in selected.get(group, []) if url in by_url]
+            if not urls:
+                urls = [c["url"] for c in self.candidates if c["protocol"] in defaults]
+            lines.extend(smartdns_server_line(by_url[url], group) for url in urls)
+        return lines
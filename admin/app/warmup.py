@@ -0,0 +1,95 @@
+"""
+SmartDNS cache warm-up after config applies
+После перезапуска SmartDNS заранее резолвим новые и "горячие" имена,
+чтобы первый клиентский запрос не платил за DoT апстрим и speed-check
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+from app import dns_wire
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmer:
+    """Параллельный прогрев кэша SmartDNS с отчетом о длительности и доле попаданий"""
+
+    def __init__(self, host: str, port: int = 53, concurrency: int = 64, timeout: float = 2.0,
+                 ready_timeout: float = 15.0, hit_threshold_ms: float = 5.0,
+                 hot_names: Callable[[], Iterable[str]] = lambda: ()):
+        self.host = host
+        self.port = port
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ready_timeout = ready_timeout
+        # Ответ быстрее порога на повторном проходе считаем попаданием в кэш
+        self.hit_threshold_ms = hit_threshold_ms
+        self.hot_names = hot_names
+
+    @classmethod
+    def from_env(cls, hot_names: Callable[[], Iterable[str]] = lambda: ()) -> "CacheWarmer":
+        return cls(
+            os.getenv("SMARTDNS_HOST", "smartdns"),
+            int(os.getenv("SMARTDNS_PORT", "53")),
+            concurrency=int(os.getenv("WARMUP_CONCURRENCY", "64")),
+            ready_timeout=float(os.getenv("WARMUP_READY_TIMEOUT", "15")),
+            hot_names=hot_names,
+        )
+
+    async def _query(self, name: str, port: int) -> tuple[bool, float]:
+        started = time.monotonic()
+        try:
+            response = await dns_wire.query_udp(self.host, port, dns_wire.build_query(name), timeout=self.timeout)
+            ok = dns_wire.parse_message(response).rcode in (dns_wire.RCODE_NOERROR, dns_wire.RCODE_NXDOMAIN)
+        except (asyncio.TimeoutError, OSError, ValueError):
+            ok = False
+        return ok, time.monotonic() - started
+
+    async def wait_ready(self, port: int) -> bool:
+        """Ждем, пока перезапущенный SmartDNS начнет отвечать"""
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            ok, _ = await self._query("localhost", port)
+            if ok:
+                return True
+            await asyncio.sleep(0.2)
+        return False
+
+    async def _pass(self, names: List[str], port: int) -> List[tuple[bool, float]]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(name: str):
+            async with semaphore:
+                return await self._query(name, port)
+
+        return await asyncio.gather(*(one(name) for name in names))
+
+    async def warm(self, names: Iterable[str] = (), port: int = None) -> Dict[str, Any]:
+        port = port or self.port
+        all_names = list(dict.fromkeys([*names, *self.hot_names()]))
+        started = time.monotonic()
+        result: Dict[str, Any] = {"port": port, "names": len(all_names)}
+
+        if not await self.wait_ready(port):
+            result.update({"ready": False, "duration_ms": round((time.monotonic() - started) * 1000, 1)})
+            logger.warning(f"SmartDNS on {self.host}:{port} did not become ready for warm-up")
+            return result
+
+        first = await self._pass(all_names, port)
+        warmed_at = time.monotonic()
+        second = await self._pass(all_names, port)
+
+        hits = sum(1 for ok, latency in second if ok and latency * 1000 <= self.hit_threshold_ms)
+        result.update({
+            "ready": True,
+            "resolved": sum(1 for ok, _ in first if ok),
+            "hits": hits,
+            "hit_ratio": round(hits / len(all_names), 3) if all_names else None,
+            "duration_ms": round((warmed_at - started) * 1000, 1),
+        })
+        logger.info(f"Cache warm-up on port {port}: {result}")
+        return result
@@ -0,0 +1,16 @@
+#!/bin/sh
+
+# Запуск админки: в продакшене без --reload (лишний процесс-наблюдатель за файлами),
+# в режиме отладки (DEBUG=true) с автоперезагрузкой.
+# ADMIN_WORKERS задает число воркеров uvicorn (reload с воркерами несовместим)
+
+set -e
+
+if [ "$DEBUG" = "true" ]; then
+    exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
+fi
+
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 \
+    --workers "${ADMIN_WORKERS:-1}" \
+    --proxy-headers --forwarded-allow-ips='*' \
+    --log-level "${LOG_LEVEL:-info}"
@@ -0,0 +1,59 @@
+#!/bin/bash
+
+# Применение правил nftables против злоупотребления открытым резолвером
+# Правила генерирует админка в smartdns/ninja-dns.nft (allow-list и лимит запросов на адрес)
+#
+#   ./scripts/apply-nftables.sh          # применить правила
+#   ./scripts/apply-nftables.sh --stats  # выгрузить счетчики для /api/acl/stats
+#   ./scripts/apply-nftables.sh --watch  # применять при изменении файла и выгружать счетчики раз в 10 с
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "$SCRIPT_DIR/common.sh"
+
+PROJECT_DIR="$(dirname "$SCRIPT_DIR")"
+RULESET="$PROJECT_DIR/smartdns/ninja-dns.nft"
+COUNTERS="$PROJECT_DIR/smartdns/nft-counters.json"
+
+if ! command -v nft > /dev/null 2>&1; then
+    print_error "nft не найден: установите пакет nftables"
+    exit 1
+fi
+
+apply_ruleset() {
+    if [[ ! -f "$RULESET" ]]; then
+        print_error "Файл $RULESET не найден: сохраните настройки ACL в админке"
+        exit 1
+    fi
+    nft -c -f "$RULESET"
+    nft -f "$RULESET"
+    print_success "Правила nftables применены"
+}
+
+dump_counters() {
+    nft -j list counters table inet ninja_dns > "$COUNTERS.tmp" && mv "$COUNTERS.tmp" "$COUNTERS"
+}
+
+case "${1:-}" in
+    --stats)
+        dump_counters
+        ;;
+    --watch)
+        apply_ruleset
+        last_mtime="$(stat -c %Y "$RULESET")"
+        while true; do
+            sleep 10
+            mtime="$(stat -c %Y "$RULESET")"
+            if [[ "$mtime" != "$last_mtime" ]]; then
+                apply_ruleset
+                last_mtime="$mtime"
+            fi
+            dump_counters
+        done
+        ;;
+    *)
+        apply_ruleset
+        dump_counters
+        ;;
+esac
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-# Скрипт для генерации dynamic.yml из template
+# Скрипт для генерации traefik.yml и dynamic.yml из template
 # Использует переменные окружения из .env файла
 
 set -e
@@ -11,7 +11,7 @@ YELLOW='\033[1;33m'
 RED='\033[0;31m'
 NC='\033[0m' # No Color
 
-echo -e "${GREEN}🔧 Генерация dynamic.yml из template...${NC}"
+echo -e "${GREEN}🔧 Генерация traefik.yml и dynamic.yml из template...${NC}"
 
 # Проверяем что мы в корневой директории проекта
 if [[ ! -f "docker-compose.yml" ]]; then
@@ -41,9 +41,47 @@ fi
 
 # Формируем полный тестовый домен
 TEST_DOMAIN="${TEST_SUBDOMAIN}.${HOST_DOMAIN}"
+# Тот же домен для регулярного выражения Traefik (точки как [.])
+TEST_DOMAIN_RE="${TEST_DOMAIN//./[.]}"
+
+# DoH бэкенд: doh-proxy или сам SmartDNS (bind-https). TLS клиента в обоих случаях терминирует Traefik
+if [[ "${DNS_TLS_MODE:-traefik}" == "native" ]]; then
+    DOH_BACKEND_URL="https://smartdns:${NATIVE_DOH_PORT:-8053}"
+else
+    DOH_BACKEND_URL="http://doh-proxy:8053"
+fi
+
+# HTTPS проба <nonce>.TEST_DOMAIN нужен wildcard сертификат: только через DNS-01 (ACME_DNS_PROVIDER).
+# Резолвер letsencrypt-dns в traefik.yml и роутер пробы в dynamic.yml - только вместе с провайдером
+if [[ -n "${ACME_DNS_PROVIDER:-}" ]]; then
+    PROBE_HTTPS_FILTER='/# >>> DNS_PROBE_HTTPS/d; /# <<< DNS_PROBE_HTTPS/d'
+    ACME_DNS_FILTER='/# >>> ACME_DNS/d; /# <<< ACME_DNS/d'
+    if [[ ! -f "traefik/acme-dns.env" ]]; then
+        echo -e "${YELLOW}⚠️  traefik/acme-dns.env не найден: ключи провайдера ${ACME_DNS_PROVIDER} не заданы${NC}"
+    fi
+else
+    PROBE_HTTPS_FILTER='/# >>> DNS_PROBE_HTTPS/,/# <<< DNS_PROBE_HTTPS/d'
+    ACME_DNS_FILTER='/# >>> ACME_DNS/,/# <<< ACME_DNS/d'
+fi
 
 echo -e "${YELLOW}🌐 HOST_DOMAIN: ${HOST_DOMAIN}${NC}"
 echo -e "${YELLOW}🧪 TEST_DOMAIN: ${TEST_DOMAIN}${NC}"
+echo -e "${YELLOW}🔐 DoH backend: ${DOH_BACKEND_URL}${NC}"
+echo -e "${YELLOW}🔏 HTTPS проба DNS: ${ACME_DNS_PROVIDER:-выключена (нет ACME_DNS_PROVIDER)}${NC}"
+
+# Статическая конфигурация Traefik: traefik.yml из шаблона
+STATIC_TEMPLATE_FILE="traefik/traefik.yml.template"
+STATIC_OUTPUT_FILE="traefik/traefik.yml"
+
+if [[ ! -f "$STATIC_TEMPLATE_FILE" ]]; then
+    echo -e "${RED}❌ Ошибка: Template файл $STATIC_TEMPLATE_FILE не найден${NC}"
+    exit 1
+fi
+
+echo -e "${YELLOW}📝 Генерируем $STATIC_OUTPUT_FILE...${NC}"
+sed -e "$ACME_DNS_FILTER" \
+    -e "s/{{ACME_DNS_PROVIDER}}/${ACME_DNS_PROVIDER:-}/g" \
+    "$STATIC_TEMPLATE_FILE" > "$STATIC_OUTPUT_FILE"
 
 # Проверяем наличие template файла
 TEMPLATE_FILE="traefik/dynamic/dynamic.yml.template"
@@ -60,8 +98,11 @@ mkdir -p "$(dirname "$OUTPUT_FILE")"
 # Генерируем dynamic.yml из template
 echo -e "${YELLOW}📝 Генерируем $OUTPUT_FILE...${NC}"
 
-sed -e "s/{{HOST_DOMAIN}}/$HOST_DOMAIN/g" \
+sed -e "$PROBE_HTTPS_FILTER" \
+    -e "s/{{HOST_DOMAIN}}/$HOST_DOMAIN/g" \
+    -e "s/{{TEST_DOMAIN_RE}}/$TEST_DOMAIN_RE/g" \
     -e "s/{{TEST_DOMAIN}}/$TEST_DOMAIN/g" \
+    -e "s|{{DOH_BACKEND_URL}}|$DOH_BACKEND_URL|g" \
     "$TEMPLATE_FILE" > "$OUTPUT_FILE"
 
 echo -e "${GREEN}✅ Файл $OUTPUT_FILE успешно сгенерирован${NC}"
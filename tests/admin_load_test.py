@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест API админки без Docker
+
+Админка запускается через fake_admin.py: поддельный Docker клиент с задержкой
+--docker-latency-ms (docker-py синхронный, поэтому задержка блокирует тот поток,
+из которого его вызвали) и синтетический domains.json на --domains доменов.
+Клиентские процессы гоняют смешанную нагрузку по /api/domains, /api/status,
+/download, /download/mobileconfig и проверке DNS (nonce + /dns-probe.gif).
+
+Отчет: RPS и p50/p95/p99 по маршрутам и задержка event loop админки за время
+нагрузки. Тест падает, если p99 задержки loop больше --max-lag-ms или есть ошибки.
+
+Использование:
+    python admin_load_test.py [--domains 10000] [--duration 20] [--concurrency 64]
+    python admin_load_test.py --mix api_status=1 --docker-latency-ms 20 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import requests
+
+from bench_utils import HTTPConnection, latency_summary
+from config_scaling_bench import synthetic_domains
+from fake_admin import FakeAdminServer
+
+DEFAULT_MIX = "api_domains=2,api_status=2,download=3,mobileconfig=2,dns_check=3"
+
+
+async def _dns_check(conn: HTTPConnection) -> int:
+    status, _, body = await conn.request("GET", "/dns-check/nonce")
+    if status != 200:
+        return status
+    probe_host = json.loads(body)["probe_host"]
+    status, _, _ = await conn.request("GET", "/dns-probe.gif", headers={"Host": probe_host})
+    return status
+
+
+async def _get(conn: HTTPConnection, path: str) -> int:
+    status, _, _ = await conn.request("GET", path)
+    return status
+
+
+ROUTES = {
+    "api_domains": lambda conn: _get(conn, "/api/domains"),
+    "api_status": lambda conn: _get(conn, "/api/status"),
+    "download": lambda conn: _get(conn, "/download"),
+    "mobileconfig": lambda conn: _get(conn, "/download/mobileconfig"),
+    "dns_check": _dns_check,
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route {name!r}, expected one of {', '.join(ROUTES)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def _client_loop(port: int, weights: Dict[str, float], duration: float, concurrency: int, seed: int):
+    deadline = time.monotonic() + duration
+    names = list(weights)
+    rng = random.Random(seed)
+    results = {name: {"latencies": [], "errors": 0} for name in names}
+
+    async def worker():
+        conn = HTTPConnection("127.0.0.1", port)
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights=[weights[n] for n in names])[0]
+            started = time.monotonic()
+            try:
+                status = await ROUTES[name](conn)
+                if status == 200:
+                    results[name]["latencies"].append(time.monotonic() - started)
+                else:
+                    results[name]["errors"] += 1
+            except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+                results[name]["errors"] += 1
+                await conn.close()
+        await conn.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def run_client(args):
+    """Один клиентский процесс со своим event loop"""
+    return asyncio.run(_client_loop(*args))
+
+
+def seed_data_dir(domains: int) -> str:
+    data_dir = tempfile.mkdtemp(prefix="ninja-dns-load-")
+    with open(os.path.join(data_dir, "domains.json"), "w", encoding="utf-8") as f:
+        json.dump(synthetic_domains(domains), f)
+    return data_dir
+
+
+def wait_ready(server: FakeAdminServer, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{server.base_url}/readyz", timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Admin is not ready within {timeout}s")
+
+
+def summarize(results: List[dict], duration: float) -> Dict[str, dict]:
+    routes = {}
+    for name in results[0]:
+        latencies = [latency for chunk in results for latency in chunk[name]["latencies"]]
+        route = {
+            "requests": len(latencies),
+            "errors": sum(chunk[name]["errors"] for chunk in results),
+            "rps": round(len(latencies) / duration, 1),
+        }
+        route.update(latency_summary(latencies))
+        routes[name] = route
+    return routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка API админки с поддельным Docker")
+    parser.add_argument("--domains", type=int, default=10000, help="Размер синтетического domains.json")
+    parser.add_argument("--duration", type=float, default=20.0, help="Длительность замера, с")
+    parser.add_argument("--concurrency", type=int, default=64, help="Одновременных соединений")
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Число клиентских процессов")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Веса маршрутов: имя=вес через запятую")
+    parser.add_argument("--docker-latency-ms", type=float, default=2.0,
+                        help="Задержка каждого вызова поддельного Docker API")
+    parser.add_argument("--max-lag-ms", type=float, default=50.0, help="Порог p99 задержки event loop")
+    parser.add_argument("--json", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+
+    print("🧪 Ninja DNS - Нагрузка API админки (поддельный Docker)")
+    print("=" * 70)
+    print(f"ℹ️  Доменов: {args.domains}, соединений: {args.concurrency}, клиентов: {args.clients}, "
+          f"Docker: {args.docker_latency_ms}ms на вызов")
+
+    server = FakeAdminServer(data_dir=seed_data_dir(args.domains), docker_latency_ms=args.docker_latency_ms)
+    with server:
+        wait_ready(server)
+        # Прогрев: кэш страниц, шаблоны, первая загрузка domains.json
+        run_client((server.port, weights, 1.0, 4, 0))
+
+        per_process = max(1, args.concurrency // args.clients)
+        load_started = time.monotonic()
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(
+                run_client,
+                [(server.port, weights, args.duration, per_process, seed) for seed in range(1, args.clients + 1)]
+            )
+        load_finished = time.monotonic()
+
+    # CLOCK_MONOTONIC общий для процессов одной машины: берем замеры только из окна нагрузки
+    lag_data = server.lag()
+    lags = [lag for at, lag in lag_data["samples"] if load_started <= at <= load_finished]
+    loop_lag = latency_summary(lags)
+    routes = summarize(results, args.duration)
+
+    print("\n📊 Маршруты:")
+    for name, route in routes.items():
+        print(f"  {name:<14} RPS: {route['rps']:>8}  p50: {route['p50_ms']:>8}ms  p95: {route['p95_ms']:>8}ms  "
+              f"p99: {route['p99_ms']:>8}ms  ошибок: {route['errors']}")
+    print(f"\n⏱️  Задержка event loop ({len(lags)} замеров): p50 {loop_lag['p50_ms']}ms  "
+          f"p99 {loop_lag['p99_ms']}ms  max {loop_lag['max_ms']}ms")
+    print(f"ℹ️  Вызовы Docker API: {sum(lag_data['docker_calls'].values())}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "params": vars(args),
+                "routes": routes,
+                "loop_lag": loop_lag,
+                "docker_calls": lag_data["docker_calls"],
+            }, f, indent=2)
+
+    errors = sum(route["errors"] for route in routes.values())
+    lag_ok = loop_lag["p99_ms"] <= args.max_lag_ms
+    print(f"\n{'✅' if lag_ok else '❌'} p99 задержки loop {loop_lag['p99_ms']}ms (порог {args.max_lag_ms}ms)")
+    print(f"{'✅' if errors == 0 else '❌'} Ошибок: {errors}")
+    sys.exit(0 if lag_ok and errors == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
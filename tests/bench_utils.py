@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Общие утилиты для нагрузочных тестов и бенчмарков Ninja DNS
+Запуск админки локально, простой HTTP/1.1 keep-alive клиент и статистика
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADMIN_DIR = os.path.join(TESTS_DIR, "..", "admin")
+
+
+def free_port() -> int:
+    """Свободный локальный порт"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль по отсортированной копии (nearest-rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max в миллисекундах"""
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+class AdminServer:
+    """Локальный процесс админки на временном каталоге данных, без Docker"""
+
+    def __init__(self, workers: int = 1, data_dir: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+        self.workers = workers
+        self.port = free_port()
+        self.data_dir = data_dir or tempfile.mkdtemp(prefix="ninja-dns-bench-")
+        self.env = env or {}
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def command(self) -> List[str]:
+        return [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"]
+
+    def start(self, timeout: float = 20) -> float:
+        """Запуск и ожидание /healthz; возвращает время старта"""
+        for sub in ("smartdns", "sniproxy"):
+            os.makedirs(os.path.join(self.data_dir, sub), exist_ok=True)
+
+        env = dict(os.environ)
+        env.update({
+            "DATA_DIR": self.data_dir,
+            "DOCKER_HOST": "unix:///nonexistent/docker.sock",
+            "LOG_LEVEL": "warning",
+        })
+        env.update(self.env)
+
+        started = time.monotonic()
+        self.process = subprocess.Popen(
+            self.command(), cwd=ADMIN_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        while time.monotonic() - started < timeout:
+            try:
+                if requests.get(f"{self.base_url}/healthz", timeout=1).status_code == 200:
+                    return time.monotonic() - started
+            except requests.exceptions.RequestException:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError(f"Admin did not start within {timeout}s")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class HTTPConnection:
+    """Минимальный асинхронный HTTP/1.1 keep-alive клиент для генерации нагрузки"""
+
+    def __init__(self, host: str, port: int, headers: Optional[Dict[str, str]] = None):
+        self.host = host
+        self.port = port
+        self.headers = headers or {}
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, body: bytes = b"",
+                      headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        if self.writer is None:
+            await self.connect()
+
+        all_headers = {"Host": self.headers.get("Host", f"{self.host}:{self.port}")}
+        all_headers.update(self.headers)
+        all_headers.update(headers or {})
+        if body:
+            all_headers["Content-Length"] = str(len(body))
+        head = f"{method} {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in all_headers.items()) + "\r\n"
+        self.writer.write(head.encode("latin-1") + body)
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if "content-length" in response_headers:
+            payload = await self.reader.readexactly(int(response_headers["content-length"]))
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            payload = b"".join(chunks)
+        else:
+            payload = b""
+
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, response_headers, payload
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+            self.writer = None
+            self.reader = None
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Стоимость поиска правил в SmartDNS при росте числа групп клиентов
+
+Для каждого числа групп конфиг строится настоящим генератором админки
+(каждая группа - свой /32 из 127.1.0.0/16 и свои домены), SmartDNS запускается
+на отдельном порту, запросы идут с адресов клиентов групп (127.x.y.z на lo).
+Ответы перехваченных имен локальные, апстримы не участвуют.
+
+    python client_groups_bench.py --groups 0,10,100,1000
+    python client_groups_bench.py --smartdns-bin /usr/sbin/smartdns
+"""
+import argparse
+import asyncio
+import ipaddress
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_utils import free_port, latency_summary
+
+ADMIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin")
+sys.path.insert(0, ADMIN_DIR)
+
+from app import dns_wire  # noqa: E402
+
+SERVER_IP = "10.0.0.1"
+FIRST_CLIENT = ipaddress.IPv4Address("127.1.0.1")
+OUTSIDE_CLIENT = "127.0.0.1"
+
+
+def load_generator(data_dir: str):
+    """DomainManager админки на временном каталоге данных (импорт main требует cwd=admin)"""
+    os.environ["DATA_DIR"] = data_dir
+    os.makedirs(os.path.join(data_dir, "smartdns"), exist_ok=True)
+    os.chdir(ADMIN_DIR)
+    from app.main import DomainManager
+    return DomainManager()
+
+
+def build_domains_data(groups: int, domains_per_group: int, shared_domains: int):
+    data = {"server_ip": SERVER_IP, "domains": [], "groups": {}}
+    for j in range(shared_domains):
+        data["domains"].append({"name": f"shared{j}.example", "category": "misc", "enabled": True})
+    for i in range(groups):
+        name = f"g{i}"
+        data["groups"][name] = {"clients": [f"{FIRST_CLIENT + i}/32"]}
+        for j in range(domains_per_group):
+            data["domains"].append({"name": f"g{i}-d{j}.example", "category": "misc", "enabled": True, "groups": [name]})
+    return data
+
+
+def bench_config(config: str, port: int) -> str:
+    """Конфиг генератора на тестовом порту, без файлов кэша и логов"""
+    skip = re.compile(r'^(bind|cache-persist|cache-file|log-file)\b')
+    lines = [line for line in config.splitlines() if not skip.match(line)]
+    return f"bind 127.0.0.1:{port}\n" + "\n".join(lines) + "\nlog-level error\n"
+
+
+def start_smartdns(args, config_file: str, conf_dir: str):
+    if args.smartdns_bin:
+        return subprocess.Popen([args.smartdns_bin, "-f", "-x", "-c", config_file],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return subprocess.Popen(
+        ["docker", "run", "--rm", "--network", "host", "--name", f"ninja-dns-groups-bench-{os.getpid()}",
+         "-v", f"{config_file}:/etc/smartdns/smartdns.conf:ro", "-v", f"{conf_dir}:/etc/smartdns/conf.d:ro",
+         args.image],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def stop_smartdns(args, process):
+    if not args.smartdns_bin:
+        subprocess.run(["docker", "stop", f"ninja-dns-groups-bench-{os.getpid()}"], capture_output=True)
+    process.terminate()
+    process.wait(timeout=10)
+
+
+async def query(port: int, name: str, client: str, timeout: float):
+    response = await dns_wire.query_udp("127.0.0.1", port, dns_wire.build_query(name), timeout=timeout,
+                                        local_addr=(client, 0))
+    return dns_wire.parse_message(response)
+
+
+async def wait_ready(port: int, timeout: float) -> float:
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            await query(port, "shared0.example", OUTSIDE_CLIENT, 0.2)
+            return time.monotonic() - started
+        except (asyncio.TimeoutError, OSError):
+            await asyncio.sleep(0.1)
+    raise RuntimeError("SmartDNS did not start")
+
+
+async def load(port: int, groups: int, domains_per_group: int, shared_domains: int, queries: int,
+               concurrency: int, timeout: float):
+    """
+    Запросы клиентов групп к своим и к общим доменам (общие правила группы
+    подключают через conf-file); проверяем, что ответ - наш server_ip
+    """
+    rng = random.Random(1)
+    plan = []
+    for _ in range(queries):
+        if groups and rng.random() < 0.9:
+            i = rng.randrange(groups)
+            if rng.random() < 0.2:
+                plan.append((str(FIRST_CLIENT + i), f"shared{rng.randrange(shared_domains)}.example"))
+            else:
+                plan.append((str(FIRST_CLIENT + i), f"g{i}-d{rng.randrange(domains_per_group)}.example"))
+        else:
+            plan.append((OUTSIDE_CLIENT, f"shared{rng.randrange(shared_domains)}.example"))
+
+    latencies, wrong, errors = [], 0, 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(client: str, name: str):
+        nonlocal wrong, errors
+        async with semaphore:
+            sent = time.monotonic()
+            try:
+                message = await query(port, name, client, timeout)
+            except (asyncio.TimeoutError, OSError):
+                errors += 1
+                return
+            latencies.append(time.monotonic() - sent)
+            if SERVER_IP not in [a.data for a in message.answers]:
+                wrong += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(client, name) for client, name in plan))
+    summary = latency_summary(latencies)
+    summary.update({"qps": round(len(latencies) / (time.monotonic() - started), 1), "wrong": wrong, "errors": errors})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость поиска правил SmartDNS в зависимости от числа групп")
+    parser.add_argument("--groups", default="0,10,100,1000")
+    parser.add_argument("--domains-per-group", type=int, default=20)
+    parser.add_argument("--shared-domains", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--smartdns-bin", help="Локальный бинарник SmartDNS вместо docker")
+    parser.add_argument("--image", default="pymumu/smartdns:latest")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ninja-dns-groups-")
+    generator = load_generator(os.path.join(work_dir, "data"))
+
+    print("🧪 Ninja DNS - Поиск правил SmartDNS при росте числа групп клиентов")
+    print("=" * 70)
+
+    success = True
+    for groups in (int(g) for g in args.groups.split(",")):
+        domains_data = build_domains_data(groups, args.domains_per_group, args.shared_domains)
+        conf_dir = os.path.join(work_dir, f"conf.d-{groups}")
+        os.makedirs(conf_dir)
+        # Путь общих правил, как его видит SmartDNS: в контейнере каталог смонтирован в /etc/smartdns/conf.d
+        shared_file = os.path.join(conf_dir if args.smartdns_bin else "/etc/smartdns/conf.d", "shared-rules.conf")
+        generated_at = time.monotonic()
+        config = generator.generate_smartdns_config(domains_data, shared_file)
+        shared_rules = generator.generate_shared_rules(domains_data)
+        generate_ms = (time.monotonic() - generated_at) * 1000
+
+        port = free_port()
+        config_file = os.path.join(work_dir, f"smartdns-{groups}.conf")
+        with open(config_file, "w", encoding="utf-8") as f:
+            f.write(bench_config(config, port))
+        with open(os.path.join(conf_dir, "shared-rules.conf"), "w", encoding="utf-8") as f:
+            f.write(shared_rules)
+
+        process = start_smartdns(args, config_file, conf_dir)
+        try:
+            startup = asyncio.run(wait_ready(port, 30))
+            result = asyncio.run(load(port, groups, args.domains_per_group, args.shared_domains, args.queries,
+                                      args.concurrency, args.timeout))
+        finally:
+            stop_smartdns(args, process)
+
+        success = success and result["wrong"] == 0 and result["errors"] == 0
+        print(f"  групп {groups:>5}  строк конфига {config.count(chr(10)) + 1:>7}  генерация {generate_ms:>8.1f}ms  "
+              f"старт {startup * 1000:>7.0f}ms | p50 {result['p50_ms']:>7}ms p99 {result['p99_ms']:>7}ms "
+              f"{result['qps']:>9} q/s | неверных {result['wrong']} ошибок {result['errors']}")
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Масштабирование генерации конфигов от 10 до 1M доменов
+
+Для каждого размера синтетического domains.json (категории, группы, block/passthrough,
+TTL - как в живом списке) замеряются этапы save_domains, load_domains,
+generate_smartdns_config, generate_sniproxy_config и generate_quic_config:
+время (лучший из --repeat прогонов), пиковая память (tracemalloc, отдельным прогоном,
+чтобы трассировка не искажала время) и размер результата.
+
+Результаты пишутся в JSON с хэшем коммита (по умолчанию в tests/results/, каталог
+в .gitignore); --compare сравнивает с прошлым файлом и завершается с ошибкой
+при регрессии времени или памяти больше --max-regression:
+
+    python config_scaling_bench.py --json scaling-new.json --compare scaling-main.json
+    python config_scaling_bench.py --sizes 10,1000,100000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ADMIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin")
+# Результаты по умолчанию - рядом с тестами, каталог в .gitignore
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+sys.path.insert(0, ADMIN_DIR)
+
+CATEGORIES = ["ai", "streaming", "social", "video", "misc"]
+TLDS = ["com", "net", "org", "io", "ru", "ai", "tv"]
+
+
+def load_generator(data_dir: str):
+    """DomainManager админки на временном каталоге данных (импорт main требует cwd=admin)"""
+    os.environ["DATA_DIR"] = data_dir
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    os.makedirs(os.path.join(data_dir, "smartdns"), exist_ok=True)
+    os.makedirs(os.path.join(data_dir, "sniproxy"), exist_ok=True)
+    os.chdir(ADMIN_DIR)
+    from app.main import DomainManager
+    return DomainManager()
+
+
+def synthetic_domains(size: int, seed: int = 1) -> dict:
+    """Список с долями настроек живого списка: 2% block, 1% passthrough, 5% TTL, 1% в группах"""
+    rng = random.Random(seed)
+    domains = []
+    for i in range(size):
+        domain = {
+            "name": f"svc{i}-{rng.getrandbits(24):06x}.{rng.choice(TLDS)}",
+            "category": rng.choice(CATEGORIES),
+            "enabled": rng.random() > 0.02,
+        }
+        roll = rng.random()
+        if roll < 0.02:
+            domain["action"] = "block"
+        elif roll < 0.03:
+            domain["action"] = "passthrough"
+        elif roll < 0.08:
+            domain["ttl"] = 3600
+        if rng.random() < 0.01:
+            domain["groups"] = ["family"]
+        domains.append(domain)
+    return {
+        "server_ip": "10.0.0.1",
+        "domains": domains,
+        "categories": {"streaming": {"https_policy": "own"}, "ai": {"proxy": {"limit_conn": 64}}},
+        "groups": {"family": {"clients": ["192.168.1.0/24"]}},
+    }
+
+
+def stages(generator, data: dict, domains_file: str) -> dict:
+    """Этап -> функция, возвращающая размер результата в байтах"""
+    return {
+        "save_domains": lambda: (generator.save_domains(data), os.path.getsize(domains_file))[1],
+        "load_domains": lambda: (generator.load_domains(), os.path.getsize(domains_file))[1],
+        "generate_smartdns_config": lambda: len(generator.generate_smartdns_config(data).encode())
+        + len(generator.generate_shared_rules(data).encode()),
+        "generate_sniproxy_config": lambda: len(generator.generate_sniproxy_config(data).encode()),
+        "generate_quic_config": lambda: len(json.dumps(generator.generate_quic_config(data)).encode()),
+    }
+
+
+def measure(stage, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output_bytes = stage()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    stage()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return {"seconds": round(best, 6), "peak_bytes": peak, "output_bytes": output_bytes}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ADMIN_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline_file: str, max_regression: float) -> bool:
+    """Регрессии по времени и памяти относительно прошлого файла (этапы короче 1ms по времени не сравниваются)"""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nℹ️  Сравнение с {baseline_file} (коммит {baseline.get('commit')})")
+    ok = True
+    for size, size_results in results.items():
+        for stage, current in size_results.items():
+            previous = baseline["results"].get(size, {}).get(stage)
+            if not previous:
+                continue
+            time_ratio = current["seconds"] / previous["seconds"] if previous["seconds"] >= 0.001 else 1.0
+            memory_ratio = current["peak_bytes"] / previous["peak_bytes"] if previous["peak_bytes"] else 1.0
+            regressed = time_ratio > max_regression or memory_ratio > max_regression
+            ok = ok and not regressed
+            if regressed or time_ratio < 1 / max_regression:
+                print(f"  {'❌' if regressed else '✅'} {size:>8} {stage:<26} время x{time_ratio:.2f}  память x{memory_ratio:.2f}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование генерации конфигов по числу доменов")
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3, help="Прогонов на этап (от 100k доменов - один)")
+    parser.add_argument("--json", help="Файл результатов (по умолчанию tests/results/config-scaling-<коммит>.json)")
+    parser.add_argument("--compare", help="Прошлый файл результатов")
+    parser.add_argument("--max-regression", type=float, default=1.5)
+    args = parser.parse_args()
+
+    # Пути до load_generator: он меняет cwd на admin/
+    output = os.path.abspath(args.json or os.path.join(RESULTS_DIR, f"config-scaling-{git_commit()}.json"))
+    compare_file = os.path.abspath(args.compare) if args.compare else None
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    data_dir = tempfile.mkdtemp(prefix="ninja-dns-scaling-")
+    generator = load_generator(data_dir)
+    domains_file = os.path.join(data_dir, "domains.json")
+
+    print("🧪 Ninja DNS - Масштабирование генерации конфигов")
+    print("=" * 70)
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(",")):
+        data = synthetic_domains(size)
+        repeat = args.repeat if size < 100000 else 1
+        results[str(size)] = {}
+        for stage, run in stages(generator, data, domains_file).items():
+            result = measure(run, repeat)
+            results[str(size)][stage] = result
+            print(f"  {size:>8} {stage:<26} {result['seconds'] * 1000:>11.2f}ms  "
+                  f"пик {result['peak_bytes'] / 1e6:>9.1f}MB  вывод {result['output_bytes'] / 1e6:>9.2f}MB")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "started": time.time(),
+            "results": results,
+        }, f, indent=2)
+    print(f"ℹ️  Результаты: {output}")
+
+    if compare_file and not compare(results, compare_file, args.max_regression):
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест проверки DNS через nonce-поддомены
+Каждая проверка: GET /dns-check/nonce, затем GET /dns-probe.gif с Host <nonce>.<TEST_DOMAIN>.
+Проверяет пропускную способность, что /api/dns-check/stats сходится с числом проверок
+и что повторы пробы с тем же nonce не засчитываются как новые успехи.
+
+Использование:
+    python dns_check_load_test.py [--workers 2] [--duration 10] [--concurrency 64] [--min-rate 1000]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import requests
+
+from bench_utils import AdminServer, HTTPConnection, latency_summary
+
+TEST_DOMAIN = "test.dns.uzicus.ru"
+
+
+async def run_checks(port: int, duration: float, concurrency: int):
+    deadline = time.monotonic() + duration
+    latencies = []
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        api = HTTPConnection("127.0.0.1", port)
+        probe = HTTPConnection("127.0.0.1", port)
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                status, _, body = await api.request("GET", "/dns-check/nonce")
+                probe_host = json.loads(body)["probe_host"]
+                status, _, _ = await probe.request("GET", "/dns-probe.gif", headers={"Host": probe_host})
+                if status == 200:
+                    latencies.append(time.monotonic() - started)
+                else:
+                    failures += 1
+            except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+                failures += 1
+                await api.close()
+                await probe.close()
+        await api.close()
+        await probe.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест nonce-проверки DNS")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--min-rate", type=float, default=1000.0, help="Минимум проверок в секунду")
+    parser.add_argument("--replays", type=int, default=5, help="Повторов пробы с одним nonce после нагрузки")
+    args = parser.parse_args()
+
+    print("🧪 Ninja DNS - Нагрузка на nonce-проверку DNS")
+    print("=" * 50)
+
+    with AdminServer(workers=args.workers, env={"HOST_DOMAIN": "dns.uzicus.ru", "TEST_SUBDOMAIN": "test"}) as server:
+        latencies, failures = asyncio.run(run_checks(server.port, args.duration, args.concurrency))
+        # Повтор пробы с тем же nonce (перезагрузка картинки) не должен считаться новым успехом
+        replay_host = requests.get(f"{server.base_url}/dns-check/nonce", timeout=5).json()["probe_host"]
+        replays = [requests.get(f"{server.base_url}/dns-probe.gif", headers={"Host": replay_host}, timeout=5)
+                   for _ in range(args.replays)]
+        time.sleep(1.5)  # счетчики воркеров сбрасываются раз в секунду
+        stats = requests.get(f"{server.base_url}/api/dns-check/stats", timeout=5).json()
+
+    rate = len(latencies) / args.duration
+    summary = latency_summary(latencies)
+    print(f"ℹ️  Проверок: {len(latencies)}, ошибок: {failures}, {rate:.0f} проверок/с")
+    print(f"ℹ️  Латентность проверки: p50 {summary['p50_ms']}ms, p99 {summary['p99_ms']}ms")
+    print(f"ℹ️  Статистика сервера: {stats}")
+
+    success = True
+    if rate < args.min_rate:
+        print(f"❌ Пропускная способность ниже {args.min_rate:.0f} проверок/с")
+        success = False
+    if stats["succeeded"] < len(latencies):
+        print("❌ Сервер учел меньше успешных проверок, чем выполнено")
+        success = False
+    if stats["replayed"] < len(replays) - 1 or stats["success_rate"] > 1:
+        print(f"❌ Повторы одного nonce засчитаны как успехи (повторов учтено {stats['replayed']} "
+              f"из {len(replays) - 1}, доля {stats['success_rate']})")
+        success = False
+    if any(response.status_code != 200 for response in replays):
+        print("❌ Повтор пробы с действующим nonce не получил картинку")
+        success = False
+    if success:
+        print("✅ Nonce-проверка выдерживает заданную нагрузку")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
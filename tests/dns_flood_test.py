@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Флуд-тест защиты открытого резолвера
+Задержка легитимного клиента замеряется без нагрузки и под флудом с других адресов
+(127.2.x.x на lo - случайные поддомены, чтобы каждый запрос шел в рекурсию).
+С примененными правилами (scripts/apply-nftables.sh) флуд срезается в ядре
+и p99 легитимного клиента остается на месте.
+
+Легитимный клиент по умолчанию 127.3.0.1: адреса внутренних сетей (127.0.0.1 и т.п.)
+обходят ACL и лимит, и замер с них ничего не говорит о правилах. При включенном
+ACL адрес легитимного клиента нужно добавить в разрешенные.
+
+Запускать на сервере от root:
+    python dns_flood_test.py --name chatgpt.com --attack-qps 20000 --duration 10
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from bench_utils import latency_summary
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app import dns_wire  # noqa: E402
+
+
+def flood(server: str, port: int, sources: list, qps: int, duration: float, stop):
+    """Отдельный процесс: флуд не конкурирует с замерами за event loop"""
+    sockets = []
+    for source in sources:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((source, 0))
+        sock.setblocking(False)
+        sockets.append(sock)
+    queries = [dns_wire.build_query(f"{random.getrandbits(48):x}.example.com") for _ in range(1000)]
+
+    interval = 1.0 / qps
+    next_send = time.monotonic()
+    deadline = next_send + duration
+    i = 0
+    while not stop.is_set() and time.monotonic() < deadline:
+        try:
+            sockets[i % len(sockets)].sendto(queries[i % len(queries)], (server, port))
+        except (BlockingIOError, OSError):
+            pass
+        i += 1
+        next_send += interval
+        delay = next_send - time.monotonic()
+        if delay > 0.001:
+            time.sleep(delay)
+
+
+async def legit(server: str, port: int, name: str, source: str, qps: float, duration: float, timeout: float):
+    latencies, lost = [], 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        sent = time.monotonic()
+        try:
+            await dns_wire.query_udp(server, port, dns_wire.build_query(name), timeout=timeout, local_addr=(source, 0))
+            latencies.append(time.monotonic() - sent)
+        except (asyncio.TimeoutError, OSError):
+            lost += 1
+        await asyncio.sleep(max(0.0, 1.0 / qps - (time.monotonic() - sent)))
+    return latencies, lost
+
+
+def nft_counters() -> dict:
+    try:
+        output = subprocess.run(["nft", "-j", "list", "counters", "table", "inet", "ninja_dns"],
+                                capture_output=True, check=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    return {item["counter"]["name"]: item["counter"]["packets"]
+            for item in json.loads(output).get("nftables", []) if "counter" in item}
+
+
+def internal_networks() -> list:
+    """Сети в обход ACL и лимита: из примененной таблицы nftables, иначе ACL_INTERNAL_NETWORKS как в админке"""
+    networks = []
+    for version in (4, 6):
+        try:
+            output = subprocess.run(["nft", "-j", "list", "set", "inet", "ninja_dns", f"internal_v{version}"],
+                                    capture_output=True, check=True, text=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            networks = []
+            break
+        for item in json.loads(output).get("nftables", []):
+            for element in item.get("set", {}).get("elem", []):
+                if isinstance(element, str):
+                    networks.append(ipaddress.ip_network(element))
+                elif "prefix" in element:
+                    networks.append(ipaddress.ip_network(f"{element['prefix']['addr']}/{element['prefix']['len']}"))
+    if networks:
+        return networks
+    default = "127.0.0.1/32,::1/128,172.16.0.0/12"
+    return [ipaddress.ip_network(n.strip()) for n in os.getenv("ACL_INTERNAL_NETWORKS", default).split(",") if n.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Флуд-тест: задержка легитимных запросов под атакой")
+    parser.add_argument("--server", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=53)
+    parser.add_argument("--name", default="chatgpt.com", help="Имя легитимного клиента (из списка, ответ из кэша)")
+    parser.add_argument("--legit-source", default="127.3.0.1", help="Адрес легитимного клиента вне внутренних сетей")
+    parser.add_argument("--legit-qps", type=float, default=50)
+    parser.add_argument("--attack-sources", default="127.2.0.0/28")
+    parser.add_argument("--attack-qps", type=int, default=20000)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--max-p99-ratio", type=float, default=2.0, help="Допустимый рост p99 под флудом")
+    args = parser.parse_args()
+
+    sources = [str(ip) for ip in ipaddress.ip_network(args.attack_sources).hosts()]
+
+    print("🧪 Ninja DNS - Флуд-тест защиты резолвера")
+    print("=" * 50)
+
+    # Внутренние сети не проходят через ACL и лимит: с такого адреса проверка всегда проходит
+    bypass = [network for network in internal_networks()
+              if ipaddress.ip_address(args.legit_source) in network or
+              any(ipaddress.ip_address(source) in network for source in sources)]
+    if bypass:
+        print(f"❌ Легитимный клиент или флуд во внутренней сети {', '.join(map(str, bypass))}: "
+              f"ACL и лимит их не касаются, выберите --legit-source/--attack-sources вне нее")
+        sys.exit(1)
+
+    baseline, baseline_lost = asyncio.run(legit(args.server, args.port, args.name, args.legit_source,
+                                                args.legit_qps, args.duration, args.timeout))
+    before = nft_counters()
+
+    stop = multiprocessing.Event()
+    attacker = multiprocessing.Process(target=flood, args=(args.server, args.port, sources, args.attack_qps,
+                                                           args.duration + 1, stop))
+    attacker.start()
+    try:
+        time.sleep(0.5)
+        attacked, attacked_lost = asyncio.run(legit(args.server, args.port, args.name, args.legit_source,
+                                                    args.legit_qps, args.duration, args.timeout))
+    finally:
+        stop.set()
+        attacker.join()
+    after = nft_counters()
+
+    base, under = latency_summary(baseline), latency_summary(attacked)
+    print(f"ℹ️  Без нагрузки: p50 {base['p50_ms']}ms p99 {base['p99_ms']}ms, потеряно {baseline_lost}")
+    print(f"ℹ️  Под флудом {args.attack_qps} q/s с {len(sources)} адресов: p50 {under['p50_ms']}ms "
+          f"p99 {under['p99_ms']}ms, потеряно {attacked_lost}")
+    if after:
+        for counter in ("refused", "rate_limited", "accepted"):
+            print(f"ℹ️  nft {counter}: +{after.get(counter, 0) - before.get(counter, 0)}")
+    else:
+        print("⚠️  Счетчики nftables недоступны (правила не применены или нет прав)")
+
+    checks = [
+        (bool(baseline), "легитимный клиент получает ответы"),
+        (under["p99_ms"] <= base["p99_ms"] * args.max_p99_ratio + 2.0, "p99 под флудом не вырос"),
+        (attacked_lost <= baseline_lost + 1, "легитимные запросы не теряются под флудом"),
+    ]
+    success = True
+    for ok, description in checks:
+        print(f"{'✅' if ok else '❌'} {description}")
+        success = success and ok
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный генератор DNS: UDP, TCP, DoT и DoH в wire-формате
+Открытый цикл: запросы уходят по расписанию заданной частоты (равномерно или
+пуассоновски) независимо от ответов, задержка считается от запланированного
+момента отправки - перегрузка видна в p99, а не прячется замедлением клиента.
+
+Смесь имен: hijacked (домены из списка, локальный ответ), hit (популярные
+имена, прогреваются перед шагом) и miss (уникальные поддомены, всегда апстрим).
+
+Локально, без стека и интернета (стенд standin_dns с имитацией кэша):
+    python dns_load_bench.py --local --rates 1000,5000,10000
+
+Против docker-compose стека:
+    python dns_load_bench.py --server-ip 185.237.95.211 \\
+        --target udp=udp://127.0.0.1:53 --target tcp=tcp://127.0.0.1:53 \\
+        --target dot=tls://dns.example.com:853 --target doh=https://dns.example.com/dns-query \\
+        --rates 500,1000,2000 --json load.json
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import ssl
+import struct
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from bench_utils import latency_summary
+from dns_tls_path_bench import http_response, read_http_request, start_stream_server
+from standin_dns import StandinResolver, self_signed_context
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app import dns_wire  # noqa: E402
+
+DEFAULT_PORTS = {"udp": 53, "tcp": 53, "tls": 853, "https": 443}
+CLASSES = ("hijacked", "hit", "miss")
+HIJACKED_NAMES = ["chatgpt.com", "claude.ai", "openai.com", "youtube.com", "netflix.com", "instagram.com"]
+HIT_NAMES = ["google.com", "wikipedia.org", "github.com", "cloudflare.com", "apple.com", "microsoft.com",
+             "amazon.com", "yandex.ru", "vk.com", "mozilla.org"]
+LOCAL_SERVER_IP = "10.0.0.1"
+
+
+def parse_target(url: str) -> Dict[str, object]:
+    parts = urlsplit(url)
+    protocol = parts.scheme.lower()
+    if protocol not in DEFAULT_PORTS:
+        raise ValueError(f"Unsupported target protocol: {url}")
+    return {"protocol": protocol, "host": parts.hostname, "port": parts.port or DEFAULT_PORTS[protocol],
+            "path": parts.path or "/dns-query"}
+
+
+class QueryIds:
+    """16-битные ID запросов, уникальные среди ожидающих ответа"""
+
+    def __init__(self):
+        self.counter = random.getrandbits(16)
+
+    def next(self, pending: dict) -> int:
+        for _ in range(65536):
+            self.counter = (self.counter + 1) & 0xFFFF
+            if self.counter not in pending:
+                return self.counter
+        raise RuntimeError("65536 queries in flight")
+
+
+class _Receiver(asyncio.DatagramProtocol):
+    def __init__(self, pending: dict):
+        self.pending = pending
+
+    def datagram_received(self, data, addr):
+        future = self.pending.get(struct.unpack(">H", data[:2])[0]) if len(data) >= 12 else None
+        if future and not future.done():
+            future.set_result(data)
+
+
+class UDPChannel:
+    """Несколько UDP сокетов, ответы сопоставляются по ID"""
+
+    def __init__(self, host: str, port: int, sockets: int):
+        self.host, self.port, self.sockets = host, port, sockets
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.ids = QueryIds()
+        self.transports = []
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        for _ in range(self.sockets):
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _Receiver(self.pending), remote_addr=(self.host, self.port)
+            )
+            self.transports.append(transport)
+
+    async def query(self, name: str, qtype: str, timeout: float) -> bytes:
+        qid = self.ids.next(self.pending)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[qid] = future
+        try:
+            self.transports[qid % len(self.transports)].sendto(dns_wire.build_query(name, qtype, qid))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(qid, None)
+
+    async def close(self):
+        for transport in self.transports:
+            transport.close()
+
+
+class _PipelinedConnection:
+    """TCP/DoT соединение с несколькими запросами в полете (RFC 7766), ответы по ID"""
+
+    def __init__(self, target: dict, tls: Optional[ssl.SSLContext], timeout: float):
+        self.target, self.tls, self.timeout = target, tls, timeout
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lock = asyncio.Lock()
+        self.connects = 0
+
+    async def ensure(self):
+        async with self.lock:
+            if self.writer is None:
+                reader, self.writer = await dns_wire.open_stream(
+                    self.target["host"], self.target["port"], tls=self.tls,
+                    server_name=self.target["host"], timeout=self.timeout
+                )
+                self.connects += 1
+                asyncio.ensure_future(self._read_loop(reader, self.writer))
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                data = await dns_wire.read_tcp_message(reader)
+                future = self.pending.get(struct.unpack(">H", data[:2])[0])
+                if future and not future.done():
+                    future.set_result(data)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ssl.SSLError) as e:
+            error = e
+        if self.writer is writer:
+            self.writer = None
+        writer.close()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Connection closed: {error!r}"))
+
+    async def query(self, qid: int, message: bytes, timeout: float) -> bytes:
+        await self.ensure()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[qid] = future
+        try:
+            self.writer.write(dns_wire.frame_tcp(message))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(qid, None)
+
+
+class StreamChannel:
+    """Пул TCP/DoT соединений; запросы распределяются по кругу"""
+
+    def __init__(self, target: dict, connections: int, timeout: float):
+        tls = dns_wire.insecure_tls_context(["dot"]) if target["protocol"] == "tls" else None
+        self.connections = [_PipelinedConnection(target, tls, timeout) for _ in range(connections)]
+        self.ids = QueryIds()
+        self.pending: Dict[int, bool] = {}
+        self.index = 0
+
+    async def open(self):
+        await asyncio.gather(*(c.ensure() for c in self.connections))
+
+    async def query(self, name: str, qtype: str, timeout: float) -> bytes:
+        qid = self.ids.next(self.pending)
+        self.pending[qid] = True
+        self.index = (self.index + 1) % len(self.connections)
+        try:
+            return await self.connections[self.index].query(qid, dns_wire.build_query(name, qtype, qid), timeout)
+        finally:
+            self.pending.pop(qid, None)
+
+    @property
+    def reconnects(self) -> int:
+        return sum(max(0, c.connects - 1) for c in self.connections)
+
+    async def close(self):
+        for connection in self.connections:
+            if connection.writer:
+                connection.writer.close()
+
+
+class DohChannel:
+    """Пул HTTP/1.1 keep-alive соединений DoH, один запрос в полете на соединение"""
+
+    def __init__(self, target: dict, connections: int, timeout: float):
+        self.target, self.max_connections, self.timeout = target, connections, timeout
+        self.idle: asyncio.Queue = asyncio.Queue()
+        self.opened = 0
+        self.reconnects = 0
+
+    async def _connect(self):
+        return await dns_wire.open_stream(self.target["host"], self.target["port"],
+                                          tls=dns_wire.insecure_tls_context(["http/1.1"]),
+                                          server_name=self.target["host"], timeout=self.timeout)
+
+    async def open(self):
+        for _ in range(self.max_connections):
+            await self.idle.put(await self._connect())
+            self.opened += 1
+
+    async def query(self, name: str, qtype: str, timeout: float) -> bytes:
+        if self.idle.empty() and self.opened < self.max_connections:
+            self.opened += 1
+            self.reconnects += 1
+            try:
+                connection = await self._connect()
+            except BaseException:
+                self.opened -= 1
+                raise
+        else:
+            connection = await self.idle.get()
+        reader, writer = connection
+        try:
+            response = await dns_wire.query_doh(reader, writer, self.target["host"], self.target["path"],
+                                                dns_wire.build_query(name, qtype, 0), timeout)
+        except BaseException:
+            # Ответ мог прийти позже и сбить очередь keep-alive: соединение не переиспользуем
+            writer.close()
+            self.opened -= 1
+            raise
+        self.idle.put_nowait(connection)
+        return response
+
+    async def close(self):
+        while not self.idle.empty():
+            _, writer = self.idle.get_nowait()
+            writer.close()
+
+
+def make_channel(target: dict, args):
+    if target["protocol"] == "udp":
+        return UDPChannel(target["host"], target["port"], args.sockets)
+    if target["protocol"] == "https":
+        return DohChannel(target, args.connections, args.timeout)
+    return StreamChannel(target, args.connections, args.timeout)
+
+
+class NameMix:
+    """Имя очередного запроса по долям классов"""
+
+    def __init__(self, mix: Dict[str, float], hijacked: List[str], hit: List[str], miss_zone: str, seed: int,
+                 miss_tag: str = ""):
+        total = sum(mix.values())
+        self.weights = [mix.get(c, 0) / total for c in CLASSES]
+        self.names = {"hijacked": hijacked, "hit": hit}
+        self.miss_zone = miss_zone
+        # Метка прогона и цели в именах промахов: иначе следующая цель получает их уже из кэша
+        self.miss_suffix = f"-{miss_tag}.{miss_zone}" if miss_tag else f".{miss_zone}"
+        self.rng = random.Random(seed)
+
+    def next(self) -> Tuple[str, str]:
+        kind = self.rng.choices(CLASSES, self.weights)[0]
+        if kind == "miss":
+            return kind, f"{self.rng.getrandbits(48):012x}{self.miss_suffix}"
+        return kind, self.rng.choice(self.names[kind])
+
+
+async def run_step(channel, mix: NameMix, rate: float, duration: float, poisson: bool, timeout: float,
+                   max_inflight: int, server_ip: Optional[str]) -> dict:
+    loop = asyncio.get_running_loop()
+    counts = {"sent": 0, "ok": 0, "timeouts": 0, "rcode_errors": 0, "conn_errors": 0, "wrong": 0, "overload": 0}
+    latencies: Dict[str, List[float]] = {c: [] for c in CLASSES}
+    tasks = set()
+
+    async def one(kind: str, name: str, scheduled: float):
+        try:
+            response = await channel.query(name, "A", timeout)
+        except asyncio.TimeoutError:
+            counts["timeouts"] += 1
+            return
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ssl.SSLError, ValueError):
+            counts["conn_errors"] += 1
+            return
+        latencies[kind].append(loop.time() - scheduled)
+        message = dns_wire.parse_message(response)
+        if message.rcode not in (dns_wire.RCODE_NOERROR, dns_wire.RCODE_NXDOMAIN):
+            counts["rcode_errors"] += 1
+        elif kind == "hijacked" and server_ip and server_ip not in [a.data for a in message.answers]:
+            counts["wrong"] += 1
+        else:
+            counts["ok"] += 1
+
+    started = loop.time()
+    scheduled = started
+    deadline = started + duration
+    while scheduled < deadline:
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind, name = mix.next()
+        counts["sent"] += 1
+        if len(tasks) >= max_inflight:
+            counts["overload"] += 1
+        else:
+            task = asyncio.ensure_future(one(kind, name, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        scheduled += mix.rng.expovariate(rate) if poisson else 1.0 / rate
+    send_lag = max(0.0, loop.time() - deadline)
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    errors = counts["sent"] - counts["ok"]
+    return {
+        "rate": rate,
+        **counts,
+        "qps": round(counts["ok"] / elapsed, 1),
+        "error_rate": round(errors / counts["sent"], 4) if counts["sent"] else 0.0,
+        "send_lag_ms": round(send_lag * 1000, 1),
+        **latency_summary(all_latencies),
+        "classes": {kind: latency_summary(values) for kind, values in latencies.items() if values},
+        "reconnects": getattr(channel, "reconnects", 0),
+    }
+
+
+async def prewarm(channel, names: List[str], timeout: float):
+    """hit имена должны быть в кэше до замера"""
+    for name in names:
+        try:
+            await channel.query(name, "A", timeout)
+        except (asyncio.TimeoutError, OSError, ConnectionError):
+            pass
+
+
+class CachingStandin(StandinResolver):
+    """Стенд с имитацией SmartDNS: перехваченные имена - сразу server_ip, промах кэша - задержка апстрима"""
+
+    def __init__(self, hijacked: List[str], server_ip: str, miss_delay: float):
+        super().__init__()
+        self.hijacked = set(hijacked)
+        self.server_ip = server_ip
+        self.miss_delay = miss_delay
+        self.cache = set()
+        # Вызывается на каждый неперехваченный ответ: (имя, тип, попадание в кэш)
+        self.on_answer: Optional[Callable[[str, int, bool], None]] = None
+
+    async def _delayed(self, query: bytes) -> Optional[bytes]:
+        name, qtype = dns_wire.parse_message(query).question
+        name = name.lower()
+        if name in self.hijacked:
+            self.stats["queries"] += 1
+            return dns_wire.build_response(
+                query, [(dns_wire.QTYPES["A"], self.ttl, ipaddress.IPv4Address(self.server_ip).packed)]
+            )
+        hit = name in self.cache
+        if not hit:
+            await asyncio.sleep(self.miss_delay)
+            self.cache.add(name)
+        if self.on_answer is not None:
+            self.on_answer(name, qtype, hit)
+        return self.respond(query)
+
+
+async def start_local(args):
+    """UDP, TCP, DoT и DoH стенда; DoH отвечает из того же процесса, как bind-https SmartDNS"""
+    resolver = CachingStandin(args.hijacked, LOCAL_SERVER_IP, args.miss_delay)
+    tls = self_signed_context("dns.local")
+    udp_port = await resolver.start_udp()
+    tcp_port = await resolver.start_tcp()
+    dot_port = await resolver.start_tcp(tls=tls)
+
+    async def doh(reader, writer):
+        query = await read_http_request(reader)
+        writer.write(http_response(await resolver._delayed(query)))
+        await writer.drain()
+
+    doh_server = await start_stream_server(doh, tls)
+    targets = {
+        "udp": f"udp://127.0.0.1:{udp_port}",
+        "tcp": f"tcp://127.0.0.1:{tcp_port}",
+        "dot": f"tls://127.0.0.1:{dot_port}",
+        "doh": f"https://127.0.0.1:{doh_server.sockets[0].getsockname()[1]}/dns-query",
+    }
+    return resolver, doh_server, targets
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        kind, _, share = item.partition("=")
+        if kind not in CLASSES:
+            raise argparse.ArgumentTypeError(f"unknown class '{kind}', expected {', '.join(CLASSES)}")
+        mix[kind] = float(share)
+    return mix
+
+
+def default_hijacked() -> List[str]:
+    """Домены из domains.json рядом с репозиторием, иначе встроенный список"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "domains.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            names = [d["name"] for d in json.load(f).get("domains", []) if d.get("enabled", True)]
+    except (OSError, ValueError):
+        names = []
+    return names or HIJACKED_NAMES
+
+
+async def run(args) -> Dict[str, list]:
+    resolver = doh_server = None
+    server_ip = args.server_ip
+    if args.local:
+        resolver, doh_server, targets = await start_local(args)
+        server_ip = LOCAL_SERVER_IP
+    else:
+        targets = dict(target.split("=", 1) for target in args.target)
+
+    results = {}
+    # Промахи уникальны для прогона и цели: одна и та же последовательность классов, но свои имена
+    run_nonce = os.urandom(3).hex()
+    try:
+        for label, url in targets.items():
+            channel = make_channel(parse_target(url), args)
+            await channel.open()
+            await prewarm(channel, args.hit, args.timeout)
+            results[label] = []
+            for rate in args.rates:
+                miss_tag = run_nonce + "".join(c for c in label.lower() if c.isalnum())[:16]
+                mix = NameMix(args.mix, args.hijacked, args.hit, args.miss_zone, seed=int(rate), miss_tag=miss_tag)
+                step = await run_step(channel, mix, rate, args.duration, args.arrival == "poisson", args.timeout,
+                                      args.max_inflight, server_ip)
+                step["target"] = url
+                results[label].append(step)
+                print(f"  {label:<6} {rate:>8.0f} q/s -> {step['qps']:>9} q/s  p50 {step['p50_ms']:>8}ms  "
+                      f"p95 {step['p95_ms']:>8}ms  p99 {step['p99_ms']:>8}ms  ошибок {step['error_rate']:.2%}"
+                      f"{'  (генератор отстает на ' + str(step['send_lag_ms']) + 'ms)' if step['send_lag_ms'] > 100 else ''}")
+            await channel.close()
+    finally:
+        if doh_server:
+            # Стенд должен увидеть закрытие клиентских соединений до остановки цикла
+            await asyncio.sleep(0.2)
+            doh_server.close()
+        if resolver:
+            resolver.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Открытый нагрузочный генератор DNS: UDP, TCP, DoT, DoH")
+    parser.add_argument("--local", action="store_true", help="Стенд standin_dns вместо стека")
+    parser.add_argument("--target", action="append", default=[],
+                        help="label=url: udp://, tcp://, tls://host:853, https://host/dns-query")
+    parser.add_argument("--rates", default="500,1000,2000", help="Шаги частоты, q/s через запятую")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность шага, с")
+    parser.add_argument("--arrival", choices=("fixed", "poisson"), default="poisson")
+    parser.add_argument("--mix", type=parse_mix, default="hijacked=40,hit=40,miss=20")
+    parser.add_argument("--hijacked", default=None, help="Перехваченные имена через запятую (по умолчанию domains.json)")
+    parser.add_argument("--hit", default=",".join(HIT_NAMES), help="Имена-попадания через запятую")
+    parser.add_argument("--miss-zone", default="example.com", help="Зона уникальных поддоменов-промахов")
+    parser.add_argument("--miss-delay", type=float, default=0.03, help="--local: задержка апстрима при промахе, с")
+    parser.add_argument("--server-ip", help="Ожидаемый ответ перехваченных имен (SERVER_IP)")
+    parser.add_argument("--sockets", type=int, default=4, help="UDP сокетов")
+    parser.add_argument("--connections", type=int, default=8, help="TCP/DoT/DoH соединений")
+    parser.add_argument("--max-inflight", type=int, default=20000)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Код выхода 1, если шаг хуже")
+    parser.add_argument("--json", help="Сохранить результаты в файл")
+    args = parser.parse_args()
+
+    if not args.local and not args.target:
+        parser.error("нужен --local или хотя бы один --target")
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+    args.rates = [float(r) for r in args.rates.split(",")]
+    args.hijacked = args.hijacked.split(",") if args.hijacked else default_hijacked()
+    args.hit = args.hit.split(",")
+
+    print("🧪 Ninja DNS - Нагрузка DNS (открытый цикл)")
+    print("=" * 70)
+    print(f"ℹ️  Смесь {args.mix}, поступление {args.arrival}, шаг {args.duration}s")
+    started = time.time()
+    results = asyncio.run(run(args))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"started": started, "mix": args.mix, "arrival": args.arrival, "results": results}, f, indent=2)
+        print(f"ℹ️  Результаты: {args.json}")
+
+    worst = max(step["error_rate"] for steps in results.values() for step in steps)
+    print(f"{'✅' if worst <= args.max_error_rate else '❌'} максимальная доля ошибок {worst:.2%}")
+    sys.exit(0 if worst <= args.max_error_rate else 1)
+
+
+if __name__ == "__main__":
+    main()
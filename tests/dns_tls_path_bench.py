@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+p50/p99 задержки DoT и DoH: режим traefik (Traefik терминирует TLS, DoH через doh-proxy по UDP)
+против native (bind-tls/bind-https в SmartDNS)
+
+Локально (без стека): оба режима собираются из стенда standin_dns и ретрансляторов,
+повторяющих user-space хопы стека. В native Traefik остается на пути: DoT проходит
+TCP роутер без расшифровки (passthrough), DoH Traefik терминирует и отправляет
+по пулу TLS соединений в bind-https, так что native-doh - это два TLS участка:
+
+    python dns_tls_path_bench.py --local
+
+На сервере - произвольные цели label=url (tls://host:port, https://host:port/dns-query, udp://host:port):
+
+    python dns_tls_path_bench.py --target traefik-dot=tls://dns.example.com:853 \\
+        --target native-doh=https://smartdns:8053/dns-query
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import sys
+import time
+from typing import Optional
+
+from bench_utils import latency_summary
+from standin_dns import StandinResolver, self_signed_context
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app import dns_wire  # noqa: E402
+from app.upstreams import parse_candidate  # noqa: E402
+
+NAMES = ["chatgpt.com", "claude.ai", "google.com", "youtube.com", "wikipedia.org"]
+
+
+async def read_http_request(reader: asyncio.StreamReader) -> bytes:
+    """Тело DoH POST запроса (HTTP/1.1 keep-alive)"""
+    request_line = await reader.readline()
+    if not request_line:
+        raise asyncio.IncompleteReadError(b"", None)
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    return await reader.readexactly(length)
+
+
+def http_response(body: bytes) -> bytes:
+    return (
+        f"HTTP/1.1 200 OK\r\nContent-Type: application/dns-message\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode("ascii") + body
+
+
+async def start_stream_server(handler, tls: Optional[ssl.SSLContext] = None) -> asyncio.AbstractServer:
+    """Keep-alive сервер: handler обрабатывает один запрос на соединении"""
+    async def serve(reader, writer):
+        try:
+            while True:
+                await handler(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(serve, "127.0.0.1", 0, ssl=tls)
+
+
+class BackendPool:
+    """Простаивающие keep-alive соединения Traefik к бэкенду"""
+
+    def __init__(self):
+        self.idle = []
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+
+
+async def build_local_targets(resolver: StandinResolver, tls: ssl.SSLContext):
+    """Цели для локального сравнения и список серверов для закрытия"""
+    udp_port = await resolver.start_udp()
+    tcp_port = await resolver.start_tcp()
+    direct_dot_port = await resolver.start_tcp(tls=tls)
+
+    # Traefik DoT: TLS терминируется, запрос уходит новым TCP соединением к smartdns:53
+    async def traefik_dot(reader, writer):
+        query = await dns_wire.read_tcp_message(reader)
+        upstream_reader, upstream_writer = await dns_wire.open_stream("127.0.0.1", tcp_port)
+        try:
+            response = await dns_wire.query_stream(upstream_reader, upstream_writer, query)
+        finally:
+            upstream_writer.close()
+        writer.write(dns_wire.frame_tcp(response))
+        await writer.drain()
+
+    # Traefik -> doh-proxy -> UDP smartdns:53: два HTTP хопа и переупаковка в UDP
+    async def doh_proxy(reader, writer):
+        query = await read_http_request(reader)
+        response = await dns_wire.query_udp("127.0.0.1", udp_port, query)
+        writer.write(http_response(response))
+        await writer.drain()
+
+    doh_proxy_server = await start_stream_server(doh_proxy)
+    doh_proxy_port = doh_proxy_server.sockets[0].getsockname()[1]
+
+    async def traefik_doh(reader, writer):
+        body = await read_http_request(reader)
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", doh_proxy_port)
+        try:
+            response = await dns_wire.query_doh(upstream_reader, upstream_writer, "doh-proxy", "/dns-query", body)
+        finally:
+            upstream_writer.close()
+        writer.write(http_response(response))
+        await writer.drain()
+
+    # bind-https: ответ в том же процессе, что и кэш
+    async def bind_https(reader, writer):
+        query = await read_http_request(reader)
+        writer.write(http_response(resolver.respond(query)))
+        await writer.drain()
+
+    bind_https_server = await start_stream_server(bind_https, tls)
+    bind_https_port = bind_https_server.sockets[0].getsockname()[1]
+    backend_pool = BackendPool()
+
+    # Traefik -> https://smartdns:8053: TLS терминируется и запрос уходит по keep-alive TLS из пула
+    async def native_doh(reader, writer):
+        body = await read_http_request(reader)
+        if backend_pool.idle:
+            backend = backend_pool.idle.pop()
+        else:
+            backend = await dns_wire.open_stream("127.0.0.1", bind_https_port,
+                                                 tls=dns_wire.insecure_tls_context(["http/1.1"]),
+                                                 server_name="dns.local")
+        response = await dns_wire.query_doh(*backend, "dns.local", "/dns-query", body)
+        backend_pool.idle.append(backend)
+        writer.write(http_response(response))
+        await writer.drain()
+
+    # Traefik TCP роутер с tls.passthrough: байты без расшифровки в bind-tls
+    async def dot_passthrough(reader, writer):
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", direct_dot_port)
+
+        async def pipe(source, sink):
+            try:
+                while data := await source.read(65536):
+                    sink.write(data)
+                    await sink.drain()
+            except ConnectionError:
+                pass
+            finally:
+                sink.close()
+
+        await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+    passthrough_server = await asyncio.start_server(dot_passthrough, "127.0.0.1", 0)
+    servers = [backend_pool, doh_proxy_server, bind_https_server, passthrough_server]
+    ports = {"native-dot": passthrough_server.sockets[0].getsockname()[1]}
+    for label, handler in (("traefik-dot", traefik_dot), ("traefik-doh", traefik_doh), ("native-doh", native_doh)):
+        server = await start_stream_server(handler, tls)
+        servers.append(server)
+        ports[label] = server.sockets[0].getsockname()[1]
+
+    targets = {
+        "traefik-dot": f"tls://127.0.0.1:{ports['traefik-dot']}",
+        "native-dot": f"tls://127.0.0.1:{ports['native-dot']}",
+        "traefik-doh": f"https://127.0.0.1:{ports['traefik-doh']}/dns-query",
+        "native-doh": f"https://127.0.0.1:{ports['native-doh']}/dns-query",
+    }
+    return targets, servers
+
+
+async def client(candidate, queries: int, timeout: float, latencies: list, errors: list):
+    """Один клиент: keep-alive соединение и последовательные запросы, как у браузера или ОС"""
+    if candidate["protocol"] == "udp":
+        for i in range(queries):
+            sent = time.monotonic()
+            try:
+                await dns_wire.query_udp(candidate["host"], candidate["port"],
+                                         dns_wire.build_query(NAMES[i % len(NAMES)]), timeout=timeout)
+                latencies.append(time.monotonic() - sent)
+            except (asyncio.TimeoutError, OSError):
+                errors.append(1)
+        return
+
+    alpn = ["http/1.1"] if candidate["protocol"] == "https" else ["dot"]
+    try:
+        reader, writer = await dns_wire.open_stream(candidate["host"], candidate["port"],
+                                                    tls=dns_wire.insecure_tls_context(alpn),
+                                                    server_name=candidate["host"], timeout=timeout)
+    except (asyncio.TimeoutError, OSError) as e:
+        errors.append(str(e))
+        return
+    try:
+        for i in range(queries):
+            message = dns_wire.build_query(NAMES[i % len(NAMES)])
+            sent = time.monotonic()
+            if candidate["protocol"] == "https":
+                await dns_wire.query_doh(reader, writer, candidate["host"], candidate["path"], message, timeout)
+            else:
+                await dns_wire.query_stream(reader, writer, message, timeout)
+            latencies.append(time.monotonic() - sent)
+    except (asyncio.TimeoutError, OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+        errors.append(str(e))
+    finally:
+        writer.close()
+
+
+async def measure(url: str, clients: int, queries: int, timeout: float):
+    candidate = parse_candidate(url)
+    latencies, errors = [], []
+    started = time.monotonic()
+    await asyncio.gather(*(client(candidate, queries, timeout, latencies, errors) for _ in range(clients)))
+    summary = latency_summary(latencies)
+    summary["qps"] = round(len(latencies) / (time.monotonic() - started), 1)
+    summary["errors"] = len(errors)
+    return summary
+
+
+async def run(args):
+    servers = []
+    resolver = None
+    if args.local:
+        resolver = StandinResolver()
+        targets, servers = await build_local_targets(resolver, self_signed_context("dns.local"))
+    else:
+        targets = dict(target.split("=", 1) for target in args.target)
+
+    results = {}
+    try:
+        for label, url in targets.items():
+            results[label] = await measure(url, args.clients, args.queries, args.timeout)
+    finally:
+        for server in servers:
+            server.close()
+        await asyncio.sleep(0.1)  # серверы дочитывают закрытые соединения
+        if resolver:
+            resolver.close()
+    return targets, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p99 DoT/DoH: через Traefik/doh-proxy и напрямую в SmartDNS")
+    parser.add_argument("--local", action="store_true", help="Сравнить пути на локальном стенде")
+    parser.add_argument("--target", action="append", default=[], help="label=url, можно несколько")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=200, help="Запросов на клиента")
+    parser.add_argument("--timeout", type=float, default=3.0)
+    args = parser.parse_args()
+
+    if not args.local and not args.target:
+        parser.error("нужен --local или хотя бы один --target")
+
+    print("🧪 Ninja DNS - Задержка DoT/DoH: Traefik/doh-proxy против нативного SmartDNS")
+    print("=" * 70)
+
+    targets, results = asyncio.run(run(args))
+    for label, summary in results.items():
+        print(f"  {label:<14} {targets[label]:<40} p50 {summary['p50_ms']:>7}ms  p99 {summary['p99_ms']:>7}ms  "
+              f"{summary['qps']:>8} q/s  ошибок {summary['errors']}")
+
+    sys.exit(0 if all(s["errors"] == 0 for s in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
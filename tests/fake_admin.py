@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Админка без Docker: приложение в одном процессе с поддельным Docker клиентом
+и замером задержки event loop
+
+FakeDockerClient повторяет то, что админка вызывает у docker-py (ping,
+containers.get, restart, exec_run), и блокирует поток на --docker-latency-ms,
+как настоящий синхронный клиент. Задержка event loop пишется в --lag-file
+при остановке сервера (до того, как uvicorn повторно поднимет пойманный
+SIGTERM и завершит процесс): пары (time.monotonic(), лаг в секундах), лаг
+без времени, которое процесс ждал процессор из-за клиентов нагрузки.
+
+Запускается из FakeAdminServer (cwd=admin), напрямую:
+    python fake_admin.py --port 8000 --lag-file /tmp/lag.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from bench_utils import AdminServer
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICES = ("smartdns", "sniproxy", "traefik", "quicproxy")
+
+
+class ExecResult(NamedTuple):
+    exit_code: int
+    output: bytes
+
+
+class FakeContainer:
+    def __init__(self, client: "FakeDockerClient", name: str):
+        self.client = client
+        self.name = name
+        self.status = "running"
+
+    def restart(self):
+        self.client.call(f"{self.name}.restart")
+
+    def exec_run(self, cmd: str) -> ExecResult:
+        self.client.call(f"{self.name}.exec:{cmd}")
+        return ExecResult(0, b"")
+
+
+class FakeContainers:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self.items = {name: FakeContainer(client, name) for name in SERVICES}
+
+    def get(self, name: str) -> FakeContainer:
+        self.client.call(f"{name}.get")
+        if name not in self.items:
+            raise LookupError(f"No such container: {name}")
+        return self.items[name]
+
+
+class FakeDockerClient:
+    """Синхронный, как docker-py: задержка блокирует вызывающий поток"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.containers = FakeContainers(self)
+
+    def call(self, operation: str):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def ping(self) -> bool:
+        self.call("ping")
+        return True
+
+    def close(self):
+        pass
+
+
+def run_queue_wait() -> float:
+    """
+    Сколько поток ждал процессор в очереди планировщика (с), из /proc/thread-self/schedstat
+
+    Клиенты нагрузки работают на той же машине: на одном-двух ядрах они
+    вытесняют админку, и это ожидание - не работа, заблокировавшая loop.
+    """
+    try:
+        with open("/proc/thread-self/schedstat", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) / 1e9
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+async def monitor_lag(samples: List, interval: float):
+    """Опоздание пробуждения после sleep(interval) - сколько loop был занят чужой работой"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        waited = run_queue_wait()
+        await asyncio.sleep(interval)
+        lag = loop.time() - started - interval - (run_queue_wait() - waited)
+        samples.append((time.monotonic(), max(0.0, lag)))
+
+
+async def serve(args):
+    import uvicorn
+    sys.path.insert(0, os.getcwd())
+    from app import main
+
+    client = FakeDockerClient(args.docker_latency_ms / 1000)
+    main.domain_manager._docker_client = client
+    samples: List = []
+    monitor = asyncio.create_task(monitor_lag(samples, args.lag_interval_ms / 1000))
+
+    class LagServer(uvicorn.Server):
+        """Замеры сохраняются в shutdown: код после serve() не выполняется, uvicorn
+        по выходе из serve() заново поднимает пойманный сигнал"""
+
+        async def shutdown(self, sockets=None):
+            await super().shutdown(sockets=sockets)
+            monitor.cancel()
+            if args.lag_file:
+                with open(args.lag_file, "w", encoding="utf-8") as f:
+                    json.dump({"samples": samples, "docker_calls": client.calls}, f)
+
+    server = LagServer(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    await server.serve()
+
+
+class FakeAdminServer(AdminServer):
+    """AdminServer, запускающий fake_admin.py вместо uvicorn с настоящим Docker"""
+
+    def __init__(self, data_dir: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                 docker_latency_ms: float = 0.0, lag_interval_ms: float = 5.0):
+        super().__init__(workers=1, data_dir=data_dir, env=env)
+        self.docker_latency_ms = docker_latency_ms
+        self.lag_interval_ms = lag_interval_ms
+        self.lag_file = os.path.join(self.data_dir, "loop-lag.json")
+
+    def command(self) -> List[str]:
+        return [sys.executable, os.path.join(TESTS_DIR, "fake_admin.py"), "--port", str(self.port),
+                "--lag-file", self.lag_file, "--docker-latency-ms", str(self.docker_latency_ms),
+                "--lag-interval-ms", str(self.lag_interval_ms)]
+
+    def lag(self) -> dict:
+        """Замеры лага после stop()"""
+        with open(self.lag_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Админка с поддельным Docker клиентом")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--lag-file")
+    parser.add_argument("--lag-interval-ms", type=float, default=5.0)
+    parser.add_argument("--docker-latency-ms", type=float, default=0.0)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Разбор audit-лога SmartDNS в админке (app.query_log) под нагрузкой
+
+Пишет синтетический audit-лог в формате SmartDNS с ротацией как у tlog
+(переименование в .1 и новый файл) и между записями вызывает QueryStats.poll.
+Проверяет, что ни один запрос не потерян при ротациях, что счетчики
+перехваченных/попаданий/промахов совпадают с записанными, и что память
+не растет с числом уникальных имен (Space-Saving и окна фиксированного размера).
+
+    python query_log_bench.py [--queries 2000000] [--batch 20000] [--rotate-bytes 4194304]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app.query_log import LogTailer, QueryStats  # noqa: E402
+
+SERVER_IP = "10.0.0.1"
+HIJACKED = ["chatgpt.com", "claude.ai", "netflix.com"]
+
+
+def audit_line(rng: random.Random, unique_names: int, counts: dict) -> str:
+    roll = rng.random()
+    if roll < 0.2:
+        name = f"api.{rng.choice(HIJACKED)}"
+        elapsed, result = 0, SERVER_IP
+        counts["hijacked"] += 1
+    elif roll < 0.7:
+        # Горячие имена: попадания в кэш
+        name = f"hot{rng.randrange(100)}.example.com"
+        elapsed, result = 0, "93.184.216.34"
+        counts["hits"] += 1
+    else:
+        name = f"n{rng.randrange(unique_names)}.example.net"
+        elapsed, result = rng.randint(5, 400), "93.184.216.35"
+        counts["misses"] += 1
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    return (f"[{stamp},123] 192.168.1.{rng.randrange(1, 250)} query {name}, type 1, time {elapsed}ms, "
+            f"speed: 12.3ms, group default, result {result}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Разбор audit-лога SmartDNS под нагрузкой")
+    parser.add_argument("--queries", type=int, default=2_000_000, help="Всего строк лога")
+    parser.add_argument("--batch", type=int, default=20_000, help="Строк между опросами")
+    parser.add_argument("--unique-names", type=int, default=1_000_000, help="Размер пространства имен промахов")
+    parser.add_argument("--rotate-bytes", type=int, default=4 << 20, help="Размер файла до ротации")
+    parser.add_argument("--max-memory-mb", type=float, default=32.0, help="Порог роста памяти после прогрева")
+    args = parser.parse_args()
+
+    print("🧪 Ninja DNS - Разбор audit-лога SmartDNS")
+    print("=" * 70)
+    work_dir = tempfile.mkdtemp(prefix="ninja-dns-querylog-")
+    path = os.path.join(work_dir, "smartdns-audit.log")
+    open(path, "w").close()
+
+    stats = QueryStats(LogTailer(path, start_at_end=False), [SERVER_IP])
+    stats.set_domains(HIJACKED)
+    rng = random.Random(1)
+    written = {"hijacked": 0, "hits": 0, "misses": 0}
+    counted = 0
+    poll_seconds = 0.0
+    memory_after_warmup = None
+
+    tracemalloc.start()
+    log = open(path, "a", encoding="utf-8")
+    total = 0
+    while total < args.queries:
+        batch = min(args.batch, args.queries - total)
+        for _ in range(batch):
+            log.write(audit_line(rng, args.unique_names, written))
+            if log.tell() >= args.rotate_bytes:
+                log.close()
+                os.replace(path, f"{path}.1")
+                log = open(path, "a", encoding="utf-8")
+        log.flush()
+        total += batch
+
+        started = time.perf_counter()
+        counted += stats.poll()
+        poll_seconds += time.perf_counter() - started
+
+        current, peak = tracemalloc.get_traced_memory()
+        if memory_after_warmup is None and total >= args.queries // 10:
+            memory_after_warmup = current
+    log.close()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    snapshot = stats.snapshot(5)
+    window = snapshot["windows"]["1h"]
+    growth_mb = (current - (memory_after_warmup or 0)) / 1e6
+    print(f"ℹ️  Строк: {total}, ротаций: {snapshot['tailer']['rotations']}, "
+          f"разбор: {total / poll_seconds:,.0f} строк/с")
+    print(f"ℹ️  Окно 1h: перехвачено {window['hijacked']}, попаданий {window['hits']}, промахов {window['misses']}, "
+          f"доля попаданий {window['hit_ratio']}, апстрим p50/p95 {window['upstream_ms']['p50']}/"
+          f"{window['upstream_ms']['p95']}ms")
+    print(f"ℹ️  Top перехваченных: {[entry['name'] for entry in snapshot['top_hijacked']]}")
+    print(f"ℹ️  Память: после прогрева {(memory_after_warmup or 0) / 1e6:.1f}MB, в конце {current / 1e6:.1f}MB, "
+          f"пик {peak / 1e6:.1f}MB")
+
+    checks = [
+        (counted == total, f"Все строки учтены ({counted}/{total})"),
+        (window["hijacked"] == written["hijacked"] and window["hits"] == written["hits"]
+         and window["misses"] == written["misses"], f"Счетчики совпадают с записанными {written}"),
+        (snapshot["tailer"]["unparsed"] == 0, "Нет неразобранных строк"),
+        (growth_mb <= args.max_memory_mb, f"Рост памяти после прогрева {growth_mb:.1f}MB (порог {args.max_memory_mb}MB)"),
+    ]
+    for ok, text in checks:
+        print(f"{'✅' if ok else '❌'} {text}")
+    stats.close()
+    sys.exit(0 if all(ok for ok, _ in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""
+Повтор реального потока DNS запросов с сохранением интервалов между ними
+
+ingest: audit-лог SmartDNS (audit-enable yes, строки "[время] клиент query имя, type N")
+или захват трафика порта 53 (pcap/pcapng, UDP запросы) -> компактный файл повтора:
+gzip, таблица имен и записи по 12 байт (интервал в мкс, индекс имени, индекс клиента).
+
+replay: файл повтора против локального стека на 1x, 10x или max скорости.
+На 1x и 10x запрос уходит в момент (время в записи / скорость) независимо от ответов,
+задержка считается от этого момента; на max - без пауз, не больше --max-speed-inflight
+запросов в полете (замкнутый цикл: пропускная способность, а не реакция на всплески).
+По окнам времени записи (--window) отчет: попадания в кэш, перцентили, отказы.
+
+Попадание в кэш берется со стороны резолвера, а не по задержке у клиента (она растет
+от очереди при насыщении): стенд --local сообщает о каждом ответе сам, для стека
+читается audit-лог SmartDNS (--audit-log), где time - время обработки на сервере,
+и попадание - time не больше --hit-threshold-ms, как в статистике админки. Без
+источника доля кэша не считается. Перехваченные имена (ответ = --server-ip) считаются
+отдельно. Кэш стека между прогонами не сбрасывается:
+для сравнения холодного кэша запускайте одну скорость на перезапущенном стеке.
+
+    python query_replay_bench.py ingest /var/log/smartdns/smartdns-audit.log* -o peak.replay
+    python query_replay_bench.py ingest port53.pcap -o peak.replay
+    python query_replay_bench.py replay peak.replay --target udp=udp://127.0.0.1:53 --speeds 1,10,max \\
+        --server-ip 185.237.95.211 --audit-log data/smartdns/log/smartdns-audit.log --json replay.json
+    python query_replay_bench.py replay peak.replay --local --speeds 10,max
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+import ssl
+import struct
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from bench_utils import latency_summary
+from dns_load_bench import LOCAL_SERVER_IP, CachingStandin, default_hijacked, make_channel, parse_target
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+from app import dns_wire  # noqa: E402
+from app.query_log import AUDIT_LINE as SMARTDNS_AUDIT_LINE, LogTailer  # noqa: E402
+
+MAGIC = b"NDNSRPL1"
+RECORD = struct.Struct("<III")
+MAX_DELTA_US = 0xFFFFFFFF
+AUDIT_LINE = re.compile(
+    r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:[,.](\d{1,6}))?\]\s+(\S+)\s+query\s+([^,\s]+),\s*type\s+(\d+)"
+)
+PCAP_MAGIC = {b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+              b"\x4d\x3c\xb2\xa1": ("<", 1e-9), b"\xa1\xb2\x3c\x4d": (">", 1e-9)}
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+
+
+class Query(NamedTuple):
+    ts: float
+    client: str
+    name: str
+    qtype: int
+
+
+# Разбор источников
+
+def read_audit_log(path: str) -> Iterator[Query]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = AUDIT_LINE.match(line)
+            if not match:
+                continue
+            stamp, fraction, client, name, qtype = match.groups()
+            ts = datetime.strptime(stamp, "%Y-%m-%d %H:%M:%S").timestamp()
+            if fraction:
+                ts += int(fraction) / 10 ** len(fraction)
+            yield Query(ts, client, name.rstrip(".").lower(), int(qtype))
+
+
+def _ip_payload(linktype: int, frame: bytes) -> Optional[bytes]:
+    """IP пакет из кадра канального уровня"""
+    if linktype == 1:  # Ethernet
+        offset, ethertype = 14, struct.unpack(">H", frame[12:14])[0]
+        while ethertype in (0x8100, 0x88A8) and len(frame) >= offset + 4:
+            ethertype = struct.unpack(">H", frame[offset + 2:offset + 4])[0]
+            offset += 4
+        return frame[offset:] if ethertype in (0x0800, 0x86DD) else None
+    if linktype == 113:  # Linux cooked
+        return frame[16:] if struct.unpack(">H", frame[14:16])[0] in (0x0800, 0x86DD) else None
+    if linktype == 276:  # Linux cooked v2
+        return frame[20:] if struct.unpack(">H", frame[0:2])[0] in (0x0800, 0x86DD) else None
+    if linktype == 0:  # BSD loopback
+        return frame[4:]
+    if linktype in (12, 101, 228, 229):  # Raw IP
+        return frame
+    return None
+
+
+def _udp_query(packet: bytes, port: int) -> Optional[Tuple[str, bytes]]:
+    """(адрес клиента, DNS сообщение) для UDP на порт port; фрагменты и TCP пропускаются"""
+    if not packet:
+        return None
+    version = packet[0] >> 4
+    if version == 4 and len(packet) >= 20:
+        header = (packet[0] & 0x0F) * 4
+        if packet[9] != 17 or struct.unpack(">H", packet[6:8])[0] & 0x1FFF:
+            return None
+        client = ".".join(str(b) for b in packet[12:16])
+        udp = packet[header:]
+    elif version == 6 and len(packet) >= 40:
+        if packet[6] != 17:
+            return None
+        client = ":".join(f"{packet[i] << 8 | packet[i + 1]:x}" for i in range(8, 24, 2))
+        udp = packet[40:]
+    else:
+        return None
+    if len(udp) < 8 or struct.unpack(">H", udp[2:4])[0] != port:
+        return None
+    return client, udp[8:]
+
+
+def _pcap_frames(f, header: bytes) -> Iterator[Tuple[float, int, bytes]]:
+    order, resolution = PCAP_MAGIC[header[:4]]
+    linktype = struct.unpack(order + "I", header[20:24])[0]
+    record = struct.Struct(order + "IIII")
+    while True:
+        head = f.read(record.size)
+        if len(head) < record.size:
+            return
+        seconds, fraction, captured, _ = record.unpack(head)
+        yield seconds + fraction * resolution, linktype, f.read(captured)
+
+
+def _pcapng_frames(f, first: bytes) -> Iterator[Tuple[float, int, bytes]]:
+    """Section Header, Interface Description и Enhanced Packet блоки"""
+    interfaces: List[Tuple[int, float]] = []
+    order = "<"
+    block = first
+    while True:
+        if len(block) < 8:
+            return
+        block_type = struct.unpack(order + "I", block[:4])[0]
+        if block_type == 0x0A0D0D0A:
+            # Новая секция: порядок байт из byte-order magic, интерфейсы заново
+            byte_order_magic = f.read(4)
+            order = "<" if byte_order_magic == b"\x4d\x3c\x2b\x1a" else ">"
+            interfaces = []
+            f.read(struct.unpack(order + "I", block[4:8])[0] - 12)
+            block = f.read(8)
+            continue
+        length = struct.unpack(order + "I", block[4:8])[0]
+        body = f.read(length - 8)[:-4] if length >= 12 else b""
+        if block_type == 1 and len(body) >= 8:
+            linktype = struct.unpack(order + "H", body[:2])[0]
+            resolution, offset = 1e-6, 8
+            while offset + 4 <= len(body):
+                code, size = struct.unpack(order + "HH", body[offset:offset + 4])
+                if code == 0:
+                    break
+                if code == 9 and size >= 1:
+                    value = body[offset + 4]
+                    resolution = 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+                offset += 4 + (size + 3) // 4 * 4
+            interfaces.append((linktype, resolution))
+        elif block_type == 6 and len(body) >= 20:
+            iface, high, low, captured, _ = struct.unpack(order + "IIIII", body[:20])
+            if iface < len(interfaces):
+                linktype, resolution = interfaces[iface]
+                yield ((high << 32) | low) * resolution, linktype, body[20:20 + captured]
+        block = f.read(8)
+
+
+def read_capture(path: str, port: int = 53) -> Iterator[Query]:
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if header[:4] == PCAPNG_MAGIC:
+            f.seek(8)
+            frames = _pcapng_frames(f, header[:8])
+        else:
+            frames = _pcap_frames(f, header)
+        for ts, linktype, frame in frames:
+            found = _udp_query(_ip_payload(linktype, frame) or b"", port)
+            if not found:
+                continue
+            client, payload = found
+            try:
+                message = dns_wire.parse_message(payload)
+            except (ValueError, IndexError, struct.error):
+                continue
+            if message.flags & 0x8000 or not message.question:
+                continue
+            name, qtype = message.question
+            yield Query(ts, client, name.rstrip(".").lower(), qtype)
+
+
+def is_capture(path: str) -> bool:
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    return magic in PCAP_MAGIC or magic == PCAPNG_MAGIC
+
+
+# Файл повтора
+
+class Replay(NamedTuple):
+    header: dict
+    names: List[Tuple[str, int]]
+    records: List[Tuple[float, int, int]]
+
+    @property
+    def duration(self) -> float:
+        return self.records[-1][0] if self.records else 0.0
+
+
+def write_replay(queries: List[Query], path: str, sources: List[str]):
+    queries.sort(key=lambda q: q.ts)
+    names: Dict[Tuple[str, int], int] = {}
+    clients: Dict[str, int] = {}
+    body = bytearray()
+    previous_us = 0
+    first = queries[0].ts if queries else 0.0
+    for query in queries:
+        offset_us = int(round((query.ts - first) * 1e6))
+        delta = min(MAX_DELTA_US, max(0, offset_us - previous_us))
+        previous_us += delta
+        name_index = names.setdefault((query.name, query.qtype), len(names))
+        client_index = clients.setdefault(query.client, len(clients))
+        body += RECORD.pack(delta, name_index, client_index)
+
+    header = json.dumps({
+        "version": 1,
+        "sources": sources,
+        "started": first,
+        "queries": len(queries),
+        "clients": len(clients),
+        "names": [[name, qtype] for name, qtype in names],
+    }).encode("utf-8")
+    with gzip.open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(body)
+
+
+def read_replay(path: str) -> Replay:
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a replay file")
+        header = json.loads(f.read(struct.unpack("<I", f.read(4))[0]))
+        body = f.read()
+    records, offset_us = [], 0
+    for delta, name_index, client_index in RECORD.iter_unpack(body):
+        offset_us += delta
+        records.append((offset_us / 1e6, name_index, client_index))
+    names = [(name, qtype) for name, qtype in header.pop("names")]
+    return Replay(header, names, records)
+
+
+def ingest(args):
+    queries: List[Query] = []
+    for path in args.inputs:
+        before = len(queries)
+        queries.extend(read_capture(path, args.port) if is_capture(path) else read_audit_log(path))
+        print(f"  {path}: {len(queries) - before} запросов")
+    if not queries:
+        print("❌ Запросов не найдено")
+        sys.exit(1)
+    write_replay(queries, args.output, args.inputs)
+    replay = read_replay(args.output)
+    top = {}
+    for _, name_index, _ in replay.records:
+        top[name_index] = top.get(name_index, 0) + 1
+    busiest = sorted(top.items(), key=lambda item: -item[1])[:5]
+    print(f"✅ {args.output}: {len(replay.records)} запросов за {replay.duration:.1f}s, "
+          f"{len(replay.names)} имен, {replay.header['clients']} клиентов")
+    print("ℹ️  Чаще всего: " + ", ".join(f"{replay.names[i][0]} ({n})" for i, n in busiest))
+
+
+# Повтор
+
+class Window:
+    def __init__(self):
+        self.counts = {"sent": 0, "answered": 0, "hijacked": 0, "hit": 0, "miss": 0, "timeouts": 0,
+                       "rcode_errors": 0, "conn_errors": 0, "overload": 0}
+        self.latencies: List[float] = []
+
+    def summary(self, start: float, length: float) -> dict:
+        counts = self.counts
+        classified = counts["hit"] + counts["miss"]
+        failures = counts["timeouts"] + counts["rcode_errors"] + counts["conn_errors"] + counts["overload"]
+        return {
+            "start_s": round(start, 3),
+            **counts,
+            "offered_qps": round(counts["sent"] / length, 1),
+            "cache_hit_ratio": round(counts["hit"] / classified, 4) if classified else None,
+            "failure_rate": round(failures / counts["sent"], 4) if counts["sent"] else 0.0,
+            **latency_summary(self.latencies),
+        }
+
+
+class CacheEvents:
+    """
+    Попадания в кэш по данным резолвера
+
+    События (имя, тип, попадание) приходят от стенда или из audit-лога и
+    сопоставляются с ответами клиента по имени и типу в порядке поступления:
+    попадание засчитывается окну, в котором ушел запрос. События чужих
+    клиентов и перехваченных имен остаются без пары и не учитываются.
+    """
+
+    def __init__(self):
+        self.events: List[Tuple[str, int, bool]] = []
+        self.pending: Dict[Tuple[str, int], Deque[Window]] = {}
+
+    @staticmethod
+    def key(name: str, qtype: int) -> Tuple[str, int]:
+        return name.rstrip(".").lower(), qtype
+
+    def record(self, name: str, qtype: int, hit: bool):
+        self.events.append((*self.key(name, qtype), hit))
+
+    def answered(self, name: str, qtype: int, window: Window):
+        self.pending.setdefault(self.key(name, qtype), deque()).append(window)
+
+    def assign(self) -> int:
+        """Разнести накопленные события по окнам; возвращает число сопоставленных"""
+        matched = 0
+        for name, qtype, hit in self.events:
+            waiting = self.pending.get((name, qtype))
+            if waiting:
+                waiting.popleft().counts["hit" if hit else "miss"] += 1
+                matched += 1
+        self.events.clear()
+        return matched
+
+
+class AuditLogSource:
+    """Audit-лог SmartDNS: time в строке - время обработки на сервере, без сети и очереди клиента"""
+
+    def __init__(self, path: str, hit_threshold_ms: float):
+        self.tailer = LogTailer(path)
+        self.hit_threshold_ms = hit_threshold_ms
+        # Открываем файл сейчас: читаются только строки, записанные после старта прогона
+        self.tailer.read_lines()
+
+    def poll(self, events: CacheEvents) -> int:
+        lines = 0
+        for line in self.tailer.read_lines():
+            match = SMARTDNS_AUDIT_LINE.match(line)
+            if match:
+                _, _, name, qtype, elapsed, _ = match.groups()
+                events.record(name, int(qtype), int(elapsed) <= self.hit_threshold_ms)
+                lines += 1
+        return lines
+
+    async def follow(self, events: CacheEvents, interval: float = 0.5):
+        """Читать по ходу прогона, чтобы длинный повтор не превысил допустимое отставание LogTailer"""
+        while True:
+            self.poll(events)
+            await asyncio.sleep(interval)
+
+    async def drain(self, events: CacheEvents, settle: float):
+        """Дочитать хвост: SmartDNS пишет audit-лог с буферизацией"""
+        loop = asyncio.get_running_loop()
+        quiet_since = loop.time()
+        while loop.time() - quiet_since < settle:
+            if self.poll(events):
+                quiet_since = loop.time()
+            await asyncio.sleep(0.1)
+
+    def close(self):
+        self.tailer.close()
+
+
+async def replay_once(channel, replay: Replay, speed: Optional[float], args,
+                      events: Optional[CacheEvents] = None, audit: Optional[AuditLogSource] = None) -> dict:
+    """speed=None - max: без пауз, ограничение по --max-speed-inflight"""
+    loop = asyncio.get_running_loop()
+    windows: Dict[int, Window] = {}
+    tasks = set()
+    semaphore = asyncio.Semaphore(args.max_speed_inflight)
+
+    async def one(window: Window, name: str, qtype: int, scheduled: float):
+        try:
+            response = await channel.query(name, qtype, args.timeout)
+        except asyncio.TimeoutError:
+            window.counts["timeouts"] += 1
+            return
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ssl.SSLError, ValueError):
+            window.counts["conn_errors"] += 1
+            return
+        finally:
+            if speed is None:
+                semaphore.release()
+        latency = loop.time() - scheduled
+        window.latencies.append(latency)
+        message = dns_wire.parse_message(response)
+        if message.rcode not in (dns_wire.RCODE_NOERROR, dns_wire.RCODE_NXDOMAIN):
+            window.counts["rcode_errors"] += 1
+        elif args.server_ip and args.server_ip in [a.data for a in message.answers]:
+            window.counts["hijacked"] += 1
+        else:
+            window.counts["answered"] += 1
+            if events is not None:
+                events.answered(name, qtype, window)
+
+    follower = asyncio.ensure_future(audit.follow(events)) if audit else None
+    started = loop.time()
+    for offset, name_index, _ in replay.records:
+        if args.duration and offset > args.duration:
+            break
+        window = windows.setdefault(int(offset // args.window), Window())
+        window.counts["sent"] += 1
+        if speed is None:
+            await semaphore.acquire()
+            scheduled = loop.time()
+        else:
+            scheduled = started + offset / speed
+            delay = scheduled - loop.time()
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            if len(tasks) >= args.max_inflight:
+                window.counts["overload"] += 1
+                continue
+        name, qtype = replay.names[name_index]
+        task = asyncio.ensure_future(one(window, name, qtype, scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    send_finished = loop.time()
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+    if follower:
+        follower.cancel()
+        await audit.drain(events, args.audit_settle)
+    if events is not None:
+        events.assign()
+
+    total = Window()
+    for window in windows.values():
+        for key, value in window.counts.items():
+            total.counts[key] += value
+        total.latencies.extend(window.latencies)
+    wall_window = args.window / speed if speed else None
+    return {
+        "speed": speed or "max",
+        "elapsed_s": round(elapsed, 3),
+        "send_elapsed_s": round(send_finished - started, 3),
+        "total": total.summary(0.0, elapsed),
+        "windows": [
+            windows[index].summary(index * args.window, wall_window or elapsed / max(1, len(windows)))
+            for index in sorted(windows)
+        ],
+    }
+
+
+def print_result(label: str, result: dict):
+    total = result["total"]
+    ratio = total["cache_hit_ratio"]
+    print(f"\n  {label} x{result['speed']}: {total['sent']} запросов за {result['elapsed_s']}s, "
+          f"попаданий в кэш {'-' if ratio is None else f'{ratio:.1%}'}, перехвачено {total['hijacked']}")
+    print(f"    p50 {total['p50_ms']}ms  p95 {total['p95_ms']}ms  p99 {total['p99_ms']}ms  "
+          f"отказов {total['failure_rate']:.2%} (таймауты {total['timeouts']}, rcode {total['rcode_errors']}, "
+          f"соединение {total['conn_errors']}, перегрузка {total['overload']})")
+    for window in result["windows"]:
+        ratio = window["cache_hit_ratio"]
+        print(f"    {window['start_s']:>9.0f}s  {window['offered_qps']:>9} q/s  "
+              f"кэш {'-' if ratio is None else f'{ratio:.1%}':>6}  p50 {window['p50_ms']:>8}ms  "
+              f"p99 {window['p99_ms']:>8}ms  отказов {window['failure_rate']:.2%}")
+
+
+async def run_replay(args, replay: Replay) -> Dict[str, list]:
+    results = {}
+    for speed in args.speeds:
+        resolver = None
+        if args.local:
+            # Свежий стенд на каждую скорость: холодный кэш, как после перезапуска стека
+            resolver = CachingStandin(args.hijacked, LOCAL_SERVER_IP, args.miss_delay)
+            targets = {"udp": f"udp://127.0.0.1:{await resolver.start_udp()}"}
+        else:
+            targets = dict(target.split("=", 1) for target in args.target)
+        try:
+            for label, url in targets.items():
+                events = audit = None
+                if resolver:
+                    events = CacheEvents()
+                    resolver.on_answer = events.record
+                elif args.audit_log:
+                    events = CacheEvents()
+                    audit = AuditLogSource(args.audit_log, args.hit_threshold_ms)
+                channel = make_channel(parse_target(url), args)
+                await channel.open()
+                try:
+                    result = await replay_once(channel, replay, speed, args, events, audit)
+                finally:
+                    await channel.close()
+                    if audit:
+                        audit.close()
+                result["target"] = url
+                results.setdefault(label, []).append(result)
+                print_result(label, result)
+        finally:
+            if resolver:
+                resolver.close()
+    return results
+
+
+def replay_main(args):
+    replay = read_replay(args.replay_file)
+    if args.local:
+        args.server_ip = LOCAL_SERVER_IP
+        args.hijacked = args.hijacked.split(",") if args.hijacked else default_hijacked()
+    elif not args.target:
+        print("❌ Нужен --local или хотя бы один --target")
+        sys.exit(2)
+    args.speeds = [None if s == "max" else float(s) for s in args.speeds.split(",")]
+
+    print("🧪 Ninja DNS - Повтор потока запросов")
+    print("=" * 70)
+    print(f"ℹ️  {args.replay_file}: {len(replay.records)} запросов за {replay.duration:.1f}s, "
+          f"{len(replay.names)} имен; окно {args.window}s записи")
+    if not args.local and not args.audit_log:
+        print("⚠️  Без --audit-log попадания в кэш не считаются: задержка у клиента их не различает")
+    started = time.time()
+    results = asyncio.run(run_replay(args, replay))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"started": started, "replay": args.replay_file, "source": replay.header,
+                       "cache_source": "standin" if args.local else ("audit-log" if args.audit_log else None),
+                       "hit_threshold_ms": args.hit_threshold_ms, "results": results}, f, indent=2)
+        print(f"\nℹ️  Результаты: {args.json}")
+
+    worst = max((r["total"]["failure_rate"] for runs in results.values() for r in runs), default=0.0)
+    sys.exit(0 if worst <= args.max_failure_rate else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Повтор реального потока DNS запросов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="audit-лог SmartDNS или pcap -> файл повтора")
+    ingest_parser.add_argument("inputs", nargs="+", help="Audit-логи (.gz тоже) и/или pcap/pcapng")
+    ingest_parser.add_argument("-o", "--output", required=True)
+    ingest_parser.add_argument("--port", type=int, default=53, help="Порт DNS в захвате")
+
+    replay_parser = commands.add_parser("replay", help="Повтор файла против стека")
+    replay_parser.add_argument("replay_file")
+    replay_parser.add_argument("--local", action="store_true", help="Стенд standin_dns вместо стека")
+    replay_parser.add_argument("--target", action="append", default=[],
+                               help="label=url: udp://, tcp://, tls://host:853, https://host/dns-query")
+    replay_parser.add_argument("--speeds", default="1,10,max", help="Множители скорости и/или max через запятую")
+    replay_parser.add_argument("--window", type=float, default=60.0, help="Окно отчета, с времени записи")
+    replay_parser.add_argument("--duration", type=float, default=0, help="Повторить только первые N с записи")
+    replay_parser.add_argument("--audit-log", help="Audit-лог SmartDNS стека: источник попаданий в кэш")
+    replay_parser.add_argument("--hit-threshold-ms", type=float, default=1.0,
+                               help="time в audit-логе не больше - попадание в кэш")
+    replay_parser.add_argument("--audit-settle", type=float, default=2.0,
+                               help="Дочитывать audit-лог, пока в нем появляются строки, с")
+    replay_parser.add_argument("--server-ip", help="Ответ перехваченных имен (SERVER_IP)")
+    replay_parser.add_argument("--hijacked", default=None, help="--local: перехваченные имена через запятую")
+    replay_parser.add_argument("--miss-delay", type=float, default=0.03, help="--local: задержка апстрима, с")
+    replay_parser.add_argument("--sockets", type=int, default=4, help="UDP сокетов")
+    replay_parser.add_argument("--connections", type=int, default=8, help="TCP/DoT/DoH соединений")
+    replay_parser.add_argument("--max-inflight", type=int, default=20000)
+    replay_parser.add_argument("--max-speed-inflight", type=int, default=256, help="Запросов в полете на скорости max")
+    replay_parser.add_argument("--timeout", type=float, default=2.0)
+    replay_parser.add_argument("--max-failure-rate", type=float, default=0.01, help="Код выхода 1, если прогон хуже")
+    replay_parser.add_argument("--json", help="Сохранить результаты в файл")
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        print("🧪 Ninja DNS - Подготовка файла повтора")
+        print("=" * 70)
+        ingest(args)
+    else:
+        replay_main(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Локальный тест QUIC forwarder (UDP 443) без интернета
+Стенд-сервер QUIC принимает Initial, проверяет SNI и отвечает серверным Initial;
+имена резолвит StandinResolver в 127.0.0.1. Проверяется ретрансляция в обе стороны,
+ClientHello из нескольких пакетов, отбрасывание доменов не из списка и limit_conn.
+
+    python quic_forwarder_test.py
+"""
+import asyncio
+import json
+import os
+import struct
+import sys
+import tempfile
+
+from standin_dns import StandinResolver
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app import quic_sni  # noqa: E402
+from app.quicproxy import QuicForwarder, render_config  # noqa: E402
+
+PROFILES = [
+    {"proxy_timeout": "10s", "limit_conn": 0},
+    {"proxy_timeout": "1h", "limit_conn": 2},
+]
+DOMAINS = {"chatgpt.com": 0, "limited.example": 1}
+
+
+def client_hello(server_name: str, padding: int = 0) -> bytes:
+    """Минимальный TLS 1.3 ClientHello с SNI; padding раздувает его на несколько пакетов"""
+    name = server_name.encode("ascii")
+    sni = struct.pack(">HB H", len(name) + 3, 0, len(name)) + name
+    extensions = struct.pack(">HH", 0, len(sni)) + sni
+    if padding:
+        extensions += struct.pack(">HH", 21, padding) + bytes(padding)
+    body = (
+        b"\x03\x03" + os.urandom(32) + b"\x00"
+        + struct.pack(">H", 2) + b"\x13\x01" + b"\x01\x00"
+        + struct.pack(">H", len(extensions)) + extensions
+    )
+    return b"\x01" + len(body).to_bytes(3, "big") + body
+
+
+def initial_packets(server_name: str, padding: int = 0, chunk: int = 1000) -> list:
+    """Initial пакеты клиента: ClientHello, разрезанный на CRYPTO фреймы по chunk байт"""
+    dcid, scid = os.urandom(8), os.urandom(8)
+    hello = client_hello(server_name, padding)
+    packets = []
+    for number, offset in enumerate(range(0, len(hello), chunk)):
+        data = hello[offset:offset + chunk]
+        frame = b"\x06" + quic_sni.encode_varint(offset) + quic_sni.encode_varint(len(data)) + data
+        packets.append(quic_sni.build_initial(dcid, scid, frame, packet_number=number))
+    return packets
+
+
+class StandinOrigin(asyncio.DatagramProtocol):
+    """Стенд QUIC сервера: на Initial отвечает серверным Initial, остальное возвращает эхом"""
+
+    def __init__(self):
+        self.server_names = []
+        self.received = 0
+        self.assemblers = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        if not quic_sni.is_initial(data):
+            self.transport.sendto(b"echo:" + data, addr)
+            return
+        assembler = self.assemblers.setdefault(addr, quic_sni.ClientHelloAssembler())
+        server_name = assembler.add(data)
+        if server_name:
+            self.server_names.append(server_name)
+            reply = quic_sni.build_initial(assembler.dcid, os.urandom(8), b"\x01", server=True)
+            self.transport.sendto(reply, addr)
+
+
+class Client(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.responses = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.responses.put_nowait(data)
+
+    async def receive(self, timeout: float = 1.0):
+        try:
+            return await asyncio.wait_for(self.responses.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+async def open_client(port: int):
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(Client, remote_addr=("127.0.0.1", port))
+    return transport, client
+
+
+async def run_checks():
+    work_dir = tempfile.mkdtemp(prefix="ninja-dns-quic-")
+    config_file = os.path.join(work_dir, "quicproxy.json")
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump(render_config(DOMAINS, PROFILES, 100), f)
+
+    loop = asyncio.get_running_loop()
+    resolver = StandinResolver(answer_ip="127.0.0.1")
+    resolver_port = await resolver.start_udp()
+    origin = StandinOrigin()
+    origin_transport, _ = await loop.create_datagram_endpoint(lambda: origin, local_addr=("127.0.0.1", 0))
+    origin_port = origin_transport.get_extra_info("sockname")[1]
+
+    forwarder = QuicForwarder(config_file, ("127.0.0.1", resolver_port), origin_port=origin_port)
+    listener = await forwarder.serve("127.0.0.1", 0)
+    port = listener.get_extra_info("sockname")[1]
+
+    checks = []
+
+    # Домен из списка (поддомен): ответ сервера доходит, поток продолжает ретранслироваться
+    transport, client = await open_client(port)
+    for packet in initial_packets("api.chatgpt.com"):
+        transport.sendto(packet)
+    reply = await client.receive()
+    checks.append((reply is not None and quic_sni.is_initial(reply), "Initial ретранслирован, ответ сервера получен"))
+    transport.sendto(b"\x40short-header")
+    echo = await client.receive()
+    checks.append((echo == b"echo:\x40short-header", "пакеты после рукопожатия идут в тот же поток"))
+    transport.close()
+
+    # ClientHello на три пакета (как с постквантовым обменом ключей)
+    transport, client = await open_client(port)
+    packets = initial_packets("chatgpt.com", padding=2500)
+    for packet in packets:
+        transport.sendto(packet)
+    reply = await client.receive()
+    checks.append((len(packets) == 3 and reply is not None, f"ClientHello из {len(packets)} пакетов собран"))
+    transport.close()
+
+    # Домен не из списка: до сервера ничего не доходит
+    received = origin.received
+    transport, client = await open_client(port)
+    for packet in initial_packets("example.org"):
+        transport.sendto(packet)
+    reply = await client.receive(0.5)
+    checks.append((reply is None and origin.received == received and forwarder.stats["rejected_sni"] == 1,
+                   "SNI не из списка отброшен"))
+    transport.close()
+
+    # Мусор вместо Initial не создает поток
+    transport, client = await open_client(port)
+    transport.sendto(os.urandom(1200))
+    checks.append((await client.receive(0.3) is None and origin.received == received, "не-QUIC датаграмма отброшена"))
+    transport.close()
+
+    # Поврежденный ClientHello (длина session id за пределами сообщения): отказ, а не исключение
+    hello = bytearray(client_hello("chatgpt.com"))
+    hello[38] = 0xFF
+    frame = b"\x06" + quic_sni.encode_varint(0) + quic_sni.encode_varint(len(hello)) + bytes(hello)
+    transport, client = await open_client(port)
+    transport.sendto(quic_sni.build_initial(os.urandom(8), os.urandom(8), frame))
+    checks.append((await client.receive(0.3) is None and origin.received == received
+                   and forwarder.stats["invalid"] == 1, "поврежденный ClientHello отклонен"))
+    transport.close()
+
+    # limit_conn 2 профиля: третий поток с того же адреса срезается
+    transports, replies = [], []
+    for _ in range(3):
+        transport, client = await open_client(port)
+        transports.append(transport)
+        for packet in initial_packets("limited.example"):
+            transport.sendto(packet)
+        replies.append(await client.receive(0.5))
+    checks.append((replies[0] is not None and replies[1] is not None and replies[2] is None
+                   and forwarder.stats["limited"] == 1, "limit_conn на клиента соблюдается"))
+    for transport in transports:
+        transport.close()
+
+    checks.append((origin.server_names[:1] == ["api.chatgpt.com"], "сервер получил исходный SNI"))
+    print(f"ℹ️  Счетчики: {forwarder.snapshot()}")
+
+    listener.close()
+    origin_transport.close()
+    resolver.close()
+    return checks
+
+
+def main():
+    print("🧪 Ninja DNS - QUIC forwarder (UDP 443)")
+    print("=" * 50)
+    success = True
+    for ok, description in asyncio.run(run_checks()):
+        print(f"{'✅' if ok else '❌'} {description}")
+        success = success and ok
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
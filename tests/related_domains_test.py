@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Подсказки связанных доменов (app.related_domains) на синтетическом audit-логе
+
+Клиенты открывают сайты: перехваченный домен и его CDN/API хосты в пределах
+пары секунд, плюс общие имена (аналитика, шрифты), которые запрашиваются
+на любых сайтах, и фоновый шум. Лог читается тем же QueryStats, что и в
+админке. Проверяется, что хосты перехваченных сайтов попадают в подсказки
+с правильным якорем, общие имена и шум - нет, а память ограничена при
+большом числе клиентов и уникальных имен.
+
+    python related_domains_test.py [--clients 2000] [--visits 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app.query_log import LogTailer, QueryStats  # noqa: E402
+from app.related_domains import CoQueryAnalyzer  # noqa: E402
+
+SERVER_IP = "10.0.0.1"
+# Перехваченный сайт -> хосты, без которых он загружается наполовину
+SITES = {
+    "chatgpt.com": ["cdn.oaistatic.com", "files.oaiusercontent.com"],
+    "claude.ai": ["assets.claudeusercontent.com"],
+    "netflix.com": ["occ-0-1.nflxso.net", "ipv4-c001.nflxvideo.net", "assets.nflxext.com"],
+}
+# Запрашиваются на любых сайтах: не должны предлагаться
+COMMON = ["www.google-analytics.com", "fonts.googleapis.com", "www.gstatic.com"]
+OTHER_SITES = [f"site{i}.example.org" for i in range(200)]
+
+
+def line(ts: float, client: str, name: str, qtype: int, result: str) -> str:
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) + f",{int(ts * 1000) % 1000:03d}"
+    return f"[{stamp}] {client} query {name}, type {qtype}, time 0ms, speed: -0.1ms, group default, result {result}\n"
+
+
+def visit(rng: random.Random, ts: float, client: str, site: str, hosts: list) -> list:
+    """Загрузка страницы: сайт, затем его хосты и общие имена за 0-3 с, A и AAAA"""
+    hijacked = site in SITES
+    events = [(ts, site, SERVER_IP if hijacked else "93.184.216.34")]
+    for name in hosts + rng.sample(COMMON, 2):
+        events.append((ts + rng.uniform(0.05, 3.0), name, "93.184.216.35"))
+    lines = []
+    for at, name, result in sorted(events):
+        for qtype in (1, 28):
+            lines.append((at, line(at, client, name, qtype, result)))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подсказки связанных доменов")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--visits", type=int, default=50000)
+    parser.add_argument("--noise-names", type=int, default=500000, help="Пространство уникальных фоновых имен")
+    parser.add_argument("--max-memory-mb", type=float, default=64.0)
+    args = parser.parse_args()
+
+    print("🧪 Ninja DNS - Подсказки связанных доменов")
+    print("=" * 70)
+    path = os.path.join(tempfile.mkdtemp(prefix="ninja-dns-related-"), "smartdns-audit.log")
+    rng = random.Random(1)
+    now = time.time() - args.visits
+    records = []
+    for i in range(args.visits):
+        client = f"192.168.{rng.randrange(args.clients) // 250}.{rng.randrange(args.clients) % 250 + 1}"
+        if rng.random() < 0.3:
+            site = rng.choice(list(SITES))
+            records.extend(visit(rng, now, client, site, SITES[site]))
+        else:
+            site = rng.choice(OTHER_SITES)
+            records.extend(visit(rng, now, client, site, [f"static.{site}"]))
+        # Фон: случайные имена без связи с посещениями
+        noise_at = now + rng.uniform(0, 1)
+        records.append((noise_at, line(noise_at, client, f"n{rng.randrange(args.noise_names)}.example.net", 1,
+                                       "93.184.216.36")))
+        now += rng.uniform(0.5, 1.5)
+    records.sort(key=lambda r: r[0])
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(text for _, text in records)
+
+    analyzer = CoQueryAnalyzer()
+    stats = QueryStats(LogTailer(path, start_at_end=False), [SERVER_IP], related=analyzer)
+    stats.set_domains(SITES)
+    tracemalloc.start()
+    started = time.perf_counter()
+    queries = 0
+    while True:
+        polled = stats.poll()
+        if not polled:
+            break
+        queries += polled
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    suggestions = analyzer.suggestions()
+    print(f"ℹ️  Запросов: {queries}, разбор с анализом: {queries / elapsed:,.0f} запросов/с, "
+          f"память {current / 1e6:.1f}MB (пик {peak / 1e6:.1f}MB)")
+    print("ℹ️  Подсказки:")
+    for entry in suggestions[:10]:
+        print(f"     {entry['name']:<28} score {entry['score']:>8}  якорь {entry['anchors'][0]['domain']:<12} "
+              f"доля {entry['anchors'][0]['share']}  клиентов {entry['clients']}")
+
+    expected = {}
+    for site, hosts in SITES.items():
+        for host in hosts:
+            expected[".".join(host.split(".")[-2:])] = site
+    suggested = {entry["name"]: entry["anchors"][0]["domain"] for entry in suggestions}
+    common = {".".join(name.split(".")[-2:]) for name in COMMON} | set(COMMON)
+    wrong_anchor = [name for name, site in expected.items() if suggested.get(name) not in (None, site)]
+    checks = [
+        (set(expected) <= set(suggested), f"Хосты перехваченных сайтов предложены ({len(set(expected) & set(suggested))}"
+                                          f"/{len(expected)})"),
+        (not wrong_anchor, f"Якорь совпадает с сайтом (ошибок: {len(wrong_anchor)})"),
+        (not (common & set(suggested)), "Общие имена (аналитика, шрифты) не предложены"),
+        (not any(name.startswith("n") and name.endswith("example.net") for name in suggested), "Фоновый шум не предложен"),
+        (current / 1e6 <= args.max_memory_mb, f"Память анализатора {current / 1e6:.1f}MB (порог {args.max_memory_mb}MB)"),
+    ]
+    for ok, text in checks:
+        print(f"{'✅' if ok else '❌'} {text}")
+    stats.close()
+    sys.exit(0 if all(ok for ok, _ in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Строки, которые админка генерирует в smartdns.conf
+
+Проверяется точный вид правил, синтаксис которых легко сломать незаметно:
+https-record со списком alpn (SmartDNS делит параметры по запятым вне кавычек)
+и структура групп клиентов: группа в SmartDNS видит только свои правила,
+поэтому общие правила подключаются в каждую группу из общего файла.
+
+    python smartdns_config_test.py
+"""
+import os
+import sys
+import tempfile
+
+ADMIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin")
+sys.path.insert(0, ADMIN_DIR)
+
+SERVER_IP = "10.0.0.1"
+SERVER_IPV6 = "2001:db8::1"
+
+
+def load_main(data_dir: str):
+    """Модуль админки на временном каталоге данных (импорт main требует cwd=admin)"""
+    os.environ["DATA_DIR"] = data_dir
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    os.makedirs(os.path.join(data_dir, "smartdns"), exist_ok=True)
+    os.makedirs(os.path.join(data_dir, "sniproxy"), exist_ok=True)
+    os.chdir(ADMIN_DIR)
+    import app.main
+    return app.main
+
+
+def check(results: list, title: str, expected, actual) -> None:
+    ok = expected == actual
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} {title}")
+    if not ok:
+        print(f"   ожидалось: {expected!r}")
+        print(f"   получено:  {actual!r}")
+
+
+def https_record_tests(main, results: list) -> None:
+    manager = main.DomainManager()
+    data = {
+        "server_ip": SERVER_IP,
+        "server_ipv6": SERVER_IPV6,
+        "domains": [{"name": "video.example", "https_policy": "own", "ipv6_policy": "own"}],
+    }
+    domain = data["domains"][0]
+
+    main.QUIC_PROXY_ENABLED = True
+    rules = manager.record_policy_rules(domain, data, SERVER_IPV6)
+    check(results, "alpn h3,h2 в кавычках, подсказки адресов отдельными ключами",
+          f'https-record /video.example/alpn="h3,h2",ipv4hint={SERVER_IP},ipv6hint={SERVER_IPV6}', rules[-1])
+
+    main.QUIC_PROXY_ENABLED = False
+    rules = manager.record_policy_rules(domain, data, SERVER_IPV6)
+    check(results, "одиночный alpn без кавычек",
+          f"https-record /video.example/alpn=h2,ipv4hint={SERVER_IP},ipv6hint={SERVER_IPV6}", rules[-1])
+
+    main.QUIC_PROXY_ENABLED = True
+    config = manager.generate_smartdns_config(data).splitlines()
+    check(results, "строка попадает в конфиг без изменений", 1,
+          config.count(f'https-record /video.example/alpn="h3,h2",ipv4hint={SERVER_IP},ipv6hint={SERVER_IPV6}'))
+
+
+def group_structure_tests(main, results: list) -> None:
+    manager = main.DomainManager()
+    data = {
+        "server_ip": SERVER_IP,
+        "domains": [
+            {"name": "shared.example"},
+            {"name": "kids.example", "groups": ["family"]},
+            {"name": "off.example", "groups": ["family"], "enabled": False},
+        ],
+        "groups": {"family": {"clients": ["192.168.1.0/24", "10.1.0.5"]}, "empty": {"clients": []}},
+    }
+    config = manager.generate_smartdns_config(data, "/etc/smartdns/conf.d/shared-rules.conf")
+    shared = manager.generate_shared_rules(data).splitlines()
+    test_domain_rule = f"address /*.{main.TEST_DOMAIN}/{SERVER_IP}"
+
+    check(results, "общие правила: проверочный wildcard и домены без групп",
+          [test_domain_rule, f"address /shared.example/{SERVER_IP}", "address /shared.example/#6",
+           "https-record /shared.example/#"], shared)
+
+    head, _, groups = config.partition("\ngroup-begin ")
+    check(results, "вне групп - те же общие правила, без доменов групп",
+          True, all(rule in head.splitlines() for rule in shared) and "kids.example" not in head)
+
+    check(results, "блок группы: клиенты, общий файл, затем свои домены",
+          ["family",
+           "client-rules 192.168.1.0/24",
+           "client-rules 10.1.0.5",
+           "conf-file /etc/smartdns/conf.d/shared-rules.conf",
+           f"address /kids.example/{SERVER_IP}",
+           "address /kids.example/#6",
+           "https-record /kids.example/#",
+           "group-end"],
+          groups.splitlines())
+
+    check(results, "группа без клиентов не попадает в конфиг", False, "group-begin empty" in config)
+
+
+def main():
+    print("🧪 Ninja DNS - Генерация конфигурации SmartDNS")
+    print("=" * 50)
+
+    results: list = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        main_module = load_main(data_dir)
+        https_record_tests(main_module, results)
+        group_structure_tests(main_module, results)
+
+    passed = sum(results)
+    print(f"\nℹ️  Пройдено {passed} из {len(results)}")
+    sys.exit(0 if passed == len(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность и задержка рукопожатия sniproxy на локальных TLS серверах
+
+Для N фиктивных доменов поднимаются TLS серверы-стенды (свой порт на домен,
+несколько процессов с SO_REUSEPORT) и стенд резолвера. Конфиг nginx строится
+настоящим генератором админки и переписывается на локальные порты и пути.
+Через прокси идут:
+  - рукопожатия: connect + TLS handshake с SNI случайного домена, новых соединений/с и p50/p99;
+  - bulk: скачивание --bulk-bytes на соединение, суммарная пропускная способность.
+
+Варианты - декартово произведение --layouts, --buffers, --workers и --profiles:
+    python sniproxy_bench.py --domains 500 --layouts regex,hostnames --buffers 16k,64k --workers 1,2 --profiles 1,2
+    python sniproxy_bench.py --nginx-bin /usr/sbin/nginx
+    python sniproxy_bench.py --direct   # только стенды, без прокси: потолок самого стенда
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_utils import free_port, latency_summary
+from standin_dns import StandinResolver, self_signed_context
+
+ADMIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin")
+sys.path.insert(0, ADMIN_DIR)
+
+from app import dns_wire  # noqa: E402
+
+DOMAIN_ZONE = "bench.test"
+CHUNK = os.urandom(256 * 1024)
+
+
+def domain_names(count: int) -> list:
+    return [f"d{i}.{DOMAIN_ZONE}" for i in range(count)]
+
+
+async def serve_origin(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Стенд сервера: 8 байт размера от клиента, в ответ столько же байт; EOF - просто рукопожатие"""
+    try:
+        size = struct.unpack(">Q", await reader.readexactly(8))[0]
+        while size > 0:
+            writer.write(CHUNK[:min(size, len(CHUNK))])
+            size -= len(CHUNK)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+        pass
+    finally:
+        writer.close()
+
+
+def origin_process(ports: list, resolver_port: int, ready):
+    """Отдельный процесс: TLS серверы доменов (и резолвер в первом процессе)"""
+    async def run():
+        tls = self_signed_context(DOMAIN_ZONE)
+        for port in ports:
+            await asyncio.start_server(serve_origin, "127.0.0.1", port, ssl=tls, reuse_port=True, backlog=4096)
+        if resolver_port:
+            await StandinResolver(answer_ip="127.0.0.1").start_udp(resolver_port)
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+def start_origins(ports: list, resolver_port: int, processes: int) -> list:
+    workers = []
+    for i in range(processes):
+        ready = multiprocessing.Event()
+        worker = multiprocessing.Process(target=origin_process, args=(ports, resolver_port if i == 0 else 0, ready),
+                                         daemon=True)
+        worker.start()
+        if not ready.wait(60):
+            raise RuntimeError("Origin stand-ins did not start")
+        workers.append(worker)
+    return workers
+
+
+def load_generator(data_dir: str):
+    """DomainManager админки на временном каталоге данных (импорт main требует cwd=admin)"""
+    os.environ["DATA_DIR"] = data_dir
+    os.makedirs(os.path.join(data_dir, "smartdns"), exist_ok=True)
+    os.chdir(ADMIN_DIR)
+    from app.main import DomainManager
+    return DomainManager()
+
+
+def render_config(generator, names: list, ports: dict, layout: str, buffer_size: str, workers: int, profiles: int,
+                  listen_port: int, resolver_port: int, work_dir: str) -> str:
+    """
+    Конфиг генератора, переписанный на порты стендов, локальный резолвер и временные пути.
+    profiles > 1 - домены разнесены по категориям с разными limit_conn (диспетчер через unix сокеты).
+    """
+    domains_data = {
+        "server_ip": "127.0.0.1",
+        "domains": [{"name": name, "category": f"c{i % profiles}", "enabled": True} for i, name in enumerate(names)],
+        # Диспетчер нужен только лимитам по категориям: разные limit_conn, заведомо выше нагрузки бенчмарка
+        "categories": {f"c{j}": {"proxy": {"limit_conn": 100000 - j}} for j in range(profiles)},
+    }
+    config = generator.generate_sniproxy_config(domains_data, map_layout=layout)
+    config = re.sub(r"worker_processes (\d+|auto);", f"worker_processes {workers};", config)
+    config = re.sub(r"proxy_buffer_size \S+;", f"proxy_buffer_size {buffer_size};", config)
+    config = re.sub(r"(?m)^(\s*)resolver \S+ ", rf"\g<1>resolver 127.0.0.1:{resolver_port} ", config)
+    config = re.sub(r"server traefik:\d+;", "server 127.0.0.1:9;", config)
+    config = config.replace("listen 443;", f"listen 127.0.0.1:{listen_port} backlog=4096;")
+    config = config.replace("/var/run/", f"{work_dir}/").replace("/var/log/nginx/", f"{work_dir}/")
+    for name in names:
+        config = config.replace(f" {name}:443;", f" {name}:{ports[name]};")
+    return config
+
+
+def start_nginx(args, config_file: str, work_dir: str):
+    if args.nginx_bin:
+        return subprocess.Popen([args.nginx_bin, "-p", work_dir, "-c", config_file, "-g", "daemon off;"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return subprocess.Popen(
+        ["docker", "run", "--rm", "--network", "host", "--name", f"ninja-dns-sniproxy-bench-{os.getpid()}",
+         "-v", f"{work_dir}:{work_dir}", args.image, "nginx", "-c", config_file, "-g", "daemon off;"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def stop_nginx(args, process):
+    if not args.nginx_bin:
+        subprocess.run(["docker", "stop", f"ninja-dns-sniproxy-bench-{os.getpid()}"], capture_output=True)
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def wait_listening(port: int, timeout: float = 30):
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listens on {port}")
+
+
+class Route:
+    """Куда подключается клиент: через прокси (один порт, SNI решает) или напрямую к стенду домена"""
+
+    def __init__(self, names: list, proxy_port: int = 0, ports: dict = None):
+        self.names = names
+        self.proxy_port = proxy_port
+        self.ports = ports or {}
+
+    def port(self, name: str) -> int:
+        return self.proxy_port or self.ports[name]
+
+
+async def handshakes(route: Route, concurrency: int, duration: float, timeout: float) -> dict:
+    """Новые соединения: connect + рукопожатие, закрытие сразу после"""
+    context = dns_wire.insecure_tls_context(["http/1.1"])
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+
+    async def client(rng: random.Random):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            name = rng.choice(route.names)
+            started = time.monotonic()
+            try:
+                _, writer = await dns_wire.open_stream("127.0.0.1", route.port(name), tls=context,
+                                                       server_name=name, timeout=timeout)
+            except (asyncio.TimeoutError, OSError, ssl.SSLError):
+                errors += 1
+                continue
+            latencies.append(time.monotonic() - started)
+            writer.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(random.Random(i)) for i in range(concurrency)))
+    return {"conn_per_s": round(len(latencies) / (time.monotonic() - started), 1), "errors": errors,
+            **latency_summary(latencies)}
+
+
+async def bulk(route: Route, concurrency: int, size: int, timeout: float) -> dict:
+    """Одновременное скачивание size байт каждым клиентом"""
+    context = dns_wire.insecure_tls_context(["http/1.1"])
+    received, errors = 0, 0
+
+    async def client(name: str):
+        nonlocal received, errors
+        try:
+            reader, writer = await dns_wire.open_stream("127.0.0.1", route.port(name), tls=context,
+                                                        server_name=name, timeout=timeout)
+            writer.write(struct.pack(">Q", size))
+            while True:
+                data = await asyncio.wait_for(reader.read(1 << 20), timeout)
+                if not data:
+                    break
+                received += len(data)
+            writer.close()
+        except (asyncio.TimeoutError, OSError, ssl.SSLError):
+            errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(route.names[i % len(route.names)]) for i in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return {"mbit_per_s": round(received * 8 / elapsed / 1e6, 1), "errors": errors,
+            "complete": received >= size * concurrency}
+
+
+async def measure(route: Route, args) -> dict:
+    return {
+        "handshake": await handshakes(route, args.concurrency, args.duration, args.timeout),
+        "bulk": await bulk(route, args.bulk_clients, args.bulk_bytes, args.timeout),
+    }
+
+
+def report(label: str, result: dict):
+    hs, bk = result["handshake"], result["bulk"]
+    print(f"  {label:<46} {hs['conn_per_s']:>9} conn/s  p50 {hs['p50_ms']:>7}ms  p99 {hs['p99_ms']:>8}ms  "
+          f"ошибок {hs['errors']:>4} | bulk {bk['mbit_per_s']:>9} Mbit/s ошибок {bk['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность и рукопожатия через sniproxy (nginx stream)")
+    parser.add_argument("--domains", type=int, default=200)
+    parser.add_argument("--layouts", default="regex,hostnames")
+    parser.add_argument("--buffers", default="16k")
+    parser.add_argument("--workers", default="1")
+    parser.add_argument("--profiles", default="1", help="Число профилей (>1 - диспетчер по unix сокетам)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Параллельных клиентов рукопожатий")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--bulk-clients", type=int, default=16)
+    parser.add_argument("--bulk-bytes", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--origin-processes", type=int, default=max(1, os.cpu_count() // 2))
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--direct", action="store_true", help="Только стенды без прокси")
+    parser.add_argument("--nginx-bin", help="Локальный nginx вместо docker")
+    parser.add_argument("--image", default="nginx:alpine")
+    parser.add_argument("--json", help="Сохранить результаты в файл")
+    args = parser.parse_args()
+
+    names = domain_names(args.domains)
+    ports = {name: free_port() for name in names}
+    resolver_port = free_port()
+    work_dir = tempfile.mkdtemp(prefix="ninja-dns-sniproxy-")
+    origins = start_origins(list(ports.values()), resolver_port, args.origin_processes)
+
+    print("🧪 Ninja DNS - sniproxy: рукопожатия и пропускная способность")
+    print("=" * 70)
+    print(f"ℹ️  Доменов {args.domains}, клиентов {args.concurrency}, bulk {args.bulk_clients} x "
+          f"{args.bulk_bytes // (1024 * 1024)}MB, процессов стендов {args.origin_processes}")
+
+    results = {}
+    success = True
+    try:
+        direct = asyncio.run(measure(Route(names, ports=ports), args))
+        results["direct"] = direct
+        report("напрямую (без прокси)", direct)
+
+        if not args.direct:
+            generator = load_generator(os.path.join(work_dir, "data"))
+            variants = itertools.product(args.layouts.split(","), args.buffers.split(","),
+                                         [int(w) for w in args.workers.split(",")],
+                                         [int(p) for p in args.profiles.split(",")])
+            for layout, buffer_size, workers, profiles in variants:
+                label = f"{layout} buffer={buffer_size} workers={workers} profiles={profiles}"
+                listen_port = free_port()
+                config_file = os.path.join(work_dir, f"nginx-{layout}-{buffer_size}-{workers}-{profiles}.conf")
+                with open(config_file, "w", encoding="utf-8") as f:
+                    f.write(render_config(generator, names, ports, layout, buffer_size, workers, profiles,
+                                          listen_port, resolver_port, work_dir))
+                process = start_nginx(args, config_file, work_dir)
+                try:
+                    wait_listening(listen_port)
+                    result = asyncio.run(measure(Route(names, proxy_port=listen_port), args))
+                finally:
+                    stop_nginx(args, process)
+                results[label] = result
+                report(label, result)
+                success = success and not result["handshake"]["errors"] and result["bulk"]["complete"]
+    finally:
+        for origin in origins:
+            origin.terminate()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"domains": args.domains, "results": results}, f, indent=2)
+        print(f"ℹ️  Результаты: {args.json}")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
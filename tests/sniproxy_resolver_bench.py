@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Сравнение времени первого соединения sniproxy с бэкендом
+для публичного резолвера (как раньше: 8.8.8.8) и локального вида SmartDNS без подмен.
+
+Время первого соединения = DNS запрос бэкенда + TCP connect к полученному IP:443,
+ровно то, что делает nginx на новый бэкенд. Запускать на сервере (или в сети docker):
+
+    python sniproxy_resolver_bench.py --local 127.0.0.1:15353 --names chatgpt.com,claude.ai
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from bench_utils import latency_summary
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app import dns_wire  # noqa: E402
+
+
+def parse_server(value: str):
+    host, _, port = value.rpartition(":")
+    return (host, int(port)) if host else (value, 53)
+
+
+async def first_connection(resolver, name: str, timeout: float):
+    """Возвращает (время DNS, время connect) или None при ошибке"""
+    started = time.monotonic()
+    try:
+        response = await dns_wire.query_udp(resolver[0], resolver[1], dns_wire.build_query(name), timeout=timeout)
+        message = dns_wire.parse_message(response)
+        addresses = [a.data for a in message.answers if a.qtype == dns_wire.QTYPES["A"]]
+        if not addresses:
+            return None
+        resolved = time.monotonic()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(addresses[0], 443), timeout)
+        connected = time.monotonic()
+        writer.close()
+        return resolved - started, connected - started
+    except (asyncio.TimeoutError, OSError, ValueError):
+        return None
+
+
+async def measure(resolver, names, timeout: float):
+    results = await asyncio.gather(*(first_connection(resolver, name, timeout) for name in names))
+    ok = [r for r in results if r is not None]
+    return {
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "dns": latency_summary([r[0] for r in ok]),
+        "first_connection": latency_summary([r[1] for r in ok]),
+    }
+
+
+def load_names(args):
+    if args.names:
+        return [n.strip() for n in args.names.split(",") if n.strip()]
+    with open(args.domains_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [d["name"] for d in data.get("domains", []) if d.get("enabled", True)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время первого соединения sniproxy: публичный vs локальный резолвер")
+    parser.add_argument("--public", default="8.8.8.8:53", help="Публичный резолвер (прежняя схема)")
+    parser.add_argument("--local", default="127.0.0.1:15353", help="Вид SmartDNS без address-правил")
+    parser.add_argument("--names", default="", help="Имена через запятую (по умолчанию из domains.json)")
+    parser.add_argument("--domains-file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "domains.json"))
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    names = load_names(args)
+    print("🧪 Ninja DNS - Время первого соединения sniproxy с бэкендом")
+    print("=" * 70)
+    print(f"ℹ️  Имен: {len(names)}")
+
+    for label, server in (("публичный", args.public), ("локальный", args.local)):
+        resolver = parse_server(server)
+        # Первый проход - холодный кэш резолвера, второй - то, что видит sniproxy в обычной работе
+        for phase in ("холодный", "теплый"):
+            result = asyncio.run(measure(resolver, names, args.timeout))
+            print(f"  {label:<10} {server:<18} {phase:<9} DNS p50 {result['dns']['p50_ms']:>8}ms "
+                  f"p99 {result['dns']['p99_ms']:>8}ms | connect p50 {result['first_connection']['p50_ms']:>8}ms "
+                  f"p99 {result['first_connection']['p99_ms']:>8}ms | ошибок {result['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Локальный стенд DNS резолвера для тестов без доступа в интернет
+Отвечает по UDP, TCP и DoT с настраиваемой задержкой и потерями.
+
+Сбои (set_faults или сценарий run_script по фазам): задержка с разбросом,
+доля потерь, SERVFAIL, усеченные UDP ответы (TC, клиент должен уйти на TCP)
+и отказ TCP/DoT соединений.
+
+Использование как отдельный процесс:
+    python standin_dns.py --udp-port 5300 --tls-port 8530 --delay 0.05
+    python standin_dns.py --udp-port 5300 --script phases.json
+где phases.json: [{"duration": 10}, {"duration": 20, "delay": 0.3, "loss": 0.5}, ...]
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import ssl
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app import dns_wire  # noqa: E402
+
+# Значения сбоев без деградации; каждая фаза сценария начинается с них
+FAULT_DEFAULTS = {"delay": 0.0, "jitter": 0.0, "loss": 0.0, "servfail": 0.0, "truncate": 0.0, "tcp_down": False}
+
+
+def self_signed_context(common_name: str = "standin.local") -> ssl.SSLContext:
+    """Серверный TLS контекст с самоподписанным сертификатом (через openssl)"""
+    directory = tempfile.mkdtemp(prefix="ninja-dns-cert-")
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", f"/CN={common_name}", "-keyout", key_file, "-out", cert_file],
+        check=True, capture_output=True
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+class StandinResolver:
+    """
+    Резолвер-заглушка: на любое имя отвечает answer_ip (A запросы),
+    для остальных типов - пустой NOERROR
+    """
+
+    def __init__(self, answer_ip: str = "127.0.0.1", delay: float = 0.0, loss_every: int = 0,
+                 ttl: int = 300, host: str = "127.0.0.1", seed: int = 0):
+        self.answer_ip = answer_ip
+        self.delay = delay
+        # Терять каждый N-й запрос (детерминированно, чтобы тесты были воспроизводимы)
+        self.loss_every = loss_every
+        self.ttl = ttl
+        self.host = host
+        # Доли (loss, servfail, truncate) разыгрываются генератором с фиксированным seed
+        self.faults = dict(FAULT_DEFAULTS, delay=delay)
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, int] = {"queries": 0, "dropped": 0, "servfail": 0, "truncated": 0, "tcp_refused": 0}
+        self._servers = []
+        self._transports = []
+
+    def set_faults(self, **faults):
+        """Изменить сбои на лету; незаданные остаются как были"""
+        unknown = set(faults) - set(FAULT_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown faults: {', '.join(sorted(unknown))}")
+        self.faults.update(faults)
+        self.delay = self.faults["delay"]
+
+    async def run_script(self, phases: List[dict]):
+        """Фазы {"duration": с, сбои...} по очереди; каждая начинается без сбоев"""
+        for phase in phases:
+            self.set_faults(**dict(FAULT_DEFAULTS, **{k: v for k, v in phase.items() if k != "duration"}))
+            await asyncio.sleep(phase.get("duration", 0))
+        self.set_faults(**FAULT_DEFAULTS)
+
+    def _hit(self, fault: str) -> bool:
+        return bool(self.faults[fault]) and self.rng.random() < self.faults[fault]
+
+    def respond(self, query: bytes) -> Optional[bytes]:
+        """Ответ на запрос или None, если запрос нужно потерять"""
+        self.stats["queries"] += 1
+        if self.loss_every and self.stats["queries"] % self.loss_every == 0 or self._hit("loss"):
+            self.stats["dropped"] += 1
+            return None
+        if self._hit("servfail"):
+            self.stats["servfail"] += 1
+            return dns_wire.build_response(query, rcode=dns_wire.RCODE_SERVFAIL)
+
+        message = dns_wire.parse_message(query)
+        answers = []
+        if message.question and message.question[1] == dns_wire.QTYPES["A"]:
+            answers.append((dns_wire.QTYPES["A"], self.ttl, ipaddress.IPv4Address(self.answer_ip).packed))
+        return dns_wire.build_response(query, answers)
+
+    async def _delayed(self, query: bytes) -> Optional[bytes]:
+        delay = self.delay + (self.rng.uniform(0, self.faults["jitter"]) if self.faults["jitter"] else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        return self.respond(query)
+
+    def _udp_response(self, query: bytes, response: Optional[bytes]) -> Optional[bytes]:
+        """Усечение только для UDP: пустой ответ с флагом TC"""
+        if response is not None and self._hit("truncate"):
+            self.stats["truncated"] += 1
+            return dns_wire.build_response(query, truncated=True)
+        return response
+
+    async def start_udp(self, port: int = 0) -> int:
+        resolver = self
+
+        class Protocol(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                async def reply():
+                    response = resolver._udp_response(data, await resolver._delayed(data))
+                    if response is not None:
+                        self.transport.sendto(response, addr)
+                asyncio.get_running_loop().create_task(reply())
+
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(Protocol, local_addr=(self.host, port))
+        self._transports.append(transport)
+        return transport.get_extra_info("sockname")[1]
+
+    async def _handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.faults["tcp_down"]:
+            self.stats["tcp_refused"] += 1
+            writer.close()
+            return
+        try:
+            while True:
+                query = await dns_wire.read_tcp_message(reader)
+                response = await self._delayed(query)
+                if response is not None:
+                    writer.write(dns_wire.frame_tcp(response))
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    async def start_tcp(self, port: int = 0, tls: Optional[ssl.SSLContext] = None) -> int:
+        """TCP, или DoT при переданном TLS контексте"""
+        server = await asyncio.start_server(self._handle_stream, self.host, port, ssl=tls)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def close(self):
+        for transport in self._transports:
+            transport.close()
+        for server in self._servers:
+            server.close()
+
+
+async def serve(args):
+    resolver = StandinResolver(answer_ip=args.answer_ip, delay=args.delay, loss_every=args.loss_every, host=args.host)
+    resolver.set_faults(jitter=args.jitter, loss=args.loss, servfail=args.servfail, truncate=args.truncate)
+    udp_port = await resolver.start_udp(args.udp_port)
+    tcp_port = await resolver.start_tcp(args.udp_port if args.tcp else args.tcp_port)
+    tls_port = await resolver.start_tcp(args.tls_port, tls=self_signed_context()) if args.tls_port else None
+    print(f"Stand-in DNS: udp {udp_port}, tcp {tcp_port}, tls {tls_port}, faults {resolver.faults}")
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            await resolver.run_script(json.load(f))
+        print(f"Script finished: {resolver.stats}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный стенд DNS резолвера")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--udp-port", type=int, default=5300)
+    parser.add_argument("--tcp", action="store_true", help="TCP на том же порту, что и UDP")
+    parser.add_argument("--tcp-port", type=int, default=0)
+    parser.add_argument("--tls-port", type=int, default=0)
+    parser.add_argument("--answer-ip", default="127.0.0.1")
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--loss-every", type=int, default=0)
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке до N с")
+    parser.add_argument("--loss", type=float, default=0.0, help="Доля потерянных запросов")
+    parser.add_argument("--servfail", type=float, default=0.0, help="Доля ответов SERVFAIL")
+    parser.add_argument("--truncate", type=float, default=0.0, help="Доля усеченных UDP ответов")
+    parser.add_argument("--script", help="JSON список фаз сбоев")
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Тест времени старта админки
+Запускает uvicorn локально без Docker сокета и измеряет, через сколько
+начинают отвечать /healthz и /readyz
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench_utils import ADMIN_DIR, free_port
+
+STARTUP_LIMIT = float(os.getenv("STARTUP_LIMIT", "5"))
+
+
+def wait_for(url: str, deadline: float) -> tuple[float, int]:
+    """Ждем первого HTTP ответа, возвращаем время и код"""
+    started = time.monotonic()
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            return time.monotonic() - started, response.status_code
+        except requests.exceptions.RequestException:
+            time.sleep(0.02)
+    return -1, 0
+
+
+def test_startup_time():
+    """Тест: /healthz отвечает быстро даже без Docker, /readyz честно сообщает 503"""
+    print("🧪 Тест: время старта админки без Docker сокета")
+
+    port = free_port()
+    data_dir = tempfile.mkdtemp(prefix="ninja-dns-startup-")
+    env = dict(os.environ)
+    env.update({
+        "DATA_DIR": data_dir,
+        "DOCKER_HOST": "unix:///nonexistent/docker.sock",
+        "LOG_LEVEL": "warning",
+    })
+
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ADMIN_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+    try:
+        elapsed, status = wait_for(f"http://127.0.0.1:{port}/healthz", started + STARTUP_LIMIT * 3)
+        total = time.monotonic() - started
+        if status != 200:
+            print(f"❌ /healthz не ответил за {STARTUP_LIMIT * 3:.0f}s")
+            return False
+        print(f"ℹ️  /healthz ответил через {total:.3f}s после запуска процесса")
+
+        response = requests.get(f"http://127.0.0.1:{port}/readyz", timeout=2)
+        if response.status_code != 503:
+            print(f"❌ /readyz без Docker должен вернуть 503, получили {response.status_code}")
+            return False
+        print(f"✅ /readyz корректно сообщает о неготовности: {response.json()['checks']}")
+
+        if total > STARTUP_LIMIT:
+            print(f"❌ Старт занял {total:.3f}s, лимит {STARTUP_LIMIT:.1f}s")
+            return False
+        print(f"✅ Старт уложился в лимит {STARTUP_LIMIT:.1f}s")
+        return True
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    """Запуск теста"""
+    print("🧪 Ninja DNS - Тест времени старта")
+    print("=" * 50)
+    success = test_startup_time()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
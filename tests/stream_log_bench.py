@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Учет нагрузки sniproxy по доменам (app.stream_log) под нагрузкой
+
+Пишет синтетический stream-лог в формате ninja_stream: соединения к доменам
+из списка и их поддоменам, к SNI вне списка, повторные попытки соединения
+с апстримом. Лог ротируется как в админке (переименование в .1 и новый файл).
+Проверяет совпадение байтов и соединений по доменам с записанными, флаг
+unused для доменов без соединений и то, что память определяется числом
+доменов, а не числом соединений или уникальных SNI.
+
+    python stream_log_bench.py [--domains 5000] [--connections 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app.query_log import LogTailer  # noqa: E402
+from app.stream_log import StreamStats, domain_report  # noqa: E402
+
+
+def stream_line(rng: random.Random, domains: list, active: int, expected: dict) -> str:
+    bytes_in, bytes_out = rng.randint(500, 5000), rng.randint(1000, 2_000_000)
+    session = rng.uniform(0.05, 120)
+    connect = f"{rng.uniform(0.001, 0.2):.3f}"
+    if rng.random() < 0.05:
+        connect = f"{rng.uniform(0.001, 0.2):.3f}, {connect}"
+    if rng.random() < 0.1:
+        # SNI вне списка: проходит через default в map
+        server_name = f"site{rng.randrange(10 ** 6)}.example.org"
+    else:
+        domain = domains[rng.randrange(active)]
+        server_name = domain if rng.random() < 0.5 else f"cdn{rng.randrange(10)}.{domain}"
+        entry = expected.setdefault(domain, [0, 0])
+        entry[0] += 1
+        entry[1] += bytes_in + bytes_out
+    return f"{server_name} 200 {bytes_in} {bytes_out} {session:.3f} {connect}\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Учет нагрузки sniproxy по доменам")
+    parser.add_argument("--domains", type=int, default=5000, help="Доменов в списке")
+    parser.add_argument("--active-share", type=float, default=0.8, help="Доля доменов с трафиком")
+    parser.add_argument("--connections", type=int, default=1_000_000, help="Строк лога")
+    parser.add_argument("--batch", type=int, default=20_000, help="Строк между опросами")
+    parser.add_argument("--rotate-bytes", type=int, default=8 << 20, help="Размер файла до ротации")
+    parser.add_argument("--max-memory-mb", type=float, default=16.0, help="Порог роста памяти после прогрева")
+    args = parser.parse_args()
+
+    print("🧪 Ninja DNS - Учет нагрузки sniproxy по доменам")
+    print("=" * 70)
+    path = os.path.join(tempfile.mkdtemp(prefix="ninja-dns-streamlog-"), "stream.log")
+    open(path, "w").close()
+
+    domains = [f"domain{i}.com" for i in range(args.domains)]
+    active = max(1, int(args.domains * args.active_share))
+    stats = StreamStats(LogTailer(path, start_at_end=False))
+    # Домены учитываются на секунду раньше старта: порог unused длиннее любой паузы активного домена
+    started_at = time.time()
+    stats.set_domains(domains, now=started_at - 1)
+    rng = random.Random(1)
+    expected: dict = {}
+    counted = 0
+    poll_seconds = 0.0
+    memory_after_warmup = None
+
+    tracemalloc.start()
+    log = open(path, "a", encoding="utf-8")
+    total = 0
+    while total < args.connections:
+        batch = min(args.batch, args.connections - total)
+        for _ in range(batch):
+            log.write(stream_line(rng, domains, active, expected))
+            if log.tell() >= args.rotate_bytes:
+                log.close()
+                os.replace(path, f"{path}.1")
+                log = open(path, "a", encoding="utf-8")
+        log.flush()
+        total += batch
+
+        started = time.perf_counter()
+        counted += stats.poll()
+        poll_seconds += time.perf_counter() - started
+        if memory_after_warmup is None and total >= args.connections // 10:
+            memory_after_warmup = tracemalloc.get_traced_memory()[0]
+    log.close()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    state = stats.state()
+    report = {d["name"]: d for d in domain_report(state, unused_after=time.time() - started_at + 0.5)}
+    mismatched = [name for name, (connections, volume) in expected.items()
+                  if report[name]["connections"] != connections
+                  or report[name]["bytes_in"] + report[name]["bytes_out"] != volume]
+    unused = sorted(name for name, d in report.items() if d["unused"])
+    expected_unused = sorted(set(domains) - set(expected))
+    growth_mb = (current - (memory_after_warmup or 0)) / 1e6
+
+    print(f"ℹ️  Строк: {total}, ротаций: {state['tailer']['rotations']}, разбор: {total / poll_seconds:,.0f} строк/с")
+    print(f"ℹ️  Доменов с трафиком: {len(expected)}, unused: {len(unused)}, SNI вне списка (top): "
+          f"{len(state['other'])}")
+    print(f"ℹ️  Память: после прогрева {(memory_after_warmup or 0) / 1e6:.1f}MB, в конце {current / 1e6:.1f}MB, "
+          f"пик {peak / 1e6:.1f}MB")
+
+    checks = [
+        (counted == total, f"Все строки учтены ({counted}/{total})"),
+        (not mismatched, f"Соединения и байты совпадают по доменам (расхождений: {len(mismatched)})"),
+        (unused == expected_unused, f"Флаг unused у доменов без трафика ({len(unused)}/{len(expected_unused)})"),
+        (state["tailer"]["unparsed"] == 0, "Нет неразобранных строк"),
+        (growth_mb <= args.max_memory_mb, f"Рост памяти после прогрева {growth_mb:.1f}MB (порог {args.max_memory_mb}MB)"),
+    ]
+    for ok, text in checks:
+        print(f"{'✅' if ok else '❌'} {text}")
+    stats.close()
+    sys.exit(0 if all(ok for ok, _ in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,450 +2,360 @@
 """
 Автоматические тесты для Ninja DNS системы
 Проверяет работоспособность DNS, sniproxy, админки и проксирования
+
+Проверки независимы и выполняются параллельно: DNS запросы через app.dns_wire,
+HTTP через requests в пуле потоков, без ping/nc/dig/docker в subprocess.
+После добавления и удаления домена вместо фиксированных пауз опрашивается
+/api/config/state, пока примененный хэш domains.json не совпадет с текущим.
+Итог: время каждой проверки и JUnit XML (--junit).
+
+Использование:
+    python test_system.py [--vps-ip IP] [--admin-url URL] [--junit results.xml]
+    python test_system.py --only dns_udp,admin_panel --config-dir /root/baltic-dns
 """
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
 
 import requests
-import subprocess
-import time
-import json
-import sys
-from typing import Dict, List, Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+from app import dns_wire  # noqa: E402
+
+
+class SkipCheck(Exception):
+    """Проверка неприменима в этом окружении (попадает в JUnit как skipped)"""
+
+
+class CheckFailed(Exception):
+    pass
+
+
+class CheckResult(NamedTuple):
+    name: str
+    status: str
+    seconds: float
+    message: str
+
 
 class BalticDNSTests:
-    def __init__(self):
-        self.vps_ip = "185.237.95.211"
-        self.admin_url = "https://dns.uzicus.ru"
-        self.test_domain = "test-auto.com"
+    # Меняют domains.json и перезапускают SmartDNS
+    MUTATING_CHECKS = ("domain_lifecycle", "domain_removal")
+
+    def __init__(self, vps_ip: str = "185.237.95.211", admin_url: str = "https://dns.uzicus.ru",
+                 config_dir: Optional[str] = None, apply_timeout: float = 60.0):
+        self.vps_ip = vps_ip
+        self.admin_url = admin_url.rstrip("/")
+        self.config_dir = config_dir
+        self.apply_timeout = apply_timeout
+        self.test_domain = f"test-auto-{uuid.uuid4().hex[:8]}.com"
+        self.removal_domain = "httpbin.org"
         self.working_domains = ["chatgpt.com", "claude.ai"]
-        
-    def log(self, message: str, status: str = "INFO"):
-        """Логирование с цветом"""
+
+    def log(self, check: str, message: str, status: str = "INFO"):
+        """Логирование с цветом и именем проверки (вывод проверок перемешан)"""
         colors = {
             "INFO": "\033[94m",    # Синий
-            "PASS": "\033[92m",    # Зеленый 
+            "PASS": "\033[92m",    # Зеленый
             "FAIL": "\033[91m",    # Красный
-            "WARN": "\033[93m"     # Желтый
+            "WARN": "\033[93m",    # Желтый
+            "SKIP": "\033[93m",
         }
         reset = "\033[0m"
-        print(f"{colors.get(status, '')}{status}: {message}{reset}")
-        
-    def run_command(self, cmd: str) -> Dict[str, Any]:
-        """Выполнить команду и вернуть результат"""
-        try:
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=30)
-            return {
-                "success": result.returncode == 0,
-                "stdout": result.stdout.strip(),
-                "stderr": result.stderr.strip(),
-                "returncode": result.returncode
-            }
-        except subprocess.TimeoutExpired:
-            return {"success": False, "stdout": "", "stderr": "Timeout", "returncode": -1}
-        except Exception as e:
-            return {"success": False, "stdout": "", "stderr": str(e), "returncode": -1}
-
-    def test_network_basic(self) -> bool:
-        """Тест 1: Базовая связность сети"""
-        self.log("=== ТЕСТ 1: Базовая связность сети ===")
-        
-        # Пинг VPS
-        result = self.run_command(f"ping -c 3 {self.vps_ip}")
-        if not result["success"]:
-            self.log(f"FAIL: Нет связи с VPS {self.vps_ip}", "FAIL")
-            return False
-        self.log(f"PASS: Пинг VPS {self.vps_ip} успешен", "PASS")
-        
-        # Проверка портов
-        ports_to_check = [53, 443, 853]
-        for port in ports_to_check:
-            result = self.run_command(f"nc -z -w5 {self.vps_ip} {port}")
-            if result["success"]:
-                self.log(f"PASS: Порт {port} доступен", "PASS")
-            else:
-                self.log(f"FAIL: Порт {port} недоступен", "FAIL")
-                return False
-                
-        return True
-
-    def test_dns_resolution(self) -> bool:
-        """Тест 2: DNS разрешение"""
-        self.log("=== ТЕСТ 2: DNS разрешение ===")
-        
-        # Проверка обычного DNS
-        result = self.run_command(f"nslookup chatgpt.com {self.vps_ip}")
-        if not result["success"] or self.vps_ip not in result["stdout"]:
-            self.log("FAIL: DNS не перенаправляет chatgpt.com на VPS", "FAIL")
-            return False
-        self.log("PASS: DNS корректно перенаправляет chatgpt.com", "PASS")
-        
-        # Проверка DoT (если доступен)
-        result = self.run_command(f"dig @{self.vps_ip} +tls chatgpt.com")
-        if result["success"] and self.vps_ip in result["stdout"]:
-            self.log("PASS: DoT работает", "PASS")
+        print(f"{colors.get(status, '')}{status}: [{check}] {message}{reset}")
+
+    # Клиенты
+
+    async def http(self, method: str, path: str, **kwargs) -> requests.Response:
+        url = path if path.startswith("http") else f"{self.admin_url}{path}"
+        kwargs.setdefault("timeout", 15)
+        kwargs.setdefault("verify", False)
+        return await asyncio.to_thread(requests.request, method, url, **kwargs)
+
+    async def resolve(self, name: str, server: Optional[str] = None, tls: bool = False) -> List[str]:
+        """A записи имени через наш DNS (UDP или DoT) или через указанный сервер"""
+        query = dns_wire.build_query(name, "A")
+        server = server or self.vps_ip
+        if tls:
+            reader, writer = await dns_wire.open_stream(server, 853, tls=dns_wire.insecure_tls_context())
+            try:
+                response = await dns_wire.query_stream(reader, writer, query, timeout=5)
+            finally:
+                writer.close()
         else:
-            self.log("WARN: DoT недоступен или не работает", "WARN")
-            
-        return True
-
-    def test_services_status(self) -> bool:
-        """Тест 3: Статус Docker сервисов"""
-        self.log("=== ТЕСТ 3: Статус Docker сервисов ===")
-        
-        # Проверка статуса контейнеров
-        result = self.run_command("docker compose ps --format json")
-        if not result["success"]:
-            self.log("FAIL: Не удается получить статус Docker контейнеров", "FAIL")
-            return False
-            
-        try:
-            containers = [json.loads(line) for line in result["stdout"].split('\n') if line.strip()]
-            required_services = ["smartdns", "sniproxy", "traefik", "admin"]
-            
-            for service in required_services:
-                container = next((c for c in containers if c.get("Service") == service), None)
-                if not container:
-                    self.log(f"FAIL: Контейнер {service} не найден", "FAIL")
-                    return False
-                    
-                if "running" not in container.get("State", "").lower():
-                    self.log(f"FAIL: Контейнер {service} не запущен: {container.get('State')}", "FAIL")
-                    return False
-                    
-                self.log(f"PASS: Контейнер {service} работает", "PASS")
-                
-        except Exception as e:
-            self.log(f"FAIL: Ошибка парсинга статуса контейнеров: {e}", "FAIL")
-            return False
-            
-        return True
+            response = await dns_wire.query_udp(server, 53, query, timeout=5)
+        return [a.data for a in dns_wire.parse_message(response).answers if a.qtype == 1]
 
-    def test_admin_panel(self) -> bool:
-        """Тест 4: Админ-панель доступна"""
-        self.log("=== ТЕСТ 4: Доступность админ-панели ===")
-        
-        try:
-            # Проверка главной страницы
-            response = requests.get(f"{self.admin_url}/", timeout=10, verify=False)
-            if response.status_code != 200:
-                self.log(f"FAIL: Админ-панель недоступна, код: {response.status_code}", "FAIL")
-                return False
-            self.log("PASS: Админ-панель доступна", "PASS")
-            
-            # Проверка API
-            response = requests.get(f"{self.admin_url}/api/domains", timeout=10, verify=False)
-            if response.status_code != 200:
-                self.log(f"FAIL: API недоступно, код: {response.status_code}", "FAIL")
-                return False
-                
-            domains_data = response.json()
-            if not isinstance(domains_data.get("domains"), list):
-                self.log("FAIL: API возвращает некорректные данные", "FAIL")
+    async def domain_names(self) -> List[str]:
+        response = await self.http("GET", "/api/domains")
+        response.raise_for_status()
+        return [d["name"] for d in response.json()["domains"]]
+
+    async def wait_applied(self, domain: str, present: bool):
+        """Ждем, пока текущий domains.json применен и домен в нужном состоянии"""
+        deadline = time.monotonic() + self.apply_timeout
+        while time.monotonic() < deadline:
+            state = (await self.http("GET", "/api/config/state")).json()
+            if state.get("status") == "failed" and state.get("failed_hash") == state.get("config_hash"):
+                raise CheckFailed(f"Применение конфигов провалилось: {state['error']}")
+            if state.get("in_sync") and (domain in await self.domain_names()) == present:
+                return
+            await asyncio.sleep(0.25)
+        raise CheckFailed(f"Конфиги не применены за {self.apply_timeout}s")
+
+    async def eventually(self, probe: Callable[[], Awaitable[bool]], timeout: float, interval: float = 0.5) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            if await probe():
+                return True
+            if time.monotonic() >= deadline:
                 return False
-                
-            self.log(f"PASS: API работает, доменов: {len(domains_data['domains'])}", "PASS")
-            return True
-            
-        except requests.exceptions.RequestException as e:
-            self.log(f"FAIL: Ошибка подключения к админ-панели: {e}", "FAIL")
-            return False
+            await asyncio.sleep(interval)
+
+    async def add_domain(self, name: str):
+        response = await self.http("POST", "/api/domains", json={"name": name, "category": "test", "enabled": True},
+                                   timeout=60)
+        if response.status_code != 200 or not response.json().get("success"):
+            raise CheckFailed(f"Не удалось добавить {name}, код {response.status_code}: {response.text}")
+        await self.wait_applied(name, present=True)
 
-    def test_proxy_working_domains(self) -> bool:
-        """Тест 5: Проксирование рабочих доменов"""
-        self.log("=== ТЕСТ 5: Проксирование рабочих доменов ===")
-        
-        for domain in self.working_domains:
+    async def remove_domain(self, name: str):
+        response = await self.http("DELETE", f"/api/domains/{name}", timeout=60)
+        if response.status_code != 200 or not response.json().get("success"):
+            raise CheckFailed(f"Не удалось удалить {name}, код {response.status_code}: {response.text}")
+        await self.wait_applied(name, present=False)
+
+    # Проверки
+
+    async def check_network_ports(self, name: str):
+        """Порты 53, 443, 853 принимают TCP соединения (вместо ping и nc)"""
+        async def connect(port: int):
             try:
-                # Используем VPS как прокси
-                response = requests.get(f"https://{domain}", timeout=15, verify=False)
-                if response.status_code == 200:
-                    self.log(f"PASS: {domain} доступен через прокси", "PASS")
-                else:
-                    self.log(f"WARN: {domain} вернул код {response.status_code}", "WARN")
+                _, writer = await asyncio.wait_for(asyncio.open_connection(self.vps_ip, port), 5)
+                writer.close()
+                return None
+            except (OSError, asyncio.TimeoutError) as e:
+                return f"{port} ({str(e) or 'timeout'})"
+
+        failed = [f for f in await asyncio.gather(*(connect(p) for p in (53, 443, 853))) if f]
+        if failed:
+            raise CheckFailed(f"Порты недоступны: {', '.join(failed)}")
+        self.log(name, f"Порты 53, 443, 853 на {self.vps_ip} доступны", "PASS")
+
+    async def check_dns_udp(self, name: str):
+        answers = await self.resolve("chatgpt.com")
+        if self.vps_ip not in answers:
+            raise CheckFailed(f"DNS не перенаправляет chatgpt.com на VPS: {answers}")
+        self.log(name, "DNS корректно перенаправляет chatgpt.com", "PASS")
+
+    async def check_dns_dot(self, name: str):
+        try:
+            answers = await self.resolve("chatgpt.com", tls=True)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            raise SkipCheck(f"DoT недоступен: {str(e) or 'timeout'}")
+        if self.vps_ip not in answers:
+            raise CheckFailed(f"DoT не перенаправляет chatgpt.com на VPS: {answers}")
+        self.log(name, "DoT работает", "PASS")
+
+    async def check_services_status(self, name: str):
+        """Статус контейнеров из /api/status админки (вместо docker compose ps)"""
+        status = (await self.http("GET", "/api/status")).json()
+        if "error" in status:
+            raise CheckFailed(f"Админка не получила статус контейнеров: {status['error']}")
+        stopped = {service: state for service, state in status.items() if state != "running"}
+        for service in ("smartdns", "sniproxy", "traefik"):
+            if service not in status:
+                stopped[service] = "not found"
+        if stopped:
+            raise CheckFailed(f"Контейнеры не работают: {stopped}")
+        self.log(name, f"Контейнеры работают: {', '.join(status)}", "PASS")
+
+    async def check_admin_panel(self, name: str):
+        response = await self.http("GET", "/")
+        if response.status_code != 200:
+            raise CheckFailed(f"Админ-панель недоступна, код: {response.status_code}")
+        domains = await self.domain_names()
+        self.log(name, f"Админ-панель и API работают, доменов: {len(domains)}", "PASS")
+
+    async def check_proxy_working_domains(self, name: str):
+        async def fetch(domain: str):
+            try:
+                response = await self.http("GET", f"https://{domain}")
             except requests.exceptions.RequestException as e:
-                self.log(f"FAIL: {domain} недоступен: {e}", "FAIL")
-                return False
-                
-        return True
+                return f"{domain}: {e}"
+            if response.status_code == 200:
+                self.log(name, f"{domain} доступен через прокси", "PASS")
+            else:
+                self.log(name, f"{domain} вернул код {response.status_code}", "WARN")
+            return None
 
-    def test_add_domain(self) -> bool:
-        """Тест 6: Добавление домена через админку"""
-        self.log("=== ТЕСТ 6: Добавление домена ===")
-        
+        failed = [f for f in await asyncio.gather(*(fetch(d) for d in self.working_domains)) if f]
+        if failed:
+            raise CheckFailed("; ".join(failed))
+
+    async def check_domain_lifecycle(self, name: str):
+        """Добавление: список, DNS и конфиги; затем удаление"""
+        domain = self.test_domain
+        await self.add_domain(domain)
         try:
-            # Добавляем тестовый домен
-            payload = {
-                "name": self.test_domain,
-                "category": "test",
-                "enabled": True
-            }
-            
-            response = requests.post(
-                f"{self.admin_url}/api/domains",
-                json=payload,
-                timeout=30,
-                verify=False
-            )
-            
-            if response.status_code != 200:
-                self.log(f"FAIL: Не удалось добавить домен, код: {response.status_code}", "FAIL")
-                if response.text:
-                    self.log(f"Ответ: {response.text}", "FAIL")
-                return False
-                
-            result = response.json()
-            if not result.get("success"):
-                self.log(f"FAIL: API вернул ошибку: {result.get('message', 'Unknown error')}", "FAIL")
-                return False
-                
-            self.log(f"PASS: Домен {self.test_domain} успешно добавлен", "PASS")
-            
-            # Ждем применения конфигурации
-            time.sleep(10)
-            
-            # Проверяем что домен появился в списке
-            response = requests.get(f"{self.admin_url}/api/domains", timeout=10, verify=False)
-            domains_data = response.json()
-            
-            domain_found = any(d["name"] == self.test_domain for d in domains_data["domains"])
-            if not domain_found:
-                self.log(f"FAIL: Домен {self.test_domain} не найден в списке", "FAIL")
-                return False
-                
-            self.log(f"PASS: Домен {self.test_domain} подтвержден в списке", "PASS")
-            return True
-            
-        except requests.exceptions.RequestException as e:
-            self.log(f"FAIL: Ошибка при добавлении домена: {e}", "FAIL")
-            return False
+            self.log(name, f"Домен {domain} добавлен и применен", "PASS")
+            answers = await self.resolve(domain)
+            if self.vps_ip not in answers:
+                raise CheckFailed(f"DNS не перенаправляет {domain} на VPS: {answers}")
+            self.log(name, f"DNS перенаправляет {domain} на VPS", "PASS")
+
+            if self.config_dir:
+                for config in ("smartdns/smartdns.conf", "sniproxy/nginx.conf"):
+                    with open(os.path.join(self.config_dir, config), "r", encoding="utf-8") as f:
+                        if domain not in f.read():
+                            raise CheckFailed(f"Домен {domain} не найден в {config}")
+                self.log(name, f"Домен {domain} есть в smartdns.conf и nginx.conf", "PASS")
+            else:
+                self.log(name, "Конфиги не проверяются: не задан --config-dir", "WARN")
+        finally:
+            await self.remove_domain(domain)
+        self.log(name, f"Домен {domain} удален и применен", "PASS")
+
+    async def check_domain_removal(self, name: str):
+        """После удаления DNS отдает реальные адреса, а не VPS"""
+        domain = self.removal_domain
+        await self.add_domain(domain)
+        if self.vps_ip not in await self.resolve(domain):
+            await self.remove_domain(domain)
+            raise CheckFailed(f"DNS не перенаправляет {domain} на VPS")
+        self.log(name, f"DNS перенаправляет {domain} на VPS", "PASS")
+
+        await self.remove_domain(domain)
+        # Применение перезапускает SmartDNS; ждем, пока кэш не отдаст старый ответ
+        released = await self.eventually(
+            lambda: self._not_redirected(domain), timeout=self.apply_timeout
+        )
+        if not released:
+            raise CheckFailed(f"DNS всё ещё перенаправляет {domain} на VPS")
+        real_ips = await self.resolve(domain, server="8.8.8.8")
+        if not real_ips:
+            raise CheckFailed(f"Не удалось получить реальный IP для {domain}")
+        self.log(name, f"DNS больше не перенаправляет {domain}, реальные IP: {', '.join(real_ips)}", "PASS")
 
-    def test_domain_config_generated(self) -> bool:
-        """Тест 7: Проверка генерации конфигурации для домена"""
-        self.log("=== ТЕСТ 7: Генерация конфигурации ===")
-        
-        # Проверяем SmartDNS конфигурацию
-        result = self.run_command(f"grep '{self.test_domain}' /root/baltic-dns/smartdns/smartdns.conf")
-        if not result["success"]:
-            self.log(f"FAIL: Домен {self.test_domain} не найден в SmartDNS конфигурации", "FAIL")
-            return False
-        self.log(f"PASS: Домен {self.test_domain} добавлен в SmartDNS", "PASS")
-        
-        # Проверяем sniproxy конфигурацию
-        result = self.run_command(f"grep '{self.test_domain}' /root/baltic-dns/sniproxy/nginx.conf")
-        if not result["success"]:
-            self.log(f"FAIL: Домен {self.test_domain} не найден в sniproxy конфигурации", "FAIL")
-            return False
-        self.log(f"PASS: Домен {self.test_domain} добавлен в sniproxy", "PASS")
-        
-        return True
-
-    def test_remove_domain(self) -> bool:
-        """Тест 8: Удаление домена"""
-        self.log("=== ТЕСТ 8: Удаление домена ===")
-        
         try:
-            # Удаляем тестовый домен
-            response = requests.delete(
-                f"{self.admin_url}/api/domains/{self.test_domain}",
-                timeout=30,
-                verify=False
-            )
-            
+            response = await self.http("GET", f"http://{domain}/get", timeout=10, verify=True)
             if response.status_code != 200:
-                self.log(f"FAIL: Не удалось удалить домен, код: {response.status_code}", "FAIL")
-                return False
-                
-            result = response.json()
-            if not result.get("success"):
-                self.log(f"FAIL: API вернул ошибку при удалении: {result.get('message')}", "FAIL")
-                return False
-                
-            self.log(f"PASS: Домен {self.test_domain} успешно удален", "PASS")
-            
-            # Ждем применения конфигурации
-            time.sleep(10)
-            
-            # Проверяем что домен исчез из списка
-            response = requests.get(f"{self.admin_url}/api/domains", timeout=10, verify=False)
-            domains_data = response.json()
-            
-            domain_found = any(d["name"] == self.test_domain for d in domains_data["domains"])
-            if domain_found:
-                self.log(f"FAIL: Домен {self.test_domain} все еще в списке", "FAIL")
-                return False
-                
-            self.log(f"PASS: Домен {self.test_domain} удален из списка", "PASS")
-            return True
-            
+                self.log(name, f"Домен {domain} вернул код {response.status_code}", "WARN")
         except requests.exceptions.RequestException as e:
-            self.log(f"FAIL: Ошибка при удалении домена: {e}", "FAIL")
+            self.log(name, f"Проблема с HTTP доступом к {domain}: {e}", "WARN")
+
+    async def _not_redirected(self, domain: str) -> bool:
+        try:
+            answers = await self.resolve(domain)
+        except (OSError, asyncio.TimeoutError):
             return False
+        return bool(answers) and self.vps_ip not in answers
 
-    def test_domain_accessibility_after_removal(self) -> bool:
-        """Тест 9: Доступность домена после удаления"""
-        self.log("=== ТЕСТ 9: Доступность домена после удаления ===")
-        
-        # Тестируем с реальным доменом который точно существует
-        test_domain = "httpbin.org"  # Публичный API для тестирования
-        
+    def checks(self) -> Dict[str, Callable[[str], Awaitable[None]]]:
+        return {
+            "network_ports": self.check_network_ports,
+            "dns_udp": self.check_dns_udp,
+            "dns_dot": self.check_dns_dot,
+            "services_status": self.check_services_status,
+            "admin_panel": self.check_admin_panel,
+            "proxy_working_domains": self.check_proxy_working_domains,
+            "domain_lifecycle": self.check_domain_lifecycle,
+            "domain_removal": self.check_domain_removal,
+        }
+
+    async def run_check(self, name: str, check: Callable[[str], Awaitable[None]]) -> CheckResult:
+        started = time.monotonic()
         try:
-            # Сначала добавляем домен
-            payload = {
-                "name": test_domain,
-                "category": "test", 
-                "enabled": True
-            }
-            
-            response = requests.post(
-                f"{self.admin_url}/api/domains",
-                json=payload,
-                timeout=30,
-                verify=False
-            )
-            
-            if response.status_code != 200:
-                self.log(f"FAIL: Не удалось добавить тестовый домен {test_domain}", "FAIL")
-                return False
-                
-            self.log(f"PASS: Домен {test_domain} добавлен для тестирования", "PASS")
-            time.sleep(5)
-            
-            # Проверяем DNS разрешение (должен перенаправляться на VPS)
-            result = self.run_command(f"nslookup {test_domain} {self.vps_ip}")
-            if not result["success"] or self.vps_ip not in result["stdout"]:
-                self.log(f"FAIL: DNS не перенаправляет {test_domain} на VPS", "FAIL")
-                return False
-            self.log(f"PASS: DNS перенаправляет {test_domain} на VPS", "PASS")
-            
-            # Теперь удаляем домен
-            response = requests.delete(
-                f"{self.admin_url}/api/domains/{test_domain}",
-                timeout=30,
-                verify=False
-            )
-            
-            if response.status_code != 200:
-                self.log(f"FAIL: Не удалось удалить домен {test_domain}", "FAIL")
-                return False
-                
-            self.log(f"PASS: Домен {test_domain} успешно удален", "PASS")
-            time.sleep(15)  # Больше времени для применения изменений
-            
-            # Очищаем кеш SmartDNS
-            self.run_command("docker exec smartdns rm -f /var/cache/smartdns.cache")
-            self.run_command("docker compose restart smartdns")
-            time.sleep(5)
-            
-            # Проверяем что DNS теперь возвращает реальные IP
-            result = self.run_command(f"nslookup {test_domain} {self.vps_ip}")
-            if not result["success"]:
-                self.log(f"FAIL: DNS запрос к {test_domain} провалился", "FAIL")
-                return False
-                
-            # Проверяем что DNS НЕ возвращает VPS IP в ответе address записях
-            lines = result["stdout"].split('\n')
-            vps_redirect_found = False
-            for line in lines:
-                if 'Address:' in line and self.vps_ip in line and '185.237.95.211#53' not in line:
-                    vps_redirect_found = True
-                    break
-                    
-            if vps_redirect_found:
-                self.log(f"FAIL: DNS всё ещё перенаправляет {test_domain} на VPS", "FAIL")
-                self.log(f"DNS ответ: {result['stdout']}", "FAIL")
-                return False
-                
-            self.log(f"PASS: DNS больше не перенаправляет {test_domain} на VPS", "PASS")
-            
-            # Проверяем прямую доступность домена (используя внешний DNS)
-            result = self.run_command(f"nslookup {test_domain} 8.8.8.8")
-            if not result["success"]:
-                self.log(f"FAIL: Домен {test_domain} недоступен через внешний DNS", "FAIL")
-                return False
-                
-            # Извлекаем IP адрес из ответа nslookup
-            real_ip = None
-            for line in result["stdout"].split('\n'):
-                if 'Address:' in line and not '8.8.8.8' in line:
-                    real_ip = line.split('Address:')[1].strip()
-                    break
-                    
-            if not real_ip:
-                self.log(f"FAIL: Не удалось получить реальный IP для {test_domain}", "FAIL")
-                return False
-                
-            self.log(f"PASS: Получен реальный IP для {test_domain}: {real_ip}", "PASS")
-            
-            # Проверяем HTTP доступность по реальному IP
-            try:
-                response = requests.get(f"http://{test_domain}/get", timeout=10)
-                if response.status_code == 200:
-                    self.log(f"PASS: Домен {test_domain} доступен напрямую", "PASS")
-                else:
-                    self.log(f"WARN: Домен {test_domain} вернул код {response.status_code}", "WARN")
-            except requests.exceptions.RequestException as e:
-                self.log(f"WARN: Проблема с HTTP доступом к {test_domain}: {e}", "WARN")
-                # Не считаем это критической ошибкой
-            
-            return True
-            
+            await check(name)
+            status, message = "passed", ""
+        except SkipCheck as e:
+            status, message = "skipped", str(e)
+            self.log(name, message, "SKIP")
+        except CheckFailed as e:
+            status, message = "failed", str(e)
+            self.log(name, message, "FAIL")
         except Exception as e:
-            self.log(f"FAIL: Критическая ошибка в тесте доступности: {e}", "FAIL")
-            return False
+            status, message = "failed", f"{type(e).__name__}: {e}"
+            self.log(name, f"Критическая ошибка: {message}", "FAIL")
+        return CheckResult(name, status, time.monotonic() - started, message)
+
+    async def run_all_tests(self, only: Optional[List[str]] = None) -> List[CheckResult]:
+        """
+        Проверки только на чтение - параллельно, затем изменяющие - по одной
+
+        Изменяющие проверки меняют domains.json и перезапускают SmartDNS: рядом
+        с ними DNS проверки ловили бы перезапуск, а друг с другом они бы
+        пересекались в применении конфигов.
+        """
+        checks = {name: check for name, check in self.checks().items() if not only or name in only}
+        results = list(await asyncio.gather(*(
+            self.run_check(name, check) for name, check in checks.items() if name not in self.MUTATING_CHECKS
+        )))
+        for name, check in checks.items():
+            if name in self.MUTATING_CHECKS:
+                results.append(await self.run_check(name, check))
+        return results
+
+
+def write_junit(results: List[CheckResult], path: str, total_seconds: float):
+    suite = ET.Element("testsuite", {
+        "name": "ninja-dns-system",
+        "tests": str(len(results)),
+        "failures": str(sum(r.status == "failed" for r in results)),
+        "skipped": str(sum(r.status == "skipped" for r in results)),
+        "time": f"{total_seconds:.3f}",
+    })
+    for result in results:
+        case = ET.SubElement(suite, "testcase", {
+            "classname": "test_system", "name": result.name, "time": f"{result.seconds:.3f}"
+        })
+        if result.status == "failed":
+            ET.SubElement(case, "failure", {"message": result.message})
+        elif result.status == "skipped":
+            ET.SubElement(case, "skipped", {"message": result.message})
+    ET.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
 
-    def run_all_tests(self) -> bool:
-        """Запустить все тесты"""
-        self.log("🚀 ЗАПУСК АВТОМАТИЧЕСКИХ ТЕСТОВ BALTIC DNS", "INFO")
-        self.log("=" * 60, "INFO")
-        
-        tests = [
-            ("Базовая связность", self.test_network_basic),
-            ("DNS разрешение", self.test_dns_resolution),
-            ("Статус сервисов", self.test_services_status),
-            ("Админ-панель", self.test_admin_panel),
-            ("Проксирование", self.test_proxy_working_domains),
-            ("Добавление домена", self.test_add_domain),
-            ("Генерация конфигов", self.test_domain_config_generated),
-            ("Удаление домена", self.test_remove_domain),
-            ("Доступность после удаления", self.test_domain_accessibility_after_removal)
-        ]
-        
-        passed = 0
-        failed = 0
-        
-        for test_name, test_func in tests:
-            try:
-                if test_func():
-                    passed += 1
-                else:
-                    failed += 1
-            except Exception as e:
-                self.log(f"FAIL: Критическая ошибка в тесте '{test_name}': {e}", "FAIL")
-                failed += 1
-            
-            self.log("-" * 60, "INFO")
-        
-        # Итоговый отчет
-        self.log("📊 ИТОГОВЫЙ ОТЧЕТ", "INFO")
-        self.log(f"✅ Пройдено: {passed}", "PASS")
-        self.log(f"❌ Провалено: {failed}", "FAIL" if failed > 0 else "INFO")
-        
-        if failed == 0:
-            self.log("🎉 ВСЕ ТЕСТЫ ПРОШЛИ УСПЕШНО!", "PASS")
-            return True
-        else:
-            self.log("💥 НЕКОТОРЫЕ ТЕСТЫ ПРОВАЛИЛИСЬ", "FAIL")
-            return False
 
 def main():
     """Главная функция"""
+    parser = argparse.ArgumentParser(description="Системные тесты Ninja DNS")
+    parser.add_argument("--vps-ip", default="185.237.95.211")
+    parser.add_argument("--admin-url", default="https://dns.uzicus.ru")
+    parser.add_argument("--config-dir", help="Каталог проекта на сервере для проверки smartdns.conf/nginx.conf")
+    parser.add_argument("--apply-timeout", type=float, default=60.0, help="Ожидание применения конфигов, с")
+    parser.add_argument("--only", help="Только эти проверки, через запятую")
+    parser.add_argument("--junit", help="Сохранить результаты в JUnit XML")
+    args = parser.parse_args()
+
     # Отключаем SSL предупреждения
     import urllib3
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    tester = BalticDNSTests()
-    success = tester.run_all_tests()
-    
-    sys.exit(0 if success else 1)
+
+    tester = BalticDNSTests(args.vps_ip, args.admin_url, args.config_dir, args.apply_timeout)
+    print("🚀 ЗАПУСК АВТОМАТИЧЕСКИХ ТЕСТОВ NINJA DNS")
+    print("=" * 60)
+    started = time.monotonic()
+    results = asyncio.run(tester.run_all_tests(args.only.split(",") if args.only else None))
+    total = time.monotonic() - started
+
+    icons = {"passed": "✅", "failed": "❌", "skipped": "⏭️ "}
+    print("\n📊 ИТОГОВЫЙ ОТЧЕТ")
+    for result in sorted(results, key=lambda r: -r.seconds):
+        print(f"  {icons[result.status]} {result.name:<24} {result.seconds:>7.2f}s  {result.message}")
+    failed = sum(r.status == "failed" for r in results)
+    print(f"ℹ️  Всего {total:.2f}s (сумма проверок {sum(r.seconds for r in results):.2f}s), провалено: {failed}")
+
+    if args.junit:
+        write_junit(results, args.junit, total)
+        print(f"ℹ️  JUnit: {args.junit}")
+
+    sys.exit(0 if failed == 0 else 1)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
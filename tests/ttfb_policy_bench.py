@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-byte для перехваченного домена при разных политиках AAAA и HTTPS RR
+
+Для каждой политики категория переключается через API, после применения
+клиент ведет себя как браузер: параллельно запрашивает A, AAAA и HTTPS,
+при h3 в HTTPS RR сначала пробует QUIC на UDP 443 (ждет ответа --quic-wait),
+затем TCP + TLS + GET и ждет первый байт ответа.
+
+    python ttfb_policy_bench.py --server 185.237.95.211 --admin-url https://dns.example.com \\
+        --auth admin:password --domain chatgpt.com --category ai
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import struct
+import sys
+import time
+
+import requests
+
+from bench_utils import latency_summary
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app import dns_wire  # noqa: E402
+
+POLICIES = ["soa/soa", "own/own", "passthrough/passthrough"]
+
+
+def https_rr_alpn(answers) -> list:
+    """ALPN из HTTPS записей (SvcParam key 1)"""
+    alpn = []
+    for answer in answers:
+        if answer.qtype != dns_wire.QTYPES["HTTPS"]:
+            continue
+        rdata = bytes.fromhex(answer.data)
+        offset = 2
+        while rdata[offset] != 0:  # target name (несжатый)
+            offset += rdata[offset] + 1
+        offset += 1
+        while offset + 4 <= len(rdata):
+            key, length = struct.unpack(">HH", rdata[offset:offset + 4])
+            value = rdata[offset + 4:offset + 4 + length]
+            offset += 4 + length
+            if key == 1:
+                i = 0
+                while i < len(value):
+                    alpn.append(value[i + 1:i + 1 + value[i]].decode("ascii", "replace"))
+                    i += 1 + value[i]
+    return alpn
+
+
+async def resolve(server: str, domain: str, qtype: str, timeout: float):
+    response = await dns_wire.query_udp(server, 53, dns_wire.build_query(domain, qtype), timeout=timeout)
+    return dns_wire.parse_message(response).answers
+
+
+async def fetch_once(server: str, domain: str, quic_wait: float, timeout: float) -> dict:
+    started = time.monotonic()
+    a, aaaa, https = await asyncio.gather(
+        resolve(server, domain, "A", timeout),
+        resolve(server, domain, "AAAA", timeout),
+        resolve(server, domain, "HTTPS", timeout),
+    )
+    dns_done = time.monotonic()
+    addresses = [r.data for r in a if r.qtype == dns_wire.QTYPES["A"]]
+    if not addresses:
+        raise RuntimeError(f"No A record for {domain}")
+
+    alpn = https_rr_alpn(https)
+    quic_stall = 0.0
+    if "h3" in alpn:
+        # Браузер пробует QUIC; на server_ip UDP 443 никто не отвечает
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(addresses[0], 443))
+        transport.sendto(b"\xc0" + os.urandom(1199))
+        await asyncio.sleep(quic_wait)
+        transport.close()
+        quic_stall = quic_wait
+
+    context = ssl.create_default_context()
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(addresses[0], 443, ssl=context, server_hostname=domain), timeout
+    )
+    writer.write(f"GET / HTTP/1.1\r\nHost: {domain}\r\nConnection: close\r\n\r\n".encode("ascii"))
+    await writer.drain()
+    await asyncio.wait_for(reader.read(1), timeout)
+    ttfb = time.monotonic() - started
+    writer.close()
+
+    return {
+        "dns": dns_done - started,
+        "ttfb": ttfb,
+        "quic_stall": quic_stall,
+        "aaaa": [r.data for r in aaaa if r.qtype == dns_wire.QTYPES["AAAA"]],
+        "alpn": alpn,
+    }
+
+
+def set_policy(args, ipv6_policy: str, https_policy: str):
+    response = requests.put(
+        f"{args.admin_url}/api/categories/{args.category}",
+        json={"ipv6_policy": ipv6_policy, "https_policy": https_policy},
+        auth=tuple(args.auth.split(":", 1)), timeout=60, verify=False
+    )
+    response.raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTFB при разных политиках AAAA/HTTPS RR")
+    parser.add_argument("--server", required=True, help="IP нашего DNS сервера")
+    parser.add_argument("--admin-url", required=True)
+    parser.add_argument("--auth", required=True, help="логин:пароль админки")
+    parser.add_argument("--domain", required=True, help="Перехваченный домен без собственных политик")
+    parser.add_argument("--category", required=True, help="Категория домена")
+    parser.add_argument("--policies", default=",".join(POLICIES), help="Список ipv6/https через запятую")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--quic-wait", type=float, default=0.3, help="Сколько клиент ждет QUIC до отката на TCP")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    print("🧪 Ninja DNS - TTFB при разных политиках AAAA/HTTPS RR")
+    print("=" * 70)
+
+    for policy in args.policies.split(","):
+        ipv6_policy, https_policy = policy.split("/")
+        set_policy(args, ipv6_policy, https_policy)
+
+        runs = []
+        for _ in range(args.runs):
+            try:
+                runs.append(asyncio.run(fetch_once(args.server, args.domain, args.quic_wait, args.timeout)))
+            except (OSError, RuntimeError, asyncio.TimeoutError) as e:
+                print(f"  ⚠️  {policy}: {e}")
+
+        if not runs:
+            continue
+        ttfb = latency_summary([r["ttfb"] for r in runs])
+        dns = latency_summary([r["dns"] for r in runs])
+        bypass = "да" if any(r["aaaa"] for r in runs) else "нет"
+        print(f"  {policy:<24} TTFB p50 {ttfb['p50_ms']:>8}ms p95 {ttfb['p95_ms']:>8}ms | DNS p50 {dns['p50_ms']:>7}ms | "
+              f"ALPN {runs[0]['alpn'] or '-'} | AAAA (обход прокси по IPv6): {bypass}")
+
+
+if __name__ == "__main__":
+    main()
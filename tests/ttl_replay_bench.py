@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Локальная симуляция повтора запросов: QPS на наш DNS при разных TTL перехваченных ответов
+
+Клиентские стабы кэшируют ответ на TTL (с ограничением --client-max-ttl), к серверу доходят
+только промахи. Поток обращений - синтетический (пуассоновский, популярность по Ципфу)
+или из файла с строками "<секунды> <клиент> <имя>".
+
+    python ttl_replay_bench.py --ttls 600,3600,86400
+    python ttl_replay_bench.py --trace lookups.txt --ttls 600,21600
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+
+def load_names(args) -> List[str]:
+    """Перехваченные имена из domains.json; без него - синтетический список"""
+    try:
+        with open(args.domains_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [d["name"] for d in data.get("domains", []) if d.get("enabled", True)]
+    except OSError:
+        return [f"site{i}.example" for i in range(args.synthetic_names)]
+
+
+def synthetic_trace(names: List[str], clients: int, duration: float, rate: float,
+                    zipf: float, seed: int) -> Dict[int, List[Tuple[float, str]]]:
+    """Обращения приложений к именам по клиентам, в порядке времени"""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) ** zipf for rank in range(len(names))]
+    trace = {}
+    for client in range(clients):
+        events, now = [], 0.0
+        while True:
+            now += rng.expovariate(rate)
+            if now >= duration:
+                break
+            events.append(now)
+        trace[client] = list(zip(events, rng.choices(names, weights=weights, k=len(events))))
+    return trace
+
+
+def file_trace(path: str) -> Tuple[Dict[str, List[Tuple[float, str]]], float]:
+    trace = defaultdict(list)
+    first, last = None, 0.0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 3 or line.startswith("#"):
+                continue
+            ts = float(parts[0])
+            trace[parts[1]].append((ts, parts[2].rstrip(".").lower()))
+            first = ts if first is None else min(first, ts)
+            last = max(last, ts)
+    for events in trace.values():
+        events.sort()
+    return trace, (last - first) if first is not None else 0.0
+
+
+def replay(trace: Dict, ttl_for: Dict[str, int], default_ttl: int, client_max_ttl: int) -> int:
+    """Число запросов, дошедших до сервера (промахи клиентских кэшей)"""
+    misses = 0
+    for events in trace.values():
+        expires: Dict[str, float] = {}
+        for ts, name in events:
+            if expires.get(name, -1.0) > ts:
+                continue
+            misses += 1
+            expires[name] = ts + min(ttl_for.get(name, default_ttl), client_max_ttl)
+    return misses
+
+
+def scenarios(ttls: Iterable[int], hijacked: List[str]):
+    for ttl in ttls:
+        yield ttl, {name: ttl for name in hijacked}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QPS на DNS при разных TTL перехваченных ответов")
+    parser.add_argument("--domains-file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "domains.json"))
+    parser.add_argument("--synthetic-names", type=int, default=150, help="Размер списка без domains.json")
+    parser.add_argument("--trace", help="Файл обращений: '<секунды> <клиент> <имя>' в строке")
+    parser.add_argument("--ttls", default="600,3600,21600,86400", help="TTL перехваченных ответов; первый - базовый")
+    parser.add_argument("--other-ttl", type=int, default=600, help="TTL для имен вне списка")
+    parser.add_argument("--client-max-ttl", type=int, default=86400, help="Верхняя граница TTL в клиентских кэшах")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--hours", type=float, default=4.0)
+    parser.add_argument("--rate", type=float, default=0.02, help="Обращений в секунду на клиента")
+    parser.add_argument("--zipf", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    hijacked = load_names(args)
+    if args.trace:
+        trace, duration = file_trace(args.trace)
+    else:
+        duration = args.hours * 3600
+        trace = synthetic_trace(hijacked, args.clients, duration, args.rate, args.zipf, args.seed)
+    lookups = sum(len(events) for events in trace.values())
+
+    print("🧪 Ninja DNS - QPS при разных TTL перехваченных ответов")
+    print("=" * 70)
+    print(f"ℹ️  Клиентов: {len(trace)}, обращений: {lookups}, длительность: {duration / 3600:.1f} ч, "
+          f"имен в списке: {len(hijacked)}")
+    if not lookups or duration <= 0:
+        print("❌ Пустой поток обращений")
+        sys.exit(1)
+
+    baseline = None
+    for ttl, ttl_for in scenarios([int(t) for t in args.ttls.split(",")], hijacked):
+        misses = replay(trace, ttl_for, args.other_ttl, args.client_max_ttl)
+        baseline = baseline or misses
+        print(f"  TTL {ttl:>6}s  запросов к серверу {misses:>8}  QPS {misses / duration:>8.3f}  "
+              f"доля от обращений {misses / lookups:>6.1%}  относительно базового {misses / baseline - 1:>+7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Поведение SmartDNS при деградации апстримов: fallback, serve-expired, prefetch
+
+Конфиг берется из генератора админки: server-tls апстрим (DoT стенд), группа
+fallback (UDP/TCP стенд), serve-expired и prefetch-domain как в продакшене;
+переписываются только адреса bind, пути кэша и логов. Для каждого сценария
+SmartDNS запускается заново, стендам задаются сбои (standin_dns.set_faults),
+и открытым циклом (dns_load_bench.run_step) замеряются доступность и p99 у клиента.
+
+В сценарии serve_expired TTL в конфиге сокращены до 2 секунд: записи в кэше
+должны успеть истечь до отказа обоих апстримов.
+
+Нужен SmartDNS: --smartdns-bin или docker (образ pymumu/smartdns, сеть хоста).
+
+    python upstream_fault_test.py --smartdns-bin /usr/sbin/smartdns
+    python upstream_fault_test.py --scenarios primary_slow,serve_expired --rate 300 --json faults.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, NamedTuple
+
+from config_scaling_bench import load_generator
+from dns_load_bench import HIT_NAMES, NameMix, UDPChannel, parse_mix, prewarm, run_step
+from standin_dns import FAULT_DEFAULTS, StandinResolver, self_signed_context
+
+from app import dns_wire  # noqa: E402  (путь к admin добавлен config_scaling_bench)
+
+SERVER_IP = "10.0.0.1"
+HIJACKED = ["chatgpt.com", "claude.ai", "netflix.com"]
+SHORT_TTL = 2
+
+
+class Scenario(NamedTuple):
+    name: str
+    description: str
+    primary: dict
+    fallback: dict
+    mix: str
+    min_availability: float
+    max_p99_ms: float
+    expire_cache: bool = False
+
+
+SCENARIOS = [
+    Scenario("baseline", "Без сбоев", {}, {}, "hijacked=20,hit=40,miss=40", 0.999, 100),
+    Scenario("primary_slow", "DoT апстрим отвечает за 500ms", {"delay": 0.5}, {},
+             "hijacked=20,hit=40,miss=40", 0.99, 600),
+    Scenario("primary_jitter", "DoT апстрим 50-450ms", {"delay": 0.05, "jitter": 0.4}, {},
+             "hijacked=20,hit=40,miss=40", 0.99, 500),
+    Scenario("primary_lossy", "DoT апстрим теряет 30% запросов", {"loss": 0.3}, {},
+             "hijacked=20,hit=40,miss=40", 0.99, 600),
+    Scenario("primary_servfail", "DoT апстрим отвечает SERVFAIL", {"servfail": 1.0}, {},
+             "hijacked=20,hit=40,miss=40", 0.99, 300),
+    Scenario("primary_down", "DoT апстрим не принимает соединения", {"tcp_down": True}, {},
+             "hijacked=20,hit=40,miss=40", 0.99, 300),
+    Scenario("fallback_truncated", "DoT недоступен, UDP fallback отвечает TC", {"tcp_down": True}, {"truncate": 1.0},
+             "hijacked=20,hit=40,miss=40", 0.99, 500),
+    Scenario("serve_expired", "Оба апстрима молчат, записи в кэше истекли",
+             {"tcp_down": True, "loss": 1.0}, {"loss": 1.0, "tcp_down": True},
+             "hijacked=20,hit=80", 0.99, 50, expire_cache=True),
+]
+
+
+def render_config(main, port: int, work_dir: str, upstreams: List[str], short_ttl: bool) -> str:
+    """Конфиг генератора с апстримами-стендами, локальным bind и временными путями"""
+    main.upstream_manager = main.UpstreamManager(os.path.join(work_dir, "upstreams.json"), candidates=upstreams)
+    domains_data = {
+        "server_ip": SERVER_IP,
+        "domains": [{"name": name, "category": "misc", "enabled": True} for name in HIJACKED],
+    }
+    config = main.domain_manager.generate_smartdns_config(domains_data)
+    # Клиентский bind на локальный порт; view для sniproxy и DoT/DoH здесь не нужны
+    lines = []
+    for line in config.splitlines():
+        if line == "bind :53":
+            line = f"bind 127.0.0.1:{port}"
+        elif line == "bind-tcp :53":
+            line = f"bind-tcp 127.0.0.1:{port}"
+        elif line.startswith("bind"):
+            continue
+        lines.append(line)
+    config = "\n".join(lines)
+    config = config.replace("cache-persist yes", "cache-persist no")
+    config = config.replace("/var/cache/smartdns.cache", os.path.join(work_dir, "smartdns.cache"))
+    config = config.replace("/var/log/smartdns/", work_dir + "/")
+    if short_ttl:
+        config = re.sub(r"(?m)^rr-ttl(-min|-max)? \d+$", lambda m: f"rr-ttl{m.group(1) or ''} {SHORT_TTL}", config)
+    return config
+
+
+def start_smartdns(args, config_file: str, work_dir: str):
+    if args.smartdns_bin:
+        return subprocess.Popen([args.smartdns_bin, "-f", "-x", "-c", config_file],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return subprocess.Popen(
+        ["docker", "run", "--rm", "--network", "host", "--name", f"ninja-dns-fault-test-{os.getpid()}",
+         "-v", f"{work_dir}:{work_dir}", "--entrypoint", "smartdns", args.image, "-f", "-x", "-c", config_file],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def stop_smartdns(args, process):
+    if not args.smartdns_bin:
+        subprocess.run(["docker", "stop", f"ninja-dns-fault-test-{os.getpid()}"], capture_output=True)
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def wait_answering(port: int, timeout: float = 30):
+    """SmartDNS поднят, когда отвечает на перехваченное имя"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await dns_wire.query_udp("127.0.0.1", port, dns_wire.build_query(HIJACKED[0]), timeout=0.5)
+            return
+        except (asyncio.TimeoutError, OSError):
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"SmartDNS did not answer on port {port} within {timeout}s")
+
+
+async def run_scenario(args, main, scenario: Scenario, primary: StandinResolver, fallback: StandinResolver,
+                       upstreams: List[str], work_dir: str) -> dict:
+    port = args.port
+    config_file = os.path.join(work_dir, f"{scenario.name}.conf")
+    with open(config_file, "w", encoding="utf-8") as f:
+        f.write(render_config(main, port, work_dir, upstreams, scenario.expire_cache))
+
+    process = start_smartdns(args, config_file, work_dir)
+    channel = UDPChannel("127.0.0.1", port, args.sockets)
+    try:
+        await wait_answering(port)
+        await channel.open()
+        await prewarm(channel, HIT_NAMES, args.timeout)
+        if scenario.expire_cache:
+            await asyncio.sleep(SHORT_TTL + 1)
+
+        primary.set_faults(**scenario.primary)
+        fallback.set_faults(**scenario.fallback)
+        mix = NameMix(parse_mix(scenario.mix), HIJACKED, HIT_NAMES, "example.com", seed=1)
+        step = await run_step(channel, mix, args.rate, args.duration, True, args.timeout, args.max_inflight, SERVER_IP)
+    finally:
+        primary.set_faults(**FAULT_DEFAULTS)
+        fallback.set_faults(**FAULT_DEFAULTS)
+        await channel.close()
+        stop_smartdns(args, process)
+
+    availability = step["ok"] / step["sent"] if step["sent"] else 0.0
+    max_p99 = args.max_p99.get(scenario.name, scenario.max_p99_ms)
+    return {
+        "scenario": scenario.name,
+        "description": scenario.description,
+        "availability": round(availability, 5),
+        "min_availability": scenario.min_availability,
+        "max_p99_ms": max_p99,
+        "passed": availability >= scenario.min_availability and step["p99_ms"] <= max_p99,
+        "step": step,
+        "upstream_stats": {"primary": dict(primary.stats), "fallback": dict(fallback.stats)},
+    }
+
+
+async def run(args, main) -> List[dict]:
+    work_dir = tempfile.mkdtemp(prefix="ninja-dns-faults-")
+    os.chmod(work_dir, 0o755)
+    primary = StandinResolver(answer_ip="127.0.0.1", ttl=args.upstream_ttl, seed=1)
+    fallback = StandinResolver(answer_ip="127.0.0.1", ttl=args.upstream_ttl, seed=2)
+    dot_port = await primary.start_tcp(tls=self_signed_context("dot.standin.local"))
+    udp_port = await fallback.start_udp()
+    # TCP на том же порту: после усеченного UDP ответа клиент повторяет запрос по TCP
+    await fallback.start_tcp(udp_port)
+    upstreams = [f"tls://127.0.0.1:{dot_port}", f"udp://127.0.0.1:{udp_port}"]
+
+    results = []
+    try:
+        for scenario in SCENARIOS:
+            if args.scenarios and scenario.name not in args.scenarios:
+                continue
+            for resolver in (primary, fallback):
+                resolver.stats = dict.fromkeys(resolver.stats, 0)
+            result = await run_scenario(args, main, scenario, primary, fallback, upstreams, work_dir)
+            results.append(result)
+            step = result["step"]
+            print(f"  {'✅' if result['passed'] else '❌'} {scenario.name:<20} доступность {result['availability']:.2%} "
+                  f"(мин {scenario.min_availability:.1%})  p99 {step['p99_ms']}ms (макс {result['max_p99_ms']}ms)  "
+                  f"таймауты {step['timeouts']}  SERVFAIL/ошибки {step['rcode_errors']}")
+            print(f"     {scenario.description}; апстримы: DoT {result['upstream_stats']['primary']}, "
+                  f"UDP {result['upstream_stats']['fallback']}")
+    finally:
+        primary.close()
+        fallback.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartDNS при деградации апстримов")
+    parser.add_argument("--smartdns-bin", help="Локальный smartdns вместо docker")
+    parser.add_argument("--image", default="pymumu/smartdns:latest")
+    parser.add_argument("--port", type=int, default=5353, help="Порт SmartDNS на 127.0.0.1")
+    parser.add_argument("--scenarios", help="Только эти сценарии, через запятую")
+    parser.add_argument("--rate", type=float, default=200, help="Запросов в секунду")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность сценария, с")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Таймаут клиента: дольше - недоступность")
+    parser.add_argument("--upstream-ttl", type=int, default=300, help="TTL ответов стендов")
+    parser.add_argument("--sockets", type=int, default=4)
+    parser.add_argument("--max-inflight", type=int, default=5000)
+    parser.add_argument("--max-p99", action="append", default=[], help="Порог p99 сценария: имя=мс")
+    parser.add_argument("--json", help="Сохранить результаты в файл")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios.split(",") if args.scenarios else None
+    args.max_p99 = {name: float(ms) for name, ms in (item.split("=", 1) for item in args.max_p99)}
+
+    if not args.smartdns_bin and not shutil.which("docker"):
+        print("❌ Нужен --smartdns-bin или docker")
+        sys.exit(2)
+
+    print("🧪 Ninja DNS - SmartDNS при деградации апстримов")
+    print("=" * 70)
+    load_generator(tempfile.mkdtemp(prefix="ninja-dns-faults-data-"))
+    from app import main as admin_main
+
+    results = asyncio.run(run(args, admin_main))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"started": time.time(), "rate": args.rate, "duration": args.duration, "results": results},
+                      f, indent=2)
+
+    failed = [r["scenario"] for r in results if not r["passed"]]
+    print(f"\n{'✅ Все сценарии прошли' if not failed else '❌ Провалены: ' + ', '.join(failed)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Тест выбора апстримов по задержке на локальных стендах DoT/UDP
+Быстрые и медленные резолверы с внесенной задержкой и потерями;
+менеджер должен выбрать быстрые и отдать их в конфиг SmartDNS.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+from standin_dns import StandinResolver, self_signed_context
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "admin"))
+
+from app.upstreams import UpstreamManager  # noqa: E402
+
+
+async def run_probe():
+    tls = self_signed_context()
+    fast = StandinResolver(delay=0.0)
+    slow = StandinResolver(delay=0.06)
+    lossy = StandinResolver(delay=0.0, loss_every=2)
+
+    ports = {
+        "udp_fast": await fast.start_udp(),
+        "udp_slow": await slow.start_udp(),
+        "udp_lossy": await lossy.start_udp(),
+        "tls_fast": await fast.start_tcp(tls=tls),
+        "tls_slow": await slow.start_tcp(tls=tls),
+    }
+    candidates = {
+        "udp_fast": f"udp://127.0.0.1:{ports['udp_fast']}",
+        "udp_slow": f"udp://127.0.0.1:{ports['udp_slow']}",
+        "udp_lossy": f"udp://127.0.0.1:{ports['udp_lossy']}",
+        "tls_fast": f"tls://127.0.0.1:{ports['tls_fast']}",
+        "tls_slow": f"tls://127.0.0.1:{ports['tls_slow']}",
+    }
+
+    state_file = os.path.join(tempfile.mkdtemp(prefix="ninja-dns-upstreams-"), "upstreams.json")
+    manager = UpstreamManager(state_file, candidates=list(candidates.values()), best_n=1, best_n_fallback=1,
+                              queries=6, timeout=0.3)
+    try:
+        state = await manager.probe_all()
+    finally:
+        for resolver in (fast, slow, lossy):
+            resolver.close()
+    return candidates, manager, state
+
+
+def main():
+    print("🧪 Ninja DNS - Выбор апстримов по задержке")
+    print("=" * 50)
+
+    candidates, manager, state = asyncio.run(run_probe())
+    for m in state["measurements"]:
+        print(f"ℹ️  {m['url']:<28} handshake {m.get('handshake_ms')}ms  query {m.get('query_ms')}ms  "
+              f"loss {m['loss']}  score {m['score_ms']}")
+
+    checks = [
+        (state["selected"]["upstream"] == [candidates["tls_fast"]], "выбран быстрый DoT апстрим"),
+        (state["selected"]["fallback"] == [candidates["udp_fast"]], "выбран быстрый UDP fallback"),
+        (next(m for m in state["measurements"] if m["url"] == candidates["udp_lossy"])["loss"] >= 0.5,
+         "потери lossy апстрима замечены"),
+        (manager.server_lines() == [f"server-tls 127.0.0.1:{candidates['tls_fast'].rsplit(':', 1)[1]} -group upstream",
+                                    f"server 127.0.0.1:{candidates['udp_fast'].rsplit(':', 1)[1]} -group fallback"],
+         "в конфиг попадают только выбранные апстримы"),
+    ]
+
+    success = True
+    for ok, description in checks:
+        print(f"{'✅' if ok else '❌'} {description}")
+        success = success and ok
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
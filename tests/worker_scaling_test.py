@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест масштабирования админки по числу воркеров
+Запускает uvicorn с 1, 2, 4... воркерами и нагружает публичные эндпоинты
+из нескольких клиентских процессов. Показывает RPS и эффективность масштабирования.
+
+Использование:
+    python worker_scaling_test.py [--workers 1,2,4] [--duration 10] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+from bench_utils import AdminServer, HTTPConnection, latency_summary
+
+PUBLIC_PATHS = ["/", "/download", "/healthz"]
+
+
+async def _client_loop(port: int, paths, duration: float, concurrency: int):
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = 0
+
+    async def worker(offset: int):
+        nonlocal errors
+        conn = HTTPConnection("127.0.0.1", port)
+        i = offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.monotonic()
+            try:
+                status, _, _ = await conn.request("GET", path)
+                if status >= 500:
+                    errors += 1
+                else:
+                    latencies.append(time.monotonic() - started)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                await conn.close()
+        await conn.close()
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latencies, errors
+
+
+def run_client(args):
+    """Один клиентский процесс со своим event loop"""
+    port, paths, duration, concurrency = args
+    return asyncio.run(_client_loop(port, paths, duration, concurrency))
+
+
+def measure(workers: int, duration: float, concurrency: int, client_processes: int) -> dict:
+    with AdminServer(workers=workers) as server:
+        # Прогрев: шаблоны и импорты в каждом воркере
+        run_client((server.port, PUBLIC_PATHS, 1.0, 8))
+
+        per_process = max(1, concurrency // client_processes)
+        with multiprocessing.Pool(client_processes) as pool:
+            results = pool.map(
+                run_client,
+                [(server.port, PUBLIC_PATHS, duration, per_process)] * client_processes
+            )
+
+    latencies = [latency for chunk, _ in results for latency in chunk]
+    errors = sum(err for _, err in results)
+    result = {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / duration, 1),
+    }
+    result.update(latency_summary(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование админки по воркерам")
+    parser.add_argument("--workers", default="1,2,4", help="Список чисел воркеров через запятую")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность замера, с")
+    parser.add_argument("--concurrency", type=int, default=64, help="Одновременных соединений")
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Число клиентских процессов")
+    parser.add_argument("--min-efficiency", type=float, default=0.7,
+                        help="Минимальная эффективность масштабирования (RPS_N / (N * RPS_1))")
+    args = parser.parse_args()
+
+    print("🧪 Ninja DNS - Масштабирование админки по воркерам")
+    print("=" * 70)
+
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    if max(worker_counts) + args.clients > (os.cpu_count() or 1):
+        print(f"⚠️  CPU: {os.cpu_count()}, воркеры и клиенты будут конкурировать за ядра")
+
+    results = []
+    for workers in worker_counts:
+        result = measure(workers, args.duration, args.concurrency, args.clients)
+        results.append(result)
+        print(f"  воркеров: {workers:>2}  RPS: {result['rps']:>9}  p50: {result['p50_ms']:>7}ms  "
+              f"p99: {result['p99_ms']:>7}ms  ошибок: {result['errors']}")
+
+    base = results[0]["rps"] / results[0]["workers"]
+    success = True
+    print("\n📊 Эффективность масштабирования:")
+    for result in results:
+        efficiency = result["rps"] / (result["workers"] * base) if base else 0
+        ok = efficiency >= args.min_efficiency
+        success = success and ok and result["errors"] == 0
+        print(f"  {'✅' if ok else '❌'} {result['workers']} воркер(ов): {efficiency:.2f}")
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()